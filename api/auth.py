@@ -3,10 +3,15 @@ from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from datetime import datetime, timedelta
-import boto3
 from botocore.exceptions import ClientError
+from collections import OrderedDict
+from functools import lru_cache
+from api.metrics import span
 import json
 import logging
+import os
+import threading
+import time
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -17,33 +22,184 @@ SECRET_KEY = "my-temporary-secret-key-12345"  # Replace with a secure key in pro
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+# Cache settings
+USER_CACHE_TTL_SECONDS = int(os.getenv("STOCKIQ_USER_CACHE_TTL", "300"))  # How long the user directory is fresh
+USER_CACHE_REFRESH_AHEAD = 0.8  # Refresh in the background after this fraction of the TTL
+USER_CACHE_MAX_STALE_SECONDS = int(os.getenv("STOCKIQ_USER_CACHE_MAX_STALE", "3600"))  # Serve stale data this long if Secrets Manager fails
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv("STOCKIQ_TOKEN_CACHE_TTL", "60"))
+TOKEN_CACHE_SIZE = int(os.getenv("STOCKIQ_TOKEN_CACHE_SIZE", "10000"))
+
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 # OAuth2 scheme
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/token")
 
-# AWS Secrets Manager client
-secrets_client = boto3.client("secretsmanager")
+@lru_cache(maxsize=1)
+def secrets_client():
+    """The AWS Secrets Manager client, created on first use.
+
+    boto3 and its client take a noticeable part of a second to load, which
+    endpoints that never touch Secrets Manager should not pay at startup.
+    """
+    import boto3
+
+    return boto3.client("secretsmanager")
 
 # User model
 class User:
-    def __init__(self, username: str, hashed_password: str):
+    def __init__(self, username: str, hashed_password: str, is_admin: bool = False):
         self.username = username
         self.hashed_password = hashed_password
+        self.is_admin = is_admin
+
+class UserDirectoryCache:
+    """In-process copy of the stockiq-users secret.
+
+    The copy is fresh for ttl seconds and is revalidated in the background
+    once it passes the refresh-ahead point. After expiry the stale copy is
+    still served (while revalidating) for up to max_stale seconds, which
+    also covers Secrets Manager outages; only an empty or fully expired
+    cache loads synchronously.
+    """
+
+    def __init__(self, loader, ttl: int = USER_CACHE_TTL_SECONDS, max_stale: int = USER_CACHE_MAX_STALE_SECONDS):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self._users = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._stats = {"hits": 0, "misses": 0, "stale_hits": 0, "refreshes": 0, "refresh_errors": 0}
+
+    def _load(self):
+        users = self.loader()
+        with self._lock:
+            self._users = users
+            self._loaded_at = time.monotonic()
+            self._stats["refreshes"] += 1
+        return users
+
+    def _refresh_in_background(self):
+        try:
+            self._load()
+        except Exception as e:
+            # Keep serving the cached copy; an uncaught error would only end this thread
+            logger.exception(f"Background refresh of user directory failed: {str(e)}")
+            with self._lock:
+                self._stats["refresh_errors"] += 1
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def get_users(self) -> dict:
+        with self._lock:
+            users = self._users
+            age = time.monotonic() - self._loaded_at
+            if users is not None and age < self.ttl + self.max_stale:
+                if age < self.ttl:
+                    self._stats["hits"] += 1
+                else:
+                    self._stats["stale_hits"] += 1
+                # Revalidate in the background while serving the cached copy
+                if age > self.ttl * USER_CACHE_REFRESH_AHEAD and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh_in_background, daemon=True).start()
+                return users
+            self._stats["misses"] += 1
+        try:
+            return self._load()
+        except Exception:
+            with self._lock:
+                self._stats["refresh_errors"] += 1
+            raise
+
+    def invalidate(self):
+        with self._lock:
+            self._users = None
+            self._loaded_at = 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self._stats["hits"] + self._stats["stale_hits"]
+            lookups = hits + self._stats["misses"]
+            return dict(self._stats, hit_rate=round(hits / lookups, 4) if lookups else 0.0)
+
+
+class TokenCache:
+    """Bounded LRU of already-decoded JWTs: token -> (username, expires_at)."""
+
+    def __init__(self, ttl: int = TOKEN_CACHE_TTL_SECONDS, max_size: int = TOKEN_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._tokens = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0}
+
+    def get(self, token: str):
+        now = time.time()
+        with self._lock:
+            entry = self._tokens.get(token)
+            if entry is not None and entry[1] > now:
+                self._tokens.move_to_end(token)
+                self._stats["hits"] += 1
+                return entry[0]
+            if entry is not None:
+                del self._tokens[token]
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, token: str, username: str, token_expires_at: float):
+        # Never cache a token past its own exp claim
+        expires_at = min(time.time() + self.ttl, token_expires_at)
+        with self._lock:
+            self._tokens[token] = (username, expires_at)
+            self._tokens.move_to_end(token)
+            while len(self._tokens) > self.max_size:
+                self._tokens.popitem(last=False)
+
+    def invalidate_user(self, username: str):
+        with self._lock:
+            for token in [token for token, entry in self._tokens.items() if entry[0] == username]:
+                del self._tokens[token]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return dict(self._stats, size=len(self._tokens), hit_rate=round(self._stats["hits"] / lookups, 4) if lookups else 0.0)
+
+
+def _load_users() -> dict:
+    response = secrets_client().get_secret_value(SecretId="stockiq-users")
+    return json.loads(response["SecretString"])
+
+user_directory = UserDirectoryCache(_load_users)
+token_cache = TokenCache()
 
 def get_user(username: str):
     try:
-        response = secrets_client.get_secret_value(SecretId="stockiq-users")
-        users = json.loads(response["SecretString"])
+        users = user_directory.get_users()
         user_data = users.get(username)
         if user_data:
-            return User(username=username, hashed_password=user_data["hashed_password"])
+            return User(username=username, hashed_password=user_data["hashed_password"], is_admin=bool(user_data.get("admin", False)))
         return None
     except ClientError as e:
         logger.error(f"Error retrieving user from Secrets Manager: {str(e)}")
         return None
 
+def revoke_user(username: str):
+    """Drop cached tokens for a user and reload the directory, e.g. after removing them from the secret.
+
+    Called by the POST /auth/users/{username}/revoke admin endpoint.
+    """
+    token_cache.invalidate_user(username)
+    user_directory.invalidate()
+    logger.info(f"Invalidated cached credentials for user: {username}")
+
+def auth_cache_stats() -> dict:
+    return {"user_directory": user_directory.stats(), "tokens": token_cache.stats()}
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -60,14 +216,28 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
+    # Reuse the decoded token while it is cached
+    username = token_cache.get(token)
+    if username is None:
+        try:
+            with span("auth_token_decode"):
+                payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+            username: str = payload.get("sub")
+            if username is None:
+                raise credentials_exception
+        except JWTError:
             raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    user = get_user(username)
+        token_cache.put(token, username, payload.get("exp", time.time()))
+    with span("auth_user_lookup"):
+        user = get_user(username)
     if user is None:
+        token_cache.invalidate_user(username)
         raise credentials_exception
-    return user
\ No newline at end of file
+    return user
+
+async def get_admin_user(user: User = Depends(get_current_user)):
+    # Admins are users with "admin": true in their stockiq-users entry
+    if not user.is_admin:
+        logger.error(f"User {user.username} is not an admin")
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+    return user
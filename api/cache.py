@@ -0,0 +1,159 @@
+import os
+import pickle
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Cache settings
+CACHE_MEMORY_MB = int(os.getenv("STOCKIQ_CACHE_MEMORY_MB", "256"))
+CACHE_DISK_MB = int(os.getenv("STOCKIQ_CACHE_DISK_MB", "2048"))
+CACHE_DIR = os.getenv("STOCKIQ_CACHE_DIR", os.path.join(tempfile.gettempdir(), "stockiq-cache"))  # Empty disables the disk tier
+
+
+def hash_key(*parts) -> str:
+    """Build a content-addressed cache key from strings or bytes."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """Two-tier cache: an in-memory LRU backed by an on-disk store.
+
+    Values are pickled so both tiers are bounded by their size in bytes.
+    Keys are namespaced ("file", "product", ...) and hit/miss counters are
+    kept per namespace.
+    """
+
+    def __init__(self, memory_max_bytes: int, disk_dir: str = None, disk_max_bytes: int = 0):
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {}
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    def _count(self, namespace: str, counter: str):
+        counters = self._stats.setdefault(namespace, {"memory_hits": 0, "disk_hits": 0, "misses": 0, "puts": 0})
+        counters[counter] += 1
+
+    def _disk_path(self, namespace: str, key: str) -> str:
+        return os.path.join(self.disk_dir, namespace, key[:2], f"{key}.pkl")
+
+    def _disk_entries(self):
+        # Yield (path, size, mtime) for every file in the disk tier
+        for root, _, files in os.walk(self.disk_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def _remember(self, full_key: str, payload: bytes):
+        # Insert into the memory LRU, evicting least recently used entries
+        if len(payload) > self.memory_max_bytes:
+            return
+        if full_key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(full_key))
+        self._memory[full_key] = payload
+        self._memory_bytes += len(payload)
+        while self._memory_bytes > self.memory_max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def _evict_disk(self):
+        # Remove least recently used files until the disk tier fits again
+        if self._disk_bytes <= self.disk_max_bytes:
+            return
+        for path, size, _ in sorted(self._disk_entries(), key=lambda entry: entry[2]):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self._disk_bytes -= size
+            if self._disk_bytes <= self.disk_max_bytes:
+                break
+
+    def get(self, namespace: str, key: str):
+        full_key = f"{namespace}:{key}"
+        with self._lock:
+            payload = self._memory.get(full_key)
+            if payload is not None:
+                self._memory.move_to_end(full_key)
+                self._count(namespace, "memory_hits")
+                return pickle.loads(payload)
+        if self.disk_dir:
+            path = self._disk_path(namespace, key)
+            try:
+                with open(path, "rb") as f:
+                    payload = f.read()
+                os.utime(path)  # Refresh recency for LRU eviction
+            except FileNotFoundError:
+                payload = None
+            if payload is not None:
+                with self._lock:
+                    self._remember(full_key, payload)
+                    self._count(namespace, "disk_hits")
+                return pickle.loads(payload)
+        with self._lock:
+            self._count(namespace, "misses")
+        return None
+
+    def put(self, namespace: str, key: str, value):
+        payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._remember(f"{namespace}:{key}", payload)
+            self._count(namespace, "puts")
+        if self.disk_dir and len(payload) <= self.disk_max_bytes:
+            path = self._disk_path(namespace, key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write to a temporary file first so readers never see partial data
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, "wb") as f:
+                    f.write(payload)
+                replaced = os.path.getsize(path) if os.path.exists(path) else 0
+                os.replace(tmp_path, path)
+                with self._lock:
+                    self._disk_bytes += len(payload) - replaced
+                    self._evict_disk()
+            except OSError as e:
+                logger.error(f"Failed to write cache entry {path}: {str(e)}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            namespaces = {}
+            for namespace, counters in self._stats.items():
+                hits = counters["memory_hits"] + counters["disk_hits"]
+                lookups = hits + counters["misses"]
+                namespaces[namespace] = dict(counters, hit_rate=round(hits / lookups, 4) if lookups else 0.0)
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "memory_max_bytes": self.memory_max_bytes,
+                "disk_bytes": self._disk_bytes if self.disk_dir else 0,
+                "disk_max_bytes": self.disk_max_bytes if self.disk_dir else 0,
+                "namespaces": namespaces
+            }
+
+
+forecast_cache = ResultCache(
+    memory_max_bytes=CACHE_MEMORY_MB * 1024 * 1024,
+    disk_dir=CACHE_DIR or None,
+    disk_max_bytes=CACHE_DISK_MB * 1024 * 1024
+)
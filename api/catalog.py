@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+import pandas as pd
+from api.storage import ObjectNotFound, StorageError, storage
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Catalog settings
+CATALOG_PREFIX = "catalog/"
+CATALOG_REFRESH_SECONDS = float(os.getenv("STOCKIQ_CATALOG_REFRESH_SECONDS", "60"))  # How often other writers' entries are picked up
+RESERVATION_TIMEOUT_SECONDS = float(os.getenv("STOCKIQ_CATALOG_RESERVATION_SECONDS", "21600"))  # Unfinished uploads older than this are dropped
+INDEX_COMPACT_RECORDS = int(os.getenv("STOCKIQ_CATALOG_COMPACT_RECORDS", "100"))  # Log records read past the index before it is rewritten
+UPLOADING = "uploading"
+READY = "ready"
+
+
+def _upload_number(key: str) -> int:
+    # sales_data/2025/07/03_12.csv -> 12
+    try:
+        return int(key.rsplit("_", 1)[1].split(".", 1)[0])
+    except (IndexError, ValueError):
+        return 0
+
+
+class DatasetCatalog:
+    """Manifest of uploaded datasets kept next to the data in storage.
+
+    Every dataset has an entry object under catalog/datasets/. Upload keys
+    are allocated by creating that entry with a create-if-absent write, so
+    concurrent uploads (even from other API instances) never share a key
+    and allocation needs no listing. Completed uploads record their row
+    count, products, date range, size and content hash in the entry and
+    append it to a log of numbered records (catalog/log/N.json), again
+    with create-if-absent writes.
+
+    A snapshot of the completed entries and the log position it covers
+    (catalog/index.json) lets a fresh process load the catalog with one
+    read; refreshes then read only the log records after the last one
+    seen, ending at the first missing number, so nothing is listed. The
+    snapshot is rewritten once INDEX_COMPACT_RECORDS records were read
+    past it. Reservations of uploads that never finished (e.g. the
+    instance handling them died) are deleted once they are older than
+    RESERVATION_TIMEOUT_SECONDS; every instance lists the entries for them
+    once per timeout period, never on a refresh. This instance's own
+    uploads in progress are never expired.
+    """
+
+    def __init__(
+        self,
+        storage,
+        prefix: str = CATALOG_PREFIX,
+        refresh_seconds: float = CATALOG_REFRESH_SECONDS,
+        reservation_timeout: float = RESERVATION_TIMEOUT_SECONDS
+    ):
+        self.storage = storage
+        self.prefix = prefix
+        self.refresh_seconds = refresh_seconds
+        self.reservation_timeout = reservation_timeout
+        self._entries = {}
+        self._next_number = {}
+        self._log_position = 0  # Every log record up to this number has been applied
+        self._index_position = 0
+        self._loaded_at = None
+        self._swept_at = time.monotonic()  # The first sweep waits a full timeout period
+        self._lock = threading.Lock()
+
+    def _entry_key(self, key: str) -> str:
+        return f"{self.prefix}datasets/{key}.json"
+
+    def _index_key(self) -> str:
+        return f"{self.prefix}index.json"
+
+    def _log_key(self, number: int) -> str:
+        return f"{self.prefix}log/{number:012d}.json"
+
+    def _read_snapshot(self):
+        try:
+            snapshot = json.loads(self.storage.read(self._index_key()))
+        except ObjectNotFound:
+            snapshot = None
+        except (StorageError, ValueError) as e:
+            logger.error(f"Ignoring unreadable catalog index: {str(e)}")
+            snapshot = None
+        if isinstance(snapshot, dict):
+            self._entries.update({entry["key"]: entry for entry in snapshot["entries"]})
+            self._log_position = self._index_position = snapshot["position"]
+            return
+        # No snapshot in this format yet (new or older catalog): list the entries once and write one
+        logger.info("Building the catalog index from the dataset entries")
+        entry_prefix = f"{self.prefix}datasets/"
+        for entry_key in self.storage.list(entry_prefix):
+            try:
+                entry = json.loads(self.storage.read(entry_key))
+            except ObjectNotFound:
+                continue
+            if entry["status"] == READY:
+                self._entries[entry["key"]] = entry
+        self._save_index()
+
+    def _read_log(self) -> int:
+        # Apply the records written since the last one seen; returns how many there were
+        read = 0
+        while True:
+            try:
+                entry = json.loads(self.storage.read(self._log_key(self._log_position + 1)))
+            except ObjectNotFound:
+                return read
+            self._entries[entry["key"]] = entry
+            self._log_position += 1
+            read += 1
+
+    def _expire_reservations(self):
+        # Delete other writers' reservations that have been unfinished for longer than the timeout
+        now = datetime.now(timezone.utc)
+        for entry_key in self.storage.list(f"{self.prefix}datasets/"):
+            key = entry_key[len(f"{self.prefix}datasets/"):-len(".json")]
+            if key in self._entries:
+                # Completed, or one of this instance's uploads in progress
+                continue
+            try:
+                entry = json.loads(self.storage.read(entry_key))
+            except (ObjectNotFound, ValueError):
+                continue
+            if entry["status"] != UPLOADING:
+                continue
+            if (now - datetime.fromisoformat(entry["created_at"])).total_seconds() > self.reservation_timeout:
+                logger.warning(f"Dropping catalog reservation {key} created at {entry['created_at']}")
+                self.storage.delete(entry_key)
+
+    def _load(self):
+        if self._loaded_at is None:
+            self._read_snapshot()
+        self._read_log()
+        self._loaded_at = time.monotonic()
+        if self._loaded_at - self._swept_at > self.reservation_timeout:
+            self._swept_at = self._loaded_at
+            try:
+                self._expire_reservations()
+            except StorageError as e:
+                logger.error(f"Failed to expire catalog reservations: {str(e)}")
+        if self._log_position - self._index_position >= INDEX_COMPACT_RECORDS:
+            self._save_index()
+
+    def _ensure_loaded(self):
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_seconds:
+            self._load()
+
+    def _save_index(self):
+        # Best effort: records past the snapshot are still read from the log on the next load
+        ready = [entry for entry in self._entries.values() if entry["status"] == READY]
+        snapshot = {"position": self._log_position, "entries": ready}
+        try:
+            self.storage.put(self._index_key(), json.dumps(snapshot, sort_keys=True).encode())
+            self._index_position = self._log_position
+        except StorageError as e:
+            logger.error(f"Failed to write catalog index: {str(e)}")
+
+    def _append_log(self, entry: dict):
+        # Catch up first so the record takes the next free number after every record applied
+        while True:
+            self._read_log()
+            if self.storage.put_if_absent(self._log_key(self._log_position + 1), json.dumps(entry).encode()):
+                self._log_position += 1
+                return
+
+    def allocate_key(self, date_path: str) -> str:
+        """Reserve the next free sales_data/{date_path}_N.csv key."""
+        with self._lock:
+            self._ensure_loaded()
+            number = self._next_number.get(date_path)
+            if number is None:
+                day_prefix = f"sales_data/{date_path}_"
+                number = max((_upload_number(key) for key in self._entries if key.startswith(day_prefix)), default=0) + 1
+            reservation = {"status": UPLOADING, "created_at": datetime.now(timezone.utc).isoformat()}
+            while True:
+                key = f"sales_data/{date_path}_{number}.csv"
+                reservation["key"] = key
+                if self.storage.put_if_absent(self._entry_key(key), json.dumps(reservation).encode()):
+                    break
+                # Taken by another writer since we last loaded the catalog
+                number += 1
+            self._next_number[date_path] = number + 1
+            self._entries[key] = reservation
+            return key
+
+    def release(self, key: str):
+        """Drop the reservation of an upload that failed."""
+        with self._lock:
+            self._entries.pop(key, None)
+        try:
+            self.storage.delete(self._entry_key(key))
+        except StorageError as e:
+            logger.error(f"Failed to release catalog entry {key}: {str(e)}")
+
+    def record(self, key: str, rows: int, products, dates, size: int, content_hash: str, parquet: bool) -> dict:
+        """Mark an upload complete and store its metadata."""
+        parsed_dates = pd.to_datetime(pd.Series(sorted(dates)), errors="coerce").dropna()
+        with self._lock:
+            entry = dict(self._entries.get(key, {"created_at": datetime.now(timezone.utc).isoformat()}))
+        entry.update({
+            "key": key,
+            "status": READY,
+            "rows": rows,
+            "products": sorted(str(product) for product in products),
+            "start_date": parsed_dates.min().strftime("%Y-%m-%d") if len(parsed_dates) else None,
+            "end_date": parsed_dates.max().strftime("%Y-%m-%d") if len(parsed_dates) else None,
+            "size": size,
+            "content_hash": content_hash,
+            "parquet": parquet,
+            "completed_at": datetime.now(timezone.utc).isoformat()
+        })
+        self.storage.put(self._entry_key(key), json.dumps(entry).encode())
+        with self._lock:
+            if self._loaded_at is None:
+                self._load()
+            self._append_log(entry)
+            self._entries[key] = entry
+        return entry
+
+    def get(self, key: str):
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(key)
+        return entry if entry and entry["status"] == READY else None
+
+    def list(self, product_ids=None, start_date=None, end_date=None) -> list:
+        """Completed datasets, optionally only those that can contain the given products and dates."""
+        with self._lock:
+            self._ensure_loaded()
+            entries = [entry for entry in self._entries.values() if entry["status"] == READY]
+        wanted = {str(product) for product in product_ids} if product_ids else None
+        start = pd.Timestamp(start_date).strftime("%Y-%m-%d") if start_date is not None else None
+        end = pd.Timestamp(end_date).strftime("%Y-%m-%d") if end_date is not None else None
+        matches = []
+        for entry in entries:
+            if wanted is not None and wanted.isdisjoint(entry["products"]):
+                continue
+            if start is not None and entry["end_date"] is not None and entry["end_date"] < start:
+                continue
+            if end is not None and entry["start_date"] is not None and entry["start_date"] > end:
+                continue
+            matches.append(entry)
+        return sorted(matches, key=lambda entry: (entry["key"].rsplit("_", 1)[0], _upload_number(entry["key"])))
+
+
+dataset_catalog = DatasetCatalog(storage)
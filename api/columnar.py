@@ -0,0 +1,353 @@
+import io
+import os
+import csv
+import logging
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+from api.metrics import span
+from api.storage import ObjectNotFound
+from utils.preprocess import DATE_FORMAT, REQUIRED_COLUMNS, strip_product_ids
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Parquet settings; columns beyond these are kept as text
+SALES_SCHEMA = pa.schema([
+    ("date", pa.date32()),
+    ("product_id", pa.dictionary(pa.int32(), pa.string())),
+    ("quantity", pa.int64())
+])
+SALES_COLUMNS = SALES_SCHEMA.names
+COPY_METADATA = {b"stockiq.columns": b"all"}  # Marks copies that keep every CSV column; older copies only hold SALES_COLUMNS
+PARQUET_BATCH_BYTES = int(os.getenv("STOCKIQ_PARQUET_BATCH_BYTES", str(16 * 1024 * 1024)))  # CSV bytes per row group
+PARQUET_COMPRESSION = os.getenv("STOCKIQ_PARQUET_COMPRESSION", "zstd")
+READ_BATCH_ROWS = int(os.getenv("STOCKIQ_READ_BATCH_ROWS", "65536"))  # Rows per streamed batch
+
+
+def parquet_key(csv_key: str) -> str:
+    """Parquet copy of an uploaded CSV, stored next to it (sales_data/2025/07/03_1.parquet)."""
+    return csv_key[:-len(".csv")] + ".parquet" if csv_key.endswith(".csv") else f"{csv_key}.parquet"
+
+
+def _csv_names(header: bytes) -> list:
+    return [name.strip() for name in next(csv.reader([header.decode("utf-8-sig").rstrip("\r\n")]), [])]
+
+
+def read_copy_table(data: bytes, names: list) -> pa.Table:
+    """Parse CSV lines (no header) into the Parquet copy's types; raises ValueError if they do not fit.
+
+    Every column is kept in file order. The sales columns are typed as in
+    SALES_SCHEMA, but only when that loses nothing: quantities must be whole
+    numbers and dates plain DATE_FORMAT dates (no times), so the copy reads
+    back exactly as the CSV. Product IDs are stripped of surrounding
+    whitespace like everywhere else; other columns are kept as text.
+    """
+    if len(set(names)) != len(names) or any(col not in names for col in REQUIRED_COLUMNS):
+        raise ValueError("header does not name every sales column exactly once")
+    column_types = {name: pa.string() for name in names}
+    column_types["quantity"] = pa.float64()
+    # pyarrow's ArrowInvalid (a ValueError) covers rows with the wrong field count or a non-numeric quantity
+    table = pa_csv.read_csv(
+        pa.py_buffer(data),
+        read_options=pa_csv.ReadOptions(column_names=names),
+        parse_options=pa_csv.ParseOptions(newlines_in_values=b'"' in data),
+        convert_options=pa_csv.ConvertOptions(column_types=column_types, strings_can_be_null=True)
+    )
+    if any(table[col].null_count for col in REQUIRED_COLUMNS):
+        raise ValueError("missing values in the sales columns")
+    quantity = table["quantity"]
+    if pc.all(pc.equal(quantity, pc.round(quantity))).as_py() is False:
+        raise ValueError("quantity column is not integral")
+    dates = pc.strptime(table["date"], format=DATE_FORMAT, unit="s", error_is_null=True)
+    if dates.null_count or not pc.all(pc.equal(pc.strftime(dates, format=DATE_FORMAT), table["date"])).as_py():
+        raise ValueError(f"dates are not all plain {DATE_FORMAT} dates")
+    typed = {
+        "date": pc.cast(dates, pa.date32()),
+        "product_id": pc.cast(strip_product_ids(table["product_id"]), SALES_SCHEMA.field("product_id").type),
+        "quantity": pc.cast(quantity, pa.int64())
+    }
+    columns = [typed.get(name, table[name]) for name in names]
+    return pa.Table.from_arrays(columns, names=names).replace_schema_metadata(COPY_METADATA)
+
+
+def read_csv_frame(source, **kwargs) -> pd.DataFrame:
+    """pandas.read_csv with the columns and values of the Parquet copy.
+
+    Column names and product IDs are stripped of surrounding whitespace,
+    quantities are numeric and everything else is text.
+    """
+    df_or_reader = pd.read_csv(source, dtype=str, **kwargs)
+    if isinstance(df_or_reader, pd.DataFrame):
+        return _csv_frame_types(df_or_reader)
+    return (_csv_frame_types(chunk) for chunk in df_or_reader)
+
+
+def _csv_frame_types(df: pd.DataFrame) -> pd.DataFrame:
+    df.columns = [name.strip() for name in df.columns]
+    if "quantity" in df.columns:
+        df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce")
+    if "product_id" in df.columns:
+        df["product_id"] = df["product_id"].str.strip()
+    return df
+
+
+def frame_from_table(table: pa.Table) -> pd.DataFrame:
+    # Dates come back as datetime64, product_id as a categorical
+    df = table.to_pandas(date_as_object=False)
+    if "date" in df.columns:
+        df["date"] = df["date"].astype("datetime64[ns]")
+    return df
+
+
+class CsvToParquetConverter:
+    """Convert streamed CSV lines into a Parquet file on local disk.
+
+    Complete CSV lines are buffered until PARQUET_BATCH_BYTES and then written
+    as one row group, so memory stays bounded by the batch size. The copy
+    holds every CSV column (see read_copy_table); if the data does not fit
+    it the conversion is abandoned (failed is set) and only the CSV copy is
+    kept.
+    """
+
+    def __init__(self, batch_bytes: int = PARQUET_BATCH_BYTES):
+        self.batch_bytes = batch_bytes
+        self.failed = False
+        self.file = tempfile.TemporaryFile()
+        self._header = None
+        self._names = None
+        self._batch = []
+        self._batch_size = 0
+        self._writer = None
+
+    def feed(self, lines: bytes):
+        """Add complete CSV lines (the header line first)."""
+        if self.failed or not lines:
+            return
+        if self._header is None:
+            cut = lines.find(b"\n")
+            self._header, lines = lines[:cut + 1], lines[cut + 1:]
+            self._names = _csv_names(self._header)
+        self._batch.append(lines)
+        self._batch_size += len(lines)
+        if self._batch_size >= self.batch_bytes:
+            self._flush()
+
+    def _flush(self):
+        if not self._batch_size:
+            return
+        data = b"".join(self._batch)
+        self._batch = []
+        self._batch_size = 0
+        # The Parquet copy must read back exactly as the CSV, so any row that does not fit abandons it
+        try:
+            table = read_copy_table(data, self._names)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.file, table.schema, compression=PARQUET_COMPRESSION)
+            self._writer.write_table(table.cast(self._writer.schema))
+        except ValueError as e:
+            logger.warning(f"Skipping Parquet conversion: {str(e)}")
+            self.failed = True
+
+    def finish(self):
+        """Flush the last batch; returns the Parquet file positioned at 0, or None."""
+        if not self.failed:
+            self._flush()
+        if self._writer is not None:
+            self._writer.close()
+        if self.failed or self._writer is None:
+            self.file.close()
+            return None
+        self.file.seek(0)
+        return self.file
+
+    def close(self):
+        self.file.close()
+
+
+def _parquet_filters(product_ids=None, start_date=None, end_date=None):
+    filters = []
+    if product_ids:
+        filters.append(("product_id", "in", [str(p) for p in product_ids]))
+    if start_date is not None:
+        filters.append(("date", ">=", pd.Timestamp(start_date).date()))
+    if end_date is not None:
+        filters.append(("date", "<=", pd.Timestamp(end_date).date()))
+    return filters or None
+
+
+def _frame_mask(df: pd.DataFrame, product_ids=None, start_date=None, end_date=None) -> np.ndarray:
+    mask = np.ones(len(df), dtype=bool)
+    if product_ids:
+        mask &= df["product_id"].astype(str).isin([str(p) for p in product_ids]).to_numpy()
+    if start_date is not None:
+        mask &= (pd.to_datetime(df["date"]) >= pd.Timestamp(start_date)).to_numpy()
+    if end_date is not None:
+        mask &= (pd.to_datetime(df["date"]) <= pd.Timestamp(end_date)).to_numpy()
+    return mask
+
+
+def filter_frame(df: pd.DataFrame, product_ids=None, start_date=None, end_date=None) -> pd.DataFrame:
+    """Apply the same filters as the Parquet pushdown to an in-memory frame."""
+    mask = _frame_mask(df, product_ids, start_date, end_date)
+    return df if mask.all() else df[mask]
+
+
+def _table_mask(table: pa.Table, product_ids=None, start_date=None, end_date=None) -> np.ndarray:
+    mask = np.ones(table.num_rows, dtype=bool)
+    if product_ids:
+        product_column = pc.cast(table["product_id"], pa.string())
+        mask &= pc.is_in(product_column, value_set=pa.array([str(p) for p in product_ids])).to_numpy(zero_copy_only=False)
+    if start_date is not None:
+        mask &= pc.greater_equal(table["date"], pa.scalar(pd.Timestamp(start_date).date(), pa.date32())).to_numpy(zero_copy_only=False)
+    if end_date is not None:
+        mask &= pc.less_equal(table["date"], pa.scalar(pd.Timestamp(end_date).date(), pa.date32())).to_numpy(zero_copy_only=False)
+    return mask
+
+
+def _row_group_may_match(row_group, date_index: int, start_date=None, end_date=None) -> bool:
+    # Skip row groups whose date statistics fall entirely outside the range
+    if start_date is None and end_date is None:
+        return True
+    stats = row_group.column(date_index).statistics
+    if stats is None or not stats.has_min_max:
+        return True
+    if start_date is not None and stats.max < pd.Timestamp(start_date).date():
+        return False
+    if end_date is not None and stats.min > pd.Timestamp(end_date).date():
+        return False
+    return True
+
+
+def _open_parquet_copy(storage, csv_key: str, columns=None):
+    # The Parquet copy of an upload and the requested columns it holds; None if there
+    # is no copy or it is an older one without some of the columns the request needs
+    try:
+        head = storage.head(parquet_key(csv_key))
+    except ObjectNotFound:
+        return None
+    source = storage.open_random(parquet_key(csv_key), head["size"])
+    parquet_file = pq.ParquetFile(source)
+    names = parquet_file.schema_arrow.names
+    complete = (parquet_file.schema_arrow.metadata or {}).items() >= COPY_METADATA.items()
+    if not complete and (not columns or any(col not in names for col in columns)):
+        logger.info(f"Parquet copy of {csv_key} predates full-column copies")
+        return None
+    return source, parquet_file, [col for col in (columns or names) if col in names]
+
+
+def read_sales_frame(storage, csv_key: str, columns=None, product_ids=None, start_date=None, end_date=None) -> pd.DataFrame:
+    """Read an uploaded dataset, preferring its Parquet copy.
+
+    Only the requested columns are read and the product/date filters are
+    pushed down to Parquet row groups. Uploads without a Parquet copy (or
+    with an older copy that lacks requested columns) fall back to parsing
+    the CSV; both return the same columns and values.
+    """
+    copy = _open_parquet_copy(storage, csv_key, columns)
+    if copy is not None:
+        # Ranged reads happen lazily inside read_table, so this span includes the storage I/O
+        source, _, read_columns = copy
+        with span("parquet_read", key=csv_key):
+            table = pq.read_table(source, columns=read_columns, filters=_parquet_filters(product_ids, start_date, end_date))
+            return frame_from_table(table)
+
+    logger.info(f"No Parquet copy of {csv_key}, reading CSV")
+    data = storage.read(csv_key)
+    with span("csv_parse", key=csv_key):
+        df = read_csv_frame(io.BytesIO(data))
+    if product_ids or start_date is not None or end_date is not None:
+        df = filter_frame(df, product_ids, start_date, end_date)
+    if columns:
+        df = df[[col for col in columns if col in df.columns]]
+    return df
+
+
+def iter_sales_batches(
+    storage,
+    csv_key: str,
+    columns=None,
+    product_ids=None,
+    start_date=None,
+    end_date=None,
+    start_row: int = 0,
+    batch_size: int = READ_BATCH_ROWS
+):
+    """Stream an uploaded dataset as filtered Arrow tables.
+
+    Yields (table, row_numbers) pairs where row_numbers holds the position
+    of every returned row in the full dataset, so callers can resume from
+    any row with start_row. Parquet copies are read row group by row group
+    (skipping groups before start_row or outside the date range); CSV-only
+    uploads are parsed in chunks straight from the storage stream, every
+    chunk with float64 quantities and all other columns as text.
+    """
+    filter_columns = (["product_id"] if product_ids else []) + (["date"] if start_date or end_date else [])
+    copy = _open_parquet_copy(storage, csv_key, columns)
+    if copy is not None:
+        _, parquet_file, output_columns = copy
+        names = parquet_file.schema_arrow.names
+        read_columns = output_columns + [col for col in filter_columns if col not in output_columns]
+        date_index = names.index("date")
+        row_start = 0
+        for group in range(parquet_file.num_row_groups):
+            row_group = parquet_file.metadata.row_group(group)
+            group_start = row_start
+            row_start += row_group.num_rows
+            if row_start <= start_row or not _row_group_may_match(row_group, date_index, start_date, end_date):
+                continue
+            position = group_start
+            for batch in parquet_file.iter_batches(batch_size=batch_size, row_groups=[group], columns=read_columns):
+                table = pa.Table.from_batches([batch])
+                row_numbers = np.arange(position, position + table.num_rows)
+                position += table.num_rows
+                mask = (row_numbers >= start_row) & _table_mask(table, product_ids, start_date, end_date)
+                if mask.any():
+                    yield table.filter(pa.array(mask)).select(output_columns), row_numbers[mask]
+        return
+
+    logger.info(f"No Parquet copy of {csv_key}, streaming CSV")
+    position = start_row
+    with storage.open_stream(csv_key) as body:
+        reader = read_csv_frame(body, chunksize=batch_size, skiprows=range(1, start_row + 1))
+        for chunk in reader:
+            row_numbers = np.arange(position, position + len(chunk))
+            position += len(chunk)
+            mask = _frame_mask(chunk, product_ids, start_date, end_date)
+            if not mask.any():
+                continue
+            chunk = chunk[mask]
+            if columns:
+                chunk = chunk[[col for col in columns if col in chunk.columns]]
+            # One schema for every chunk, whether or not its quantities happen to be whole
+            schema = pa.schema([(col, pa.float64() if col == "quantity" else pa.string()) for col in chunk.columns])
+            yield pa.Table.from_pandas(chunk, schema=schema, preserve_index=False), row_numbers[mask]
+
+
+def limit_batches(batches, offset: int = 0, limit: int = None):
+    """Skip the first offset rows and stop after limit rows of a batch stream."""
+    emitted = 0
+    for table, row_numbers in batches:
+        if offset:
+            skip = min(offset, table.num_rows)
+            offset -= skip
+            table, row_numbers = table.slice(skip), row_numbers[skip:]
+        if limit is not None:
+            table, row_numbers = table.slice(0, limit - emitted), row_numbers[:limit - emitted]
+        if table.num_rows:
+            emitted += table.num_rows
+            yield table, row_numbers
+        if limit is not None and emitted >= limit:
+            return
+
+
+def table_to_parquet_bytes(df: pd.DataFrame) -> bytes:
+    """Serialize an output frame (forecast, inventory) to Parquet."""
+    buffer = io.BytesIO()
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), buffer, compression=PARQUET_COMPRESSION)
+    return buffer.getvalue()
@@ -0,0 +1,139 @@
+import os
+import zlib
+import logging
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # Optional; without it responses are only gzip-compressed
+    brotli = None
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Compression settings
+COMPRESSION_MIN_BYTES = int(os.getenv("STOCKIQ_COMPRESSION_MIN_BYTES", "1024"))  # Smaller bodies are sent as is
+GZIP_LEVEL = int(os.getenv("STOCKIQ_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("STOCKIQ_BROTLI_QUALITY", "5"))  # 0-11; mid qualities suit dynamic responses
+THREAD_MIN_BYTES = 256 * 1024  # Larger chunks are compressed off the event loop
+EXCLUDED_CONTENT_TYPES = ("text/event-stream", "image/", "application/gzip", "application/zip")
+
+
+def supported_encodings() -> tuple:
+    """Content encodings this server can produce, in order of preference."""
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def choose_encoding(accept_encoding: str):
+    """Pick the supported encoding the client ranks highest, or None."""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    # Ties go to the server's preference order
+    ranked = [(accepted.get(encoding, accepted.get("*", 0.0)), -i, encoding) for i, encoding in enumerate(supported_encodings())]
+    quality, _, encoding = max(ranked)
+    return encoding if quality > 0 else None
+
+
+class _Compressor:
+    # One streaming compressor per response
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._gzip = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, body: bytes, more_body: bool) -> bytes:
+        # Flush every chunk so streamed responses stay incremental
+        if self.encoding == "br":
+            data = self._brotli.process(body)
+            return data + (self._brotli.flush() if more_body else self._brotli.finish())
+        data = self._gzip.compress(body)
+        return data + self._gzip.flush(zlib.Z_SYNC_FLUSH if more_body else zlib.Z_FINISH)
+
+
+class CompressionMiddleware:
+    """Compress responses with brotli or gzip, whichever the client prefers.
+
+    Brotli is used when the brotli package is installed and the client
+    accepts it. Bodies under COMPRESSION_MIN_BYTES, already encoded bodies
+    and event streams are passed through unchanged; streamed bodies are
+    compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        pending = []  # Body chunks held back until minimum_size is reached
+        compressor = None
+        passthrough = False
+
+        async def compress(body: bytes, more_body: bool) -> bytes:
+            if len(body) >= THREAD_MIN_BYTES:
+                return await run_in_threadpool(compressor.compress, body, more_body)
+            return compressor.compress(body, more_body)
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                # Hold the headers until the body shows whether to compress
+                headers = Headers(raw=message["headers"])
+                content_type = headers.get("content-type", "")
+                passthrough = "content-encoding" in headers or content_type.startswith(EXCLUDED_CONTENT_TYPES)
+                if passthrough:
+                    await send(message)
+                else:
+                    start_message = message
+                return
+            if passthrough or message["type"] != "http.response.body":
+                await send(message)
+                return
+            more_body = message.get("more_body", False)
+            if compressor is None:
+                # Buffer small leading chunks; middleware upstream may split one body into several
+                pending.append(message.get("body", b""))
+                body = b"".join(pending)
+                if len(body) < self.minimum_size and more_body:
+                    return
+                headers = MutableHeaders(raw=start_message["headers"])
+                headers.add_vary_header("Accept-Encoding")
+                if len(body) < self.minimum_size:
+                    passthrough = True
+                    headers["Content-Length"] = str(len(body))
+                    await send(start_message)
+                    await send({"type": "http.response.body", "body": body, "more_body": False})
+                    return
+                compressor = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                body = await compress(body, more_body)
+                if more_body:
+                    del headers["Content-Length"]
+                else:
+                    headers["Content-Length"] = str(len(body))
+                await send(start_message)
+            else:
+                body = await compress(message.get("body", b""), more_body)
+            await send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,418 @@
+import os
+import json
+import time
+import zlib
+import logging
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
+import pandas as pd
+from api.cache import hash_key
+from api.fast_forecast import FAST_METHODS, fast_forecast
+from api.inventory import LEAD_TIME_DAYS, inventory_config, optimize_inventory
+from api.metrics import observe_product_fit, span
+from api.model_store import DEFAULT_FIT_MODE, FIT_MODES, fitted_params
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Forecast settings
+FORECAST_PERIODS = 30  # Days to forecast
+MAX_FORECAST_PERIODS = 365  # Longest horizon a request may ask for
+MODEL_PARAMS = {
+    "yearly_seasonality": True,
+    "weekly_seasonality": True,
+    "daily_seasonality": True,
+    "seasonality_mode": "multiplicative",  # Better for varying trends
+    "changepoint_prior_scale": 0.05  # Adjust for flexibility in trend changes
+}
+HOLIDAY_COUNTRY = "US"
+WARMUP_DAYS = 60  # History length of the synthetic series fitted by warm_up
+
+# Engine settings (can be overridden per request)
+ENGINES = ("prophet", "fast", "hybrid")
+DEFAULT_ENGINE = os.getenv("STOCKIQ_FORECAST_ENGINE", "prophet")
+HYBRID_TOP_N = int(os.getenv("STOCKIQ_HYBRID_TOP_N", "100"))  # Products by volume sent to Prophet in hybrid mode
+
+# Execution settings (can be overridden per request)
+EXECUTION_MODES = ("sequential", "process")
+DEFAULT_EXECUTION_MODE = os.getenv("STOCKIQ_FORECAST_EXECUTION", "sequential")
+DEFAULT_MAX_WORKERS = int(os.getenv("STOCKIQ_FORECAST_WORKERS", "0")) or os.cpu_count() or 1
+DEFAULT_CHUNK_SIZE = int(os.getenv("STOCKIQ_FORECAST_CHUNK_SIZE", "1"))
+
+
+# Long-lived process pool shared by every request
+_pool = None
+_pool_workers = None
+_pool_lock = threading.Lock()
+
+
+@functools.lru_cache(maxsize=32)
+def holiday_frame(first_year: int, last_history_year: int, last_year: int) -> pd.DataFrame:
+    """US holidays from first_year to last_year, shared by every product with that span.
+
+    Matches what Prophet's add_country_holidays builds on every fit: only
+    holidays that occur in the history years are kept, with their dates in
+    the forecast years too. Do not modify the returned frame.
+    """
+    from prophet.make_holidays import make_holidays_df
+
+    holidays = make_holidays_df(year_list=list(range(first_year, last_year + 1)), country=HOLIDAY_COUNTRY)
+    seen = holidays.loc[holidays["ds"].dt.year <= last_history_year, "holiday"].unique()
+    return holidays[holidays["holiday"].isin(seen)].reset_index(drop=True)
+
+
+def build_model(holidays: pd.DataFrame = None):
+    """Create a Prophet model with the StockIQ settings.
+
+    holidays is a calendar from holiday_frame; without it Prophet builds
+    the US calendar itself.
+    """
+    # Prophet pulls in cmdstanpy and matplotlib; import it on first use so
+    # the API starts without it and fast-engine-only workers never load it
+    from prophet import Prophet
+
+    if holidays is not None:
+        return Prophet(holidays=holidays.copy(), **MODEL_PARAMS)
+    model = Prophet(**MODEL_PARAMS)
+    model.add_country_holidays(country_name=HOLIDAY_COUNTRY)  # Add US holidays
+    return model
+
+
+def model_config_hash() -> str:
+    """Hash of every setting that changes forecast output, used in cache keys."""
+    config = {
+        "model_params": MODEL_PARAMS,
+        "holiday_country": HOLIDAY_COUNTRY,
+        "forecast_periods": FORECAST_PERIODS,
+        "inventory": inventory_config()
+    }
+    return hash_key(json.dumps(config, sort_keys=True))
+
+
+def product_cache_key(product, df_product: pd.DataFrame, config_hash: str, periods: int = FORECAST_PERIODS) -> str:
+    # Key a product fit on its own rows, so edits elsewhere in the file do not invalidate it
+    rows_hash = pd.util.hash_pandas_object(df_product, index=False).values.tobytes()
+    return hash_key(config_hash, repr(product), rows_hash, periods)
+
+
+def forecast_product(product, df_product: pd.DataFrame, init: dict = None, periods: int = FORECAST_PERIODS) -> dict:
+    """Fit and predict a single product, warm starting from init when given."""
+    # Check if enough data points (at least 2 non-NaN rows)
+    if len(df_product) < 2:
+        return {"product_id": product, "status": "skipped", "rows": len(df_product)}
+
+    try:
+        first, last = df_product["ds"].min(), df_product["ds"].max()
+        model = build_model(holiday_frame(first.year, last.year, (last + pd.Timedelta(days=periods)).year))
+        fit_start = time.perf_counter()
+        if init is not None:
+            model.fit(df_product, init=init)
+        else:
+            model.fit(df_product)
+        fit_seconds = time.perf_counter() - fit_start
+
+        # Seed the uncertainty sampling per product so results do not depend
+        # on which process (or in which order) the product was forecast
+        np.random.seed(zlib.crc32(str(product).encode()))
+
+        # Create future dataframe for the next periods days
+        predict_start = time.perf_counter()
+        future = model.make_future_dataframe(periods=periods)
+        forecast = model.predict(future)
+        predict_seconds = time.perf_counter() - predict_start
+
+        # Select relevant columns
+        forecast = forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]].copy()
+        forecast["product_id"] = product
+        return {
+            "product_id": product,
+            "status": "ok",
+            "forecast": forecast,
+            "params": fitted_params(model),
+            "timings": {"fit": fit_seconds, "predict": predict_seconds}
+        }
+    except Exception as e:
+        return {"product_id": product, "status": "failed", "error": str(e)}
+
+
+def warm_up() -> dict:
+    """Load Prophet and its Stan backend ahead of the first forecast.
+
+    Imports Prophet, then fits and predicts one small synthetic product so
+    the CmdStan model, the holiday calendar of the current years and
+    pandas' code paths are loaded. Returns the seconds each step took.
+    Also run by every process pool worker as it starts.
+    """
+    timings = {}
+    start = time.perf_counter()
+    from prophet import Prophet  # noqa: F401
+    timings["import_seconds"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    history = pd.DataFrame({
+        "ds": pd.date_range(end=pd.Timestamp.today().normalize(), periods=WARMUP_DAYS),
+        "y": np.random.default_rng(0).poisson(10, WARMUP_DAYS).astype("float64")
+    })
+    result = forecast_product("warm-up", history)
+    if result["status"] != "ok":
+        raise RuntimeError(f"Warm-up forecast failed: {result.get('error')}")
+    timings["fit_seconds"] = time.perf_counter() - start
+    return timings
+
+
+def _init_worker():
+    # Pool workers are spawned fresh; load Prophet before their first product
+    try:
+        warm_up()
+    except Exception as e:
+        logger.error(f"Worker warm-up failed: {str(e)}")
+
+
+def _process_pool(max_workers: int) -> ProcessPoolExecutor:
+    # Workers stay up between requests; asking for another size replaces the pool
+    global _pool, _pool_workers
+    with _pool_lock:
+        if _pool is None or _pool_workers != max_workers:
+            if _pool is not None:
+                # Requests still using the old pool finish their products first
+                _pool.shutdown(wait=False)
+            # Spawn workers: forking from the threaded API process can deadlock
+            _pool = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+            )
+            _pool_workers = max_workers
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor):
+    # A worker died; the next request starts a new pool
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _forecast_task(task):
+    # Unpack a (product, df_product, init, periods) tuple for executor.map
+    return forecast_product(*task)
+
+
+def _iter_product_tasks(df: pd.DataFrame):
+    # Partition the data in a single groupby pass instead of one scan per product
+    history = df[["date", "quantity", "product_id"]].rename(columns={"date": "ds", "quantity": "y"})
+    for product, df_product in history.groupby("product_id", sort=False, observed=True):
+        yield product, df_product[["ds", "y"]]
+
+
+def _fit_prophet_products(
+    df, execution_mode, max_workers, chunk_size, progress_callback, cancel_check, cache, completed_offset, total,
+    model_store, fit_mode, store_scope, periods
+):
+    # Look up per-product fits in the cache, then reuse or warm start from the
+    # model store; only products that still need a fit are sent to the fitters
+    config_hash = model_config_hash() if cache is not None or model_store is not None else None
+    results = []
+    tasks = []
+    task_slots = []
+    task_keys = []
+    task_plans = []
+    reused = 0
+    for product, df_product in _iter_product_tasks(df):
+        key = product_cache_key(product, df_product, config_hash, periods) if cache is not None else None
+        cached = cache.get("product", key) if key is not None and fit_mode != "full" else None
+        plan = None
+        if cached is None and model_store is not None and len(df_product) >= 2:
+            plan = model_store.plan(store_scope, product, df_product, config_hash, fit_mode, periods)
+            if plan["action"] == "reuse":
+                cached = {"product_id": product, "status": "ok", "forecast": plan["state"]["forecast"], "params": plan["state"]["params"]}
+                reused += 1
+        results.append(cached)
+        if cached is None:
+            tasks.append((product, df_product, plan["init"] if plan else None, periods))
+            task_slots.append(len(results) - 1)
+            task_keys.append(key)
+            task_plans.append(plan)
+    completed = completed_offset + len(results) - len(tasks)
+    if cache is not None or model_store is not None:
+        warm = sum(1 for plan in task_plans if plan and plan["action"] == "warm")
+        logger.info(
+            f"Reusing {len(results) - len(tasks)} products ({reused} from the model store), "
+            f"fitting {len(tasks)} products ({warm} warm started)"
+        )
+    if progress_callback:
+        progress_callback(completed, total)
+
+    def collect(slot, key, plan, task, result):
+        results[slot] = result
+        if result["status"] != "ok":
+            return
+        observe_product_fit(result, warm=task[2] is not None)
+        if cache is not None:
+            cache.put("product", key, result)
+        if plan is not None:
+            model_store.record(store_scope, task[0], task[1], config_hash, plan, result)
+
+    if execution_mode == "process" and max_workers > 1 and len(tasks) > 1:
+        logger.info(f"Forecasting with a process pool ({max_workers} workers, chunk size {chunk_size})")
+        pool = _process_pool(max_workers)
+        outputs = pool.map(_forecast_task, tasks, chunksize=chunk_size)
+        try:
+            for slot, key, plan, task, result in zip(task_slots, task_keys, task_plans, tasks, outputs):
+                if cancel_check:
+                    cancel_check()
+                collect(slot, key, plan, task, result)
+                completed += 1
+                if progress_callback:
+                    progress_callback(completed, total)
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            raise
+        finally:
+            # Drops this request's chunks that have not started (e.g. after a cancel); the pool stays up
+            outputs.close()
+    else:
+        logger.info("Forecasting sequentially")
+        for slot, key, plan, task in zip(task_slots, task_keys, task_plans, tasks):
+            if cancel_check:
+                cancel_check()
+            collect(slot, key, plan, task, _forecast_task(task))
+            completed += 1
+            if progress_callback:
+                progress_callback(completed, total)
+    return results
+
+
+def run_forecasts(
+    df: pd.DataFrame,
+    execution_mode: str = None,
+    max_workers: int = None,
+    chunk_size: int = None,
+    progress_callback=None,
+    cancel_check=None,
+    cache=None,
+    engine: str = None,
+    top_n: int = None,
+    fast_method: str = "auto",
+    model_store=None,
+    fit_mode: str = None,
+    store_scope: str = "",
+    last_date=None,
+    periods: int = None,
+    prophet_products=None
+) -> dict:
+    """Forecast every product in df with the selected engine.
+
+    engine is "prophet" (one Prophet fit per product, sequentially or across
+    a process pool), "fast" (every product in one vectorized NumPy pass) or
+    "hybrid" (the top_n products by volume with Prophet, the rest fast).
+
+    Returns the combined forecast frame, the inventory recommendations frame
+    (both None when nothing could be forecast) and the skipped/failed
+    products. Results are in first-appearance order of product_id regardless
+    of the execution mode, so every mode produces the same output.
+    progress_callback(completed, total) is called after every product and
+    cancel_check() is called before collecting each one; it should raise to
+    abort the run. When a cache is given, Prophet products whose rows are
+    unchanged reuse their cached fit and only the rest are refitted.
+
+    With a model store, fit_mode "incremental" reuses the stored forecast of
+    products whose history is unchanged and warm starts the others from
+    their stored parameters when the store's refit policy allows it; "full"
+    cold fits every product and ignores cached fits. Either way the new
+    state is saved under store_scope for the next run.
+
+    last_date is the end of the history that inventory lead times count
+    from; it defaults to the last date in df and is passed explicitly when
+    df is only one partition of a larger dataset. periods is the number of
+    days forecast after each product's history (default FORECAST_PERIODS).
+    prophet_products overrides the hybrid engine's top_n choice with the
+    products to forecast with Prophet, e.g. the top products of a whole
+    dataset when df is one partition of it.
+    """
+    engine = engine or DEFAULT_ENGINE
+    execution_mode = execution_mode or DEFAULT_EXECUTION_MODE
+    max_workers = max_workers or DEFAULT_MAX_WORKERS
+    chunk_size = chunk_size or DEFAULT_CHUNK_SIZE
+    fit_mode = fit_mode or DEFAULT_FIT_MODE
+    periods = periods or FORECAST_PERIODS
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown forecasting engine: {engine}")
+    if execution_mode not in EXECUTION_MODES:
+        raise ValueError(f"Unknown execution mode: {execution_mode}")
+    if fast_method not in FAST_METHODS:
+        raise ValueError(f"Unknown fast forecasting method: {fast_method}")
+    if fit_mode not in FIT_MODES:
+        raise ValueError(f"Unknown fit mode: {fit_mode}")
+    if not LEAD_TIME_DAYS <= periods <= MAX_FORECAST_PERIODS:
+        raise ValueError(f"Forecast horizon must be between {LEAD_TIME_DAYS} and {MAX_FORECAST_PERIODS} days")
+
+    # Split products between the engines
+    if engine == "prophet":
+        prophet_df, fast_df = df, None
+    elif engine == "fast":
+        prophet_df, fast_df = None, df
+    else:
+        if prophet_products is None:
+            volumes = df.groupby("product_id", sort=False, observed=True)["quantity"].sum()
+            prophet_products = volumes.nlargest(top_n or HYBRID_TOP_N).index
+        in_top = df["product_id"].isin(prophet_products)
+        prophet_df, fast_df = df[in_top], df[~in_top]
+        logger.info(f"Hybrid forecast: {in_top.sum()} rows with Prophet, {(~in_top).sum()} rows with the fast engine")
+
+    total = df["product_id"].nunique()
+    last_date = df["date"].max() if last_date is None else pd.Timestamp(last_date)
+    forecasts = []
+    skipped_products = []
+    failed_products = []
+    completed = 0
+    if fast_df is not None and len(fast_df):
+        with span("fast_forecast", products=fast_df["product_id"].nunique()):
+            fast = fast_forecast(fast_df, periods, method=fast_method, end_date=last_date)
+        forecasts.append(fast["forecast"])
+        skipped_products.extend(fast["skipped_products"])
+        completed = fast_df["product_id"].nunique()
+        if progress_callback:
+            progress_callback(completed, total)
+
+    if prophet_df is not None and len(prophet_df):
+        with span("prophet_forecast", execution=execution_mode):
+            results = _fit_prophet_products(
+                prophet_df, execution_mode, max_workers, chunk_size, progress_callback, cancel_check, cache, completed, total,
+                model_store, fit_mode, store_scope, periods
+            )
+        for result in results:
+            product = result["product_id"]
+            if result["status"] == "skipped":
+                logger.warning(f"Skipping product {product}: insufficient data points ({result['rows']} rows)")
+                skipped_products.append(product)
+            elif result["status"] == "failed":
+                logger.error(f"Forecast failed for product {product}: {result['error']}")
+                failed_products.append({"product_id": product, "error": result["error"]})
+            else:
+                forecasts.append(result["forecast"])
+
+    forecasts = [forecast for forecast in forecasts if len(forecast)]
+    if not forecasts:
+        return {"forecast": None, "inventory": None, "skipped_products": skipped_products, "failed_products": failed_products}
+
+    # Combine forecasts in first-appearance order and compute inventory for all products in one pass
+    forecast_df = pd.concat(forecasts, ignore_index=True)
+    if engine == "hybrid":
+        appearance = {product: i for i, product in enumerate(pd.unique(df["product_id"]))}
+        order = np.argsort(forecast_df["product_id"].map(appearance).to_numpy(), kind="stable")
+        forecast_df = forecast_df.iloc[order].reset_index(drop=True)
+    with span("inventory"):
+        inventory_df = optimize_inventory(forecast_df, last_date)
+
+    return {
+        "forecast": forecast_df,
+        "inventory": inventory_df,
+        "skipped_products": skipped_products,
+        "failed_products": failed_products
+    }
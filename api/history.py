@@ -0,0 +1,263 @@
+import io
+import os
+import json
+import logging
+import threading
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from api.cache import hash_key
+from api.catalog import dataset_catalog
+from api.columnar import PARQUET_COMPRESSION, READ_BATCH_ROWS, _parquet_filters, _table_mask, frame_from_table, read_sales_frame
+from api.ingest import REQUIRED_COLUMNS
+from api.storage import ObjectNotFound, storage
+from utils.preprocess import prepare_sales_frame
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# History settings
+HISTORY_MANIFEST_KEY = "history/manifest.json"
+LEGACY_HISTORY_KEY = "history/sales.parquet"  # Single-file history of earlier versions, used as the first base
+HISTORY_READ_CONCURRENCY = int(os.getenv("STOCKIQ_HISTORY_READ_CONCURRENCY", "8"))  # Datasets read at once when appending
+HISTORY_ROW_GROUP_ROWS = int(os.getenv("STOCKIQ_HISTORY_ROW_GROUP_ROWS", "262144"))
+HISTORY_COMPACT_FRAGMENTS = int(os.getenv("STOCKIQ_HISTORY_COMPACT_FRAGMENTS", "16"))  # Fragments that trigger a compaction
+HISTORY_COMPACT_RATIO = float(os.getenv("STOCKIQ_HISTORY_COMPACT_RATIO", "0.25"))  # Fragment bytes, relative to the base, that trigger a compaction
+HISTORY_SCHEMA = pa.schema([
+    ("date", pa.date32()),
+    ("product_id", pa.dictionary(pa.int32(), pa.string())),
+    ("quantity", pa.float64())
+])
+
+
+def fragment_key(content_hash: str) -> str:
+    """Daily totals of one uploaded dataset, shared by identical uploads."""
+    return f"history/fragments/{content_hash}.parquet"
+
+
+def base_key(version: str) -> str:
+    """Compacted history covering the datasets of one version."""
+    return f"history/base/{version}.parquet"
+
+
+def daily_totals(df: pd.DataFrame) -> pd.DataFrame:
+    """One row per (date, product_id) with the day's total quantity, from a prepared sales frame."""
+    df = pd.DataFrame({
+        "date": df["date"].dt.normalize(),
+        "product_id": df["product_id"].astype(str),
+        "quantity": df["quantity"].astype("float64")
+    })
+    return df.groupby(["date", "product_id"], as_index=False, sort=False)["quantity"].sum()
+
+
+def merge_history(frames) -> pd.DataFrame:
+    """Merge daily totals in upload order; a later upload replaces the same product-day."""
+    merged = pd.concat(frames, ignore_index=True)
+    merged = merged.drop_duplicates(subset=["date", "product_id"], keep="last")
+    return merged.sort_values(["product_id", "date"], kind="stable").reset_index(drop=True)
+
+
+class SalesHistory:
+    """Every uploaded dataset merged into one compact per-product daily series.
+
+    The history is a compacted base (one Parquet file sorted by product and
+    date) plus one fragment per dataset uploaded since, holding that
+    dataset's daily totals. refresh() reads only the catalog datasets that
+    have no fragment yet (concurrently) and writes their fragments with
+    create-if-absent writes, so an append never rewrites the whole history
+    and concurrent API instances write identical fragments at most once.
+    Once there are HISTORY_COMPACT_FRAGMENTS fragments, or their size
+    reaches HISTORY_COMPACT_RATIO of the base, they are merged into a new
+    base named after its version and the manifest is pointed at it.
+    Objects are never changed once written, so a racing compaction can
+    only leave more fragments to read. Readers apply fragments over the
+    base in upload order. Identical re-uploads (same content hash) are
+    read once.
+
+    Datasets are validated like forecast input: invalid rows are dropped
+    (and logged), and a dataset without the sales columns adds an empty
+    fragment. A dataset that cannot be read is left out of this refresh
+    and retried by the next one.
+    """
+
+    def __init__(self, storage, catalog, read_concurrency: int = HISTORY_READ_CONCURRENCY):
+        self.storage = storage
+        self.catalog = catalog
+        self.read_concurrency = read_concurrency
+        self._fragment_sizes = {}  # Fragments known to exist; they never change
+        self._state = None
+        self._lock = threading.Lock()
+
+    def manifest(self) -> dict:
+        """The last compaction: its datasets, version, base object and statistics."""
+        try:
+            manifest = json.loads(self.storage.read(HISTORY_MANIFEST_KEY))
+        except ObjectNotFound:
+            return {"datasets": {}, "version": None, "base": None, "size": 0}
+        if "base" not in manifest:
+            # Written before fragments existed
+            manifest["base"] = LEGACY_HISTORY_KEY
+            manifest["size"] = self.storage.head(LEGACY_HISTORY_KEY)["size"]
+        return manifest
+
+    def _read_dataset(self, key: str) -> pd.DataFrame:
+        raw = read_sales_frame(self.storage, key, columns=REQUIRED_COLUMNS)
+        df, errors = prepare_sales_frame(raw, aggregate=False)
+        if df is None:
+            logger.warning(f"Dataset {key} has no sales columns, adding nothing to the sales history: {errors[0]['message']}")
+            df, _ = prepare_sales_frame(pd.DataFrame({col: pd.Series(dtype=str) for col in REQUIRED_COLUMNS}), aggregate=False)
+        elif errors:
+            logger.warning(f"Dropped {len(raw) - len(df)} invalid rows of {key} from the sales history: {errors[0]['message']}")
+        return daily_totals(df)
+
+    def _read_part(self, key: str, product_ids=None, start_date=None, end_date=None) -> pd.DataFrame:
+        table = pq.read_table(self.storage.open_random(key), filters=_parquet_filters(product_ids, start_date, end_date))
+        df = frame_from_table(table)
+        df["product_id"] = df["product_id"].astype(str)
+        return df
+
+    def _parquet_bytes(self, df: pd.DataFrame) -> bytes:
+        table = pa.Table.from_pandas(df[HISTORY_SCHEMA.names], schema=HISTORY_SCHEMA, preserve_index=False)
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer, compression=PARQUET_COMPRESSION, row_group_size=HISTORY_ROW_GROUP_ROWS)
+        return buffer.getvalue()
+
+    def _ensure_fragment(self, entry: dict) -> int:
+        # Write the dataset's fragment unless it exists; returns its size, or None if it failed
+        key = fragment_key(entry["content_hash"])
+        if key not in self._fragment_sizes:
+            try:
+                try:
+                    size = self.storage.head(key)["size"]
+                except ObjectNotFound:
+                    data = self._parquet_bytes(merge_history([self._read_dataset(entry["key"])]))
+                    if self.storage.put_if_absent(key, data):
+                        size = len(data)
+                    else:
+                        # Another instance wrote the same fragment first
+                        size = self.storage.head(key)["size"]
+            except Exception as e:
+                logger.error(f"Failed to add dataset {entry['key']} to the sales history: {str(e)}")
+                return None
+            self._fragment_sizes[key] = size
+        return self._fragment_sizes[key]
+
+    def _compact(self, manifest: dict, state: dict) -> dict:
+        frames = [self._read_part(key) for key in ([manifest["base"]] if manifest["base"] else []) + state["fragments"]]
+        history = merge_history(frames) if frames else pd.DataFrame({
+            "date": pd.Series(dtype="datetime64[ns]"), "product_id": pd.Series(dtype=str), "quantity": pd.Series(dtype="float64")
+        })
+        key = base_key(state["version"])
+        data = self._parquet_bytes(history)
+        self.storage.put(key, data)
+        compacted = {
+            "datasets": state["datasets"],
+            "version": state["version"],
+            "base": key,
+            "previous_base": manifest["base"],
+            "size": len(data),
+            "rows": len(history),
+            "products": int(history["product_id"].nunique()),
+            "start_date": history["date"].min().strftime("%Y-%m-%d") if len(history) else None,
+            "end_date": history["date"].max().strftime("%Y-%m-%d") if len(history) else None,
+            "updated_at": datetime.now(timezone.utc).isoformat()
+        }
+        self.storage.put(HISTORY_MANIFEST_KEY, json.dumps(compacted).encode())
+        # Keep the replaced base for readers that loaded the old manifest; drop the one before it
+        obsolete = manifest.get("previous_base")
+        if obsolete and obsolete not in (key, manifest["base"]):
+            self.storage.delete(obsolete)
+        logger.info(f"Compacted {len(state['fragments'])} fragments into a sales history of {len(history)} rows from {len(state['datasets'])} datasets")
+        return dict(compacted, fragments=[])
+
+    def refresh(self) -> dict:
+        """Add fragments for catalog datasets not in the history yet, compacting when due.
+
+        Returns the current state: the manifest fields plus every included
+        dataset, the fragments on top of the base and the total size.
+        """
+        with self._lock:
+            manifest = self.manifest()
+            included = dict(manifest["datasets"])
+            seen_hashes = set(included.values())
+            pending = []
+            for entry in self.catalog.list():
+                if entry["key"] in included:
+                    continue
+                included[entry["key"]] = entry["content_hash"]
+                if entry["content_hash"] in seen_hashes:
+                    # Same bytes as a dataset already merged
+                    continue
+                seen_hashes.add(entry["content_hash"])
+                pending.append(entry)
+
+            if pending:
+                logger.info(f"Appending {len(pending)} datasets to the sales history")
+            with ThreadPoolExecutor(max_workers=self.read_concurrency, thread_name_prefix="history-read") as executor:
+                fragment_sizes = list(executor.map(self._ensure_fragment, pending))
+            failed = {entry["content_hash"] for entry, size in zip(pending, fragment_sizes) if size is None}
+            if failed:
+                # Left out until a later refresh reads them
+                included = {key: content_hash for key, content_hash in included.items() if content_hash not in failed}
+                pending = [entry for entry in pending if entry["content_hash"] not in failed]
+                fragment_sizes = [size for size in fragment_sizes if size is not None]
+            state = dict(
+                manifest,
+                datasets=included,
+                version=hash_key(json.dumps(sorted(included.items()))),
+                fragments=[fragment_key(entry["content_hash"]) for entry in pending],
+                size=manifest["size"] + sum(fragment_sizes)
+            )
+            due = len(pending) >= HISTORY_COMPACT_FRAGMENTS or sum(fragment_sizes) >= HISTORY_COMPACT_RATIO * manifest["size"]
+            if manifest["version"] is None or (pending and due):
+                state = self._compact(manifest, state)
+            self._state = state
+            return state
+
+    def _current(self) -> dict:
+        with self._lock:
+            state = self._state
+        return state if state is not None else self.refresh()
+
+    def read(self, product_ids=None, start_date=None, end_date=None) -> pd.DataFrame:
+        """Read the history as of the last refresh, pushing product and date filters down to Parquet."""
+        state = self._current()
+        frames = [self._read_part(key, product_ids, start_date, end_date) for key in [state["base"]] + state["fragments"]]
+        return merge_history(frames) if state["fragments"] else frames[0]
+
+    def iter_batches(self, product_ids=None, start_date=None, end_date=None, batch_size: int = READ_BATCH_ROWS):
+        """Stream the history as filtered Arrow tables, like iter_sales_batches.
+
+        Base rows replaced by a fragment are skipped; the merged fragments,
+        small by construction, follow the base.
+        """
+        state = self._current()
+        fragments = None
+        if state["fragments"]:
+            fragments = merge_history([self._read_part(key, product_ids, start_date, end_date) for key in state["fragments"]])
+            replaced = pd.MultiIndex.from_frame(fragments[["product_id", "date"]])
+        parquet_file = pq.ParquetFile(self.storage.open_random(state["base"]))
+        position = 0
+        for batch in parquet_file.iter_batches(batch_size=batch_size):
+            table = pa.Table.from_batches([batch])
+            row_numbers = np.arange(position, position + table.num_rows)
+            position += table.num_rows
+            mask = _table_mask(table, product_ids, start_date, end_date)
+            if fragments is not None and mask.any():
+                keys = pd.MultiIndex.from_arrays([
+                    table["product_id"].to_pandas().astype(str),
+                    pd.Series(table["date"].to_numpy(zero_copy_only=False)).astype("datetime64[ns]")
+                ])
+                mask &= ~keys.isin(replaced)
+            if mask.any():
+                yield table.filter(pa.array(mask)), row_numbers[mask]
+        if fragments is not None and len(fragments):
+            table = pa.Table.from_pandas(fragments[HISTORY_SCHEMA.names], schema=HISTORY_SCHEMA, preserve_index=False)
+            yield table, np.arange(position, position + table.num_rows)
+
+
+sales_history = SalesHistory(storage, dataset_catalog)
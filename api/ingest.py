@@ -0,0 +1,152 @@
+import io
+import os
+import csv
+import hashlib
+import logging
+import numpy as np
+import pyarrow.compute as pc
+from utils.preprocess import REQUIRED_COLUMNS, parse_sales_csv
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Streaming settings
+UPLOAD_CHUNK_SIZE = int(os.getenv("STOCKIQ_UPLOAD_CHUNK_BYTES", str(1024 * 1024)))  # Bytes read from the upload at a time
+
+
+class CsvValidationError(ValueError):
+    """Raised when streamed CSV content does not match the sales schema."""
+
+
+def _last_record_end(data: bytes) -> int:
+    # Position of the last line break that ends a record, or -1; line breaks inside quoted
+    # fields do not count. Chunks always start at a record boundary, so outside a quoted
+    # field the quotes seen so far pair up ("" escapes count twice).
+    if b'"' not in data:
+        return data.rfind(b"\n")
+    raw = np.frombuffer(data, dtype=np.uint8)
+    breaks = np.flatnonzero(raw == ord("\n"))
+    quotes_before = np.cumsum(raw == ord('"'))[breaks]
+    ends = breaks[quotes_before % 2 == 0]
+    return int(ends[-1]) if len(ends) else -1
+
+
+class StreamingCsvValidator:
+    """Validate CSV bytes chunk by chunk without holding the whole file.
+
+    The header is checked for the required columns as soon as it is
+    complete, then every row is checked for the right number of fields and
+    a numeric quantity. Each chunk is parsed in one pass with the typed
+    pyarrow reader from utils.preprocess; only a chunk it rejects is
+    re-checked row by row to report the exact line.
+
+    Chunks are cut after the last line break outside a quoted field, so a
+    record whose quoted values contain line breaks is always validated
+    whole; only the trailing partial record is kept between chunks.
+
+    Along the way it collects the catalog metadata of the upload: the
+    SHA-256 of the raw bytes, the product set (stripped of surrounding
+    whitespace, like the Parquet copy) and the distinct dates.
+    """
+
+    def __init__(self, required_columns=REQUIRED_COLUMNS):
+        self.required_columns = required_columns
+        self.header = None
+        self.rows = 0
+        self.products = set()
+        self.dates = set()
+        self._quantity_index = None
+        self._product_index = None
+        self._date_index = None
+        self._sha256 = hashlib.sha256()
+        self._remainder = b""
+        self._line_number = 0
+
+    def feed(self, chunk: bytes) -> bytes:
+        """Validate the complete records in chunk; returns their lines."""
+        self._sha256.update(chunk)
+        data = self._remainder + chunk
+        cut = _last_record_end(data)
+        if cut == -1:
+            self._remainder = data
+            return b""
+        self._remainder = data[cut + 1:]
+        lines = data[:cut + 1]
+        self._check_lines(lines)
+        return lines
+
+    def finish(self) -> bytes:
+        """Validate the final record; call once after the last chunk and returns it."""
+        lines = self._remainder
+        if lines:
+            self._check_lines(lines)
+            self._remainder = b""
+        if self.header is None:
+            raise CsvValidationError("No columns to parse from file")
+        return lines + b"\n" if lines else b""
+
+    def _check_lines(self, data: bytes):
+        try:
+            text = data.decode("utf-8-sig" if self.header is None else "utf-8")
+        except UnicodeDecodeError as e:
+            raise CsvValidationError(f"Invalid CSV format: file is not UTF-8 encoded ({str(e)})")
+        while self.header is None and text:
+            header_line, _, text = text.partition("\n")
+            self._line_number += 1
+            row = next(csv.reader([header_line.rstrip("\r")]), [])
+            if row and any(field.strip() for field in row):
+                self._check_header(row)
+        if self.header is None or not text.strip() or self._check_table(text):
+            return
+        first_line = self._line_number
+        reader = csv.reader(io.StringIO(text))
+        for row in reader:
+            # Quoted values may span lines; report the line a record ends on
+            self._line_number = first_line + reader.line_num
+            if not row or all(not field.strip() for field in row):
+                continue
+            self._check_row(row)
+            self.rows += 1
+
+    def _check_table(self, text: str) -> bool:
+        # Fast path for a whole chunk; False leaves it to the row-by-row check
+        table, errors = parse_sales_csv(text.encode(), column_names=self.header, parse_dates=False)
+        if table is None or errors:
+            return False
+        self.rows += table.num_rows
+        self.products.update(product.strip() for product in pc.unique(table["product_id"]).to_pylist())
+        self.dates.update(day.strip() for day in pc.unique(table["date"]).to_pylist())
+        self._line_number += text.count("\n") + (0 if text.endswith("\n") else 1)
+        return True
+
+    def _check_header(self, row):
+        header = [col.strip() for col in row]
+        missing_cols = [col for col in self.required_columns if col not in header]
+        if missing_cols:
+            logger.error(f"Missing columns: {missing_cols}")
+            raise CsvValidationError(f"CSV must contain columns: {', '.join(self.required_columns)}")
+        self.header = header
+        self._quantity_index = header.index("quantity")
+        self._product_index = header.index("product_id") if "product_id" in header else None
+        self._date_index = header.index("date") if "date" in header else None
+
+    def _check_row(self, row):
+        if len(row) != len(self.header):
+            raise CsvValidationError(
+                f"Invalid CSV format: expected {len(self.header)} fields in line {self._line_number}, saw {len(row)}"
+            )
+        try:
+            float(row[self._quantity_index])
+        except ValueError:
+            raise CsvValidationError(
+                f"Invalid CSV format: quantity '{row[self._quantity_index]}' in line {self._line_number} is not a number"
+            )
+        if self._product_index is not None:
+            self.products.add(row[self._product_index].strip())
+        if self._date_index is not None:
+            self.dates.add(row[self._date_index].strip())
+
+    @property
+    def content_hash(self) -> str:
+        return self._sha256.hexdigest()
@@ -0,0 +1,198 @@
+import os
+import logging
+from statistics import NormalDist
+import numpy as np
+import pandas as pd
+from api.fast_forecast import INTERVAL_Z
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Inventory policy defaults (per-product policies override them)
+LEAD_TIME_DAYS = 7  # Assumed lead time
+LEAD_TIME_STD_DAYS = float(os.getenv("STOCKIQ_LEAD_TIME_STD_DAYS", "0"))  # Lead time variability
+SERVICE_LEVEL = float(os.getenv("STOCKIQ_SERVICE_LEVEL", "0.95"))  # Chance of not stocking out before a replenishment arrives
+REVIEW_PERIOD_DAYS = float(os.getenv("STOCKIQ_REVIEW_PERIOD_DAYS", "7"))  # Days of demand an order covers without order costs
+POLICY_DEFAULTS = {
+    "lead_time_days": LEAD_TIME_DAYS,
+    "lead_time_std_days": LEAD_TIME_STD_DAYS,
+    "service_level": SERVICE_LEVEL,
+    "review_period_days": REVIEW_PERIOD_DAYS,
+    "order_cost": np.nan,  # Cost per order; with holding_cost enables the EOQ
+    "holding_cost": np.nan  # Cost of holding one unit for a year
+}
+SIMULATION_CHUNK_DRAWS = int(os.getenv("STOCKIQ_SIMULATION_CHUNK_DRAWS", "1000000"))  # Monte Carlo draws held in memory at once
+LEAD_TIME_TAIL_STDS = 4  # Lead time standard deviations the demand matrix extends past the mean
+
+
+def inventory_config() -> dict:
+    """Default policy settings, part of the forecast cache key."""
+    return {name: value for name, value in POLICY_DEFAULTS.items() if not pd.isna(value)}
+
+
+def _policy_arrays(products: pd.Index, policy: pd.DataFrame = None) -> dict:
+    # One array per policy setting, aligned to products; missing values take the defaults
+    if policy is not None and len(policy):
+        unknown = set(policy.columns) - set(POLICY_DEFAULTS) - {"product_id"}
+        if unknown:
+            raise ValueError(f"Unknown inventory policy columns: {', '.join(sorted(unknown))}")
+        policy = policy.drop_duplicates("product_id", keep="last")
+        policy = policy.set_index(policy["product_id"].astype(str).to_numpy())
+        policy = policy.reindex(products.astype(str))
+    arrays = {}
+    for name, default in POLICY_DEFAULTS.items():
+        values = policy[name].to_numpy(dtype="float64") if policy is not None and name in policy.columns else np.full(len(products), np.nan)
+        arrays[name] = np.where(np.isnan(values), default, values)
+    if (arrays["lead_time_days"] < 0).any() or (arrays["lead_time_std_days"] < 0).any():
+        raise ValueError("Lead times and their standard deviations must not be negative")
+    if ((arrays["service_level"] <= 0) | (arrays["service_level"] >= 1)).any():
+        raise ValueError("Service levels must be between 0 and 1 (exclusive)")
+    if (arrays["review_period_days"] < 0).any():
+        raise ValueError("Review periods must not be negative")
+    return arrays
+
+
+def _service_z(service_level: np.ndarray) -> np.ndarray:
+    # Standard normal quantiles, computed once per distinct service level
+    levels, inverse = np.unique(service_level, return_inverse=True)
+    return np.array([NormalDist().inv_cdf(level) for level in levels])[inverse]
+
+
+def _daily_demand(forecast_df: pd.DataFrame, codes: np.ndarray, n_products: int, last_date, horizon: int, min_days: float):
+    # products x days matrices of the mean and variance of future daily demand, as
+    # cumulative sums with a leading zero column: cum[:, k] covers the first k days
+    if last_date is not None:
+        future = (forecast_df["ds"] > pd.Timestamp(last_date)).to_numpy()
+    else:
+        future = (forecast_df.groupby(codes, sort=False).cumcount(ascending=False) < horizon).to_numpy()
+    codes = codes[future]
+    day = pd.Series(codes).groupby(codes, sort=False).cumcount().to_numpy()
+    yhat = forecast_df["yhat"].to_numpy(dtype="float64")[future]
+    # Intervals are INTERVAL_Z standard deviations wide on each side; the upper half is never clipped at zero
+    sigma = np.maximum(forecast_df["yhat_upper"].to_numpy(dtype="float64")[future] - yhat, 0.0) / INTERVAL_Z
+
+    n_days = np.bincount(codes, minlength=n_products)
+    width = max(int(n_days.max(initial=0)), int(np.ceil(min_days)), 1)
+    mean = np.zeros((n_products, width))
+    variance = np.zeros((n_products, width))
+    mean[codes, day] = np.maximum(yhat, 0.0)
+    variance[codes, day] = sigma ** 2
+    # Days past the forecast horizon continue at the product's average day
+    beyond = np.arange(width)[None, :] >= n_days[:, None]
+    available = np.maximum(n_days, 1)[:, None]
+    mean = np.where(beyond, mean.sum(axis=1, keepdims=True) / available, mean)
+    variance = np.where(beyond, variance.sum(axis=1, keepdims=True) / available, variance)
+    zeros = np.zeros((n_products, 1))
+    return np.hstack([zeros, mean.cumsum(axis=1)]), np.hstack([zeros, variance.cumsum(axis=1)])
+
+
+def _cumulative_at(cum: np.ndarray, days: np.ndarray) -> np.ndarray:
+    # Interpolate each row's cumulative sum at a (possibly fractional) number of days;
+    # days has one row per product and any number of columns
+    days = np.clip(days, 0, cum.shape[1] - 1)
+    low = np.floor(days).astype(np.int64)
+    high = np.minimum(low + 1, cum.shape[1] - 1)
+    low_values = np.take_along_axis(cum, low, axis=1)
+    return low_values + (days - low) * (np.take_along_axis(cum, high, axis=1) - low_values)
+
+
+def _simulate(cum_mean, cum_var, policy, simulations: int, seed: int):
+    # Batched Monte Carlo: sample each product's lead time, then its demand over that
+    # lead time (normal, from the summed daily means and variances, floored at zero)
+    rng = np.random.default_rng(seed)
+    n = len(cum_mean)
+    lead_time_demand = np.empty(n)
+    reorder_point = np.empty(n)
+    demand_std = np.empty(n)
+    chunk = max(1, SIMULATION_CHUNK_DRAWS // simulations)
+    for start in range(0, n, chunk):
+        rows = slice(start, min(start + chunk, n))
+        shape = (rows.stop - start, simulations)
+        lead = policy["lead_time_days"][rows, None]
+        if policy["lead_time_std_days"][rows].any():
+            lead = np.maximum(lead + policy["lead_time_std_days"][rows, None] * rng.standard_normal(shape, dtype=np.float32), 0.0)
+        # Fixed lead times keep one column here and broadcast against the demand draws
+        demand = _cumulative_at(cum_mean[rows], lead) + np.sqrt(_cumulative_at(cum_var[rows], lead)) * rng.standard_normal(shape, dtype=np.float32)
+        np.maximum(demand, 0.0, out=demand)
+        lead_time_demand[rows] = demand.mean(axis=1)
+        demand_std[rows] = demand.std(axis=1)
+        quantile = np.clip(np.ceil(policy["service_level"][rows] * simulations).astype(np.int64) - 1, 0, simulations - 1)
+        if (quantile == quantile[0]).all():
+            # One service level: a partial sort around its rank is enough
+            reorder_point[rows] = np.partition(demand, quantile[0], axis=1)[:, quantile[0]]
+        else:
+            demand.sort(axis=1)
+            reorder_point[rows] = demand[np.arange(rows.stop - start), quantile]
+    return lead_time_demand, demand_std, reorder_point
+
+
+def optimize_inventory(
+    forecast_df: pd.DataFrame,
+    last_date=None,
+    horizon: int = None,
+    policy: pd.DataFrame = None,
+    simulations: int = 0,
+    seed: int = 0
+) -> pd.DataFrame:
+    """Safety stock, reorder points and order quantities for every product at once.
+
+    forecast_df has the ds/yhat/yhat_lower/yhat_upper/product_id columns
+    of the forecasting engines. Future days are those after last_date or,
+    without it, the last horizon rows of each product (as in a stored
+    forecast). Daily demand is taken as independent normals with mean yhat
+    and the standard deviation implied by the forecast interval; lead times
+    beyond the forecast continue at the product's average day.
+
+    policy optionally holds per-product lead_time_days, lead_time_std_days,
+    service_level, review_period_days, order_cost and holding_cost; missing
+    products and values use the defaults. Lead-time demand combines demand
+    and lead time variability, and the reorder point covers the service
+    level quantile of it. With simulations > 0 that distribution is
+    sampled instead, in batches of products. The order quantity is the EOQ
+    where order and holding costs are given, else the review period's
+    expected demand.
+    """
+    if last_date is None and not horizon:
+        raise ValueError("Either last_date or horizon is needed to find the future days")
+    if simulations < 0:
+        raise ValueError("simulations must not be negative")
+    codes, products = pd.factorize(forecast_df["product_id"])
+    policy = _policy_arrays(pd.Index(products), policy)
+    longest = max(
+        (policy["lead_time_days"] + LEAD_TIME_TAIL_STDS * policy["lead_time_std_days"]).max(initial=0),
+        policy["review_period_days"].max(initial=0)
+    )
+    cum_mean, cum_var = _daily_demand(forecast_df, codes, len(products), last_date, horizon, longest)
+    lead_time = policy["lead_time_days"][:, None]
+
+    if simulations:
+        lead_time_demand, demand_std, reorder_point = _simulate(cum_mean, cum_var, policy, simulations, seed)
+        safety_stock = np.maximum(reorder_point - lead_time_demand, 0.0)
+        reorder_point = lead_time_demand + safety_stock
+    else:
+        lead_time_demand = _cumulative_at(cum_mean, lead_time)[:, 0]
+        daily_mean = np.divide(lead_time_demand, lead_time[:, 0], out=np.zeros(len(products)), where=lead_time[:, 0] > 0)
+        # Var(demand over L) = E[L] Var(daily) + E[daily]^2 Var(L), with the daily variances summed over the lead time
+        demand_std = np.sqrt(_cumulative_at(cum_var, lead_time)[:, 0] + daily_mean ** 2 * policy["lead_time_std_days"] ** 2)
+        safety_stock = np.maximum(_service_z(policy["service_level"]) * demand_std, 0.0)
+        reorder_point = lead_time_demand + safety_stock
+
+    # Annual demand at the forecast's average daily rate feeds the EOQ
+    annual_demand = cum_mean[:, -1] / (cum_mean.shape[1] - 1) * 365
+    has_costs = ~np.isnan(policy["order_cost"]) & (policy["holding_cost"] > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        eoq = np.sqrt(2 * annual_demand * policy["order_cost"] / policy["holding_cost"])
+    review_demand = _cumulative_at(cum_mean, policy["review_period_days"][:, None])[:, 0]
+    order_quantity = np.where(has_costs, eoq, review_demand)
+
+    return pd.DataFrame({
+        "product_id": products,
+        "lead_time_demand": lead_time_demand.round(2),
+        "safety_stock": safety_stock.round(2),
+        "reorder_point": reorder_point.round(2),
+        "order_quantity": order_quantity.round(2),
+        "demand_std": demand_std.round(2),
+        "lead_time_days": policy["lead_time_days"],
+        "service_level": policy["service_level"]
+    })
@@ -0,0 +1,163 @@
+import os
+import uuid
+import logging
+import threading
+import contextvars
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from fastapi import HTTPException
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Job settings
+JOB_WORKERS = int(os.getenv("STOCKIQ_JOB_WORKERS", "2"))  # Jobs running at the same time
+JOB_QUEUE_SIZE = int(os.getenv("STOCKIQ_JOB_QUEUE_SIZE", "16"))  # Jobs waiting for a worker
+JOB_RETENTION = int(os.getenv("STOCKIQ_JOB_RETENTION", "100"))  # Finished jobs kept for polling
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised inside a job when cancellation has been requested."""
+
+
+class QueueFullError(Exception):
+    """Raised when the job queue has reached its depth limit."""
+
+
+class Job:
+    def __init__(self, kind: str, params: dict):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params
+        self.state = QUEUED
+        self.created_at = datetime.utcnow()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = {"completed": 0, "total": None}
+        self.result = None
+        self.error = None
+        self.status_code = None
+        self.cancel_event = threading.Event()
+        self.future = None
+
+    def update_progress(self, completed: int, total: int):
+        self.progress = {"completed": completed, "total": total}
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+    def to_dict(self) -> dict:
+        """Status payload for polling; bulky result records are left out."""
+        status = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "state": self.state,
+            "params": self.params,
+            "progress": self.progress,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+        if self.result is not None:
+            status["result"] = {k: v for k, v in self.result.items() if k not in ("forecast", "inventory")}
+        if self.error is not None:
+            status["error"] = self.error
+        return status
+
+
+class JobManager:
+    """Runs jobs on a bounded thread pool, off the event loop."""
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_queue: int = JOB_QUEUE_SIZE, retention: int = JOB_RETENTION):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stockiq-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _active_count(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.state not in FINISHED_STATES)
+
+    def _prune(self):
+        # Drop the oldest finished jobs beyond the retention limit
+        finished = [job_id for job_id, job in self._jobs.items() if job.state in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.retention)]:
+            del self._jobs[job_id]
+
+    def submit(self, kind: str, params: dict, fn, *args, **kwargs) -> Job:
+        """Queue fn(job, *args, **kwargs); raises QueueFullError when saturated."""
+        with self._lock:
+            if self._active_count() >= self.max_workers + self.max_queue:
+                raise QueueFullError(f"Job queue is full ({self.max_queue} queued jobs)")
+            job = Job(kind, params)
+            self._jobs[job.id] = job
+            self._prune()
+            # Run in a copy of the caller's context so the job's timing spans join the request trace
+            job.future = self._executor.submit(contextvars.copy_context().run, self._run, job, fn, *args, **kwargs)
+        logger.info(f"Queued {kind} job {job.id}")
+        return job
+
+    def _run(self, job: Job, fn, *args, **kwargs):
+        if job.cancel_event.is_set():
+            job.state = CANCELLED
+            job.finished_at = datetime.utcnow()
+            return
+        job.state = RUNNING
+        job.started_at = datetime.utcnow()
+        logger.info(f"Started {job.kind} job {job.id}")
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.state = SUCCEEDED
+        except JobCancelled:
+            logger.info(f"Cancelled {job.kind} job {job.id}")
+            job.state = CANCELLED
+        except HTTPException as e:
+            job.status_code = e.status_code
+            job.error = e.detail
+            job.state = FAILED
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}")
+            job.status_code = 500
+            job.error = f"Internal server error: {str(e)}"
+            job.state = FAILED
+        finally:
+            job.finished_at = datetime.utcnow()
+            logger.info(f"Finished {job.kind} job {job.id} ({job.state})")
+
+    def get(self, job_id: str):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str):
+        """Request cancellation; queued jobs never start, running jobs stop at the next product."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if job.state not in FINISHED_STATES:
+            job.cancel_event.set()
+            if job.future is not None and job.future.cancel():
+                job.state = CANCELLED
+                job.finished_at = datetime.utcnow()
+        return job
+
+    def stats(self) -> dict:
+        states = [job.state for job in self._jobs.values()]
+        return {
+            "queued": states.count(QUEUED),
+            "running": states.count(RUNNING),
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue
+        }
+
+
+job_manager = JobManager()
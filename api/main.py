@@ -1,19 +1,80 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from api.routes import data
-from api.auth import get_current_user, create_access_token, verify_password, get_user
+from api.auth import get_admin_user, get_current_user, create_access_token, verify_password, get_user, auth_cache_stats, revoke_user
+from api.cache import forecast_cache
+from api.compression import CompressionMiddleware
+from api.jobs import job_manager
+from api.metrics import registry, request_latency, server_timing, start_trace
+from api.model_store import model_store
+from api.profiling import PROFILE_HEADER, PROFILING_ENABLED, profile_store
+from api.startup import startup
+from contextlib import asynccontextmanager
+import json
+import time
 import logging
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start warming up in the background; / answers right away and /ready once warm
+    startup.begin()
+    yield
+
 app = FastAPI(
     title="StockIQ API",
     description="Backend for StockIQ: TimeLLM-powered supply chain optimization",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
+# Scrape-time gauges from the stats the caches and job manager already keep
+registry.add_collector("stockiq_forecast_cache", forecast_cache.stats)
+registry.add_collector("stockiq_model_store", lambda: model_store.stats() if model_store is not None else None)
+registry.add_collector("stockiq_auth_cache", auth_cache_stats)
+registry.add_collector("stockiq_jobs", job_manager.stats)
+registry.add_collector("stockiq_startup", startup.stats)
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    # Latency is measured until the response starts; streamed bodies are not included
+    trace = start_trace()
+    profiler = None
+    if PROFILING_ENABLED and request.headers.get(PROFILE_HEADER) == "1":
+        profiler = profile_store.start()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        duration = time.perf_counter() - start
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        request_latency.observe(duration, method=request.method, route=route_path, status=status_code)
+        if profiler is not None:
+            profile_id = profile_store.finish(profiler, f"{request.method} {request.url.path}")
+    if profiler is not None:
+        response.headers["X-StockIQ-Profile-Id"] = profile_id
+    if trace:
+        response.headers["Server-Timing"] = server_timing(trace)
+        logger.info(json.dumps({
+            "method": request.method,
+            "route": route_path,
+            "status": status_code,
+            "ms": round(duration * 1000, 3),
+            "spans": trace
+        }))
+    return response
+
+# Compress responses for clients that accept gzip or br; added last so it
+# wraps the metrics middleware and latency excludes compression time
+app.add_middleware(CompressionMiddleware)
+
 # Include routes with authentication
 app.include_router(data.router, dependencies=[Depends(get_current_user)])
 
@@ -33,4 +94,33 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
         )
     access_token = create_access_token(data={"sub": form_data.username})
     logger.info(f"User {form_data.username} logged in successfully")
-    return {"access_token": access_token, "token_type": "bearer"}
\ No newline at end of file
+    return {"access_token": access_token, "token_type": "bearer"}
+
+@app.post("/auth/users/{username}/revoke")
+async def revoke_user_credentials(username: str, admin=Depends(get_admin_user)):
+    # Run after removing or changing the user in the secret so cached tokens stop working now
+    revoke_user(username)
+    logger.info(f"Admin {admin.username} revoked cached credentials of {username}")
+    return {"message": f"Revoked cached credentials of {username}"}
+
+@app.get("/auth/cache/stats", dependencies=[Depends(get_current_user)])
+async def get_auth_cache_stats():
+    return auth_cache_stats()
+
+@app.get("/ready")
+async def readiness():
+    # Readiness probe: 503 until startup and the optional warm-up have finished
+    stats = startup.stats()
+    return JSONResponse({"status": "ready" if startup.ready else "starting", **stats}, status_code=200 if startup.ready else 503)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Unauthenticated like other scrape targets; exposes only counts and timings
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/profiles/{profile_id}", response_class=PlainTextResponse, dependencies=[Depends(get_current_user)])
+async def get_profile(profile_id: str):
+    profile = profile_store.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profile["folded"])
@@ -0,0 +1,203 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Metrics settings
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+FIT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0)
+TRACE_MAX_SPANS = int(os.getenv("STOCKIQ_TRACE_MAX_SPANS", "200"))  # Spans kept per request for logs and Server-Timing
+
+# Spans recorded by the current request; run_in_threadpool and the job workers copy the context
+_trace = contextvars.ContextVar("stockiq_trace", default=None)
+
+
+def _format_labels(names, values, extra: dict = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with a fixed set of label names."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _format_labels(self.labelnames, key), value) for key, value in sorted(self._values.items())]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with a fixed set of label names."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in sorted(self._values.items())]
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                samples.append((f"{self.name}_bucket", _format_labels(self.labelnames, key, {"le": _format_value(bound)}), cumulative))
+            samples.append((f"{self.name}_sum", _format_labels(self.labelnames, key), total))
+            samples.append((f"{self.name}_count", _format_labels(self.labelnames, key), cumulative))
+        return samples
+
+
+def _flatten_stats(prefix: str, stats: dict, labels: dict = None):
+    # Numeric leaves become gauges; one level of dicts-of-dicts (e.g. cache namespaces) becomes a label
+    for key, value in stats.items():
+        if isinstance(value, bool) or value is None:
+            continue
+        if isinstance(value, (int, float)):
+            yield f"{prefix}_{key}", labels or {}, value
+        elif isinstance(value, dict):
+            if value and all(isinstance(child, dict) for child in value.values()):
+                for label, child in value.items():
+                    yield from _flatten_stats(f"{prefix}_{key}", child, dict(labels or {}, name=label))
+            else:
+                yield from _flatten_stats(f"{prefix}_{key}", value, labels)
+
+
+class MetricsRegistry:
+    """Counters, histograms and stats collectors rendered in the Prometheus text format.
+
+    Collectors are callables returning the stats dicts the caches and job
+    manager already keep; they are read at scrape time and exposed as
+    gauges, so those components need no metrics code of their own.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name: str, documentation: str, labelnames=()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, prefix: str, collect):
+        self._collectors.append((prefix, collect))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_format_value(value)}" for name, labels, value in metric.samples())
+        for prefix, collect in self._collectors:
+            try:
+                stats = collect()
+            except Exception as e:
+                logger.error(f"Metrics collector {prefix} failed: {str(e)}")
+                continue
+            if not stats:
+                continue
+            seen = set()
+            for name, labels, value in _flatten_stats(prefix, stats):
+                if name not in seen:
+                    lines.append(f"# TYPE {name} gauge")
+                    seen.add(name)
+                lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+request_latency = registry.histogram(
+    "stockiq_http_request_duration_seconds", "HTTP request latency until the response starts", ("method", "route", "status")
+)
+stage_latency = registry.histogram("stockiq_stage_duration_seconds", "Time spent in each pipeline stage", ("stage",))
+product_fit_seconds = registry.histogram("stockiq_product_fit_seconds", "Prophet fit time per product", ("start",), FIT_BUCKETS)
+product_predict_seconds = registry.histogram("stockiq_product_predict_seconds", "Prophet predict time per product", (), FIT_BUCKETS)
+rows_processed = registry.counter("stockiq_rows_processed_total", "Sales rows processed", ("operation",))
+products_forecast = registry.counter("stockiq_products_total", "Products per forecast outcome", ("outcome",))
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """Time a pipeline stage into the stage histogram and the current request's trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        stage_latency.observe(duration, stage=stage)
+        trace = _trace.get()
+        if trace is not None and len(trace) < TRACE_MAX_SPANS:
+            trace.append(dict(attributes, stage=stage, ms=round(duration * 1000, 3)))
+
+
+def start_trace() -> list:
+    trace = []
+    _trace.set(trace)
+    return trace
+
+
+def server_timing(trace: list) -> str:
+    """Server-Timing header value with the total time of each stage in the trace."""
+    totals = {}
+    for entry in trace:
+        totals[entry["stage"]] = totals.get(entry["stage"], 0.0) + entry["ms"]
+    return ", ".join(f"{stage};dur={ms:.1f}" for stage, ms in totals.items())
+
+
+def observe_product_fit(result: dict, warm: bool):
+    # Timings are measured where the product was fit, which may be a worker process
+    timings = result.get("timings")
+    if not timings:
+        return
+    product_fit_seconds.observe(timings["fit"], start="warm" if warm else "cold")
+    product_predict_seconds.observe(timings["predict"])
@@ -0,0 +1,144 @@
+import os
+import pickle
+import logging
+import tempfile
+import threading
+from datetime import datetime, timezone
+import pandas as pd
+from api.cache import hash_key
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Model store settings
+MODEL_STORE_DIR = os.getenv("STOCKIQ_MODEL_STORE_DIR", os.path.join(tempfile.gettempdir(), "stockiq-models"))  # Empty disables the store
+FIT_MODES = ("incremental", "full")
+DEFAULT_FIT_MODE = os.getenv("STOCKIQ_FIT_MODE", "incremental")
+MAX_WARM_STARTS = int(os.getenv("STOCKIQ_MAX_WARM_STARTS", "30"))  # Warm starts in a row before a cold refit is forced
+MAX_HISTORY_GROWTH = float(os.getenv("STOCKIQ_MAX_HISTORY_GROWTH", "0.5"))  # Growth since the last cold fit that forces a cold refit
+SCALAR_PARAMS = ("k", "m", "sigma_obs")
+
+
+def history_hash(df_product: pd.DataFrame) -> str:
+    # Order-independent hash of a product's rows, so reshuffled files still match
+    rows = df_product.sort_values(["ds", "y"])
+    return hash_key(pd.util.hash_pandas_object(rows, index=False).values.tobytes())
+
+
+def fitted_params(model) -> dict:
+    """Flatten the MAP parameters of a fitted Prophet model for storage."""
+    return {name: value.reshape(-1).copy() for name, value in model.params.items()}
+
+
+def init_params(params: dict) -> dict:
+    """Turn stored parameters into the init Prophet passes to Stan."""
+    return {name: float(value[0]) if name in SCALAR_PARAMS else value for name, value in params.items()}
+
+
+class ModelStore:
+    """Fitted Prophet state for every product, persisted between forecast runs.
+
+    Each product keeps its last parameters, forecast and a hash of the
+    history they were fitted on. plan() decides per product whether the
+    stored forecast can be reused (history unchanged), the fit can be warm
+    started from the stored parameters (rows were only appended) or a cold
+    fit is needed. Scopes keep filtered runs from overwriting the state of
+    unfiltered ones.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._stats = {"reuse": 0, "warm": 0, "cold": 0, "cold_reasons": {}}
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, scope: str, product) -> str:
+        key = hash_key(scope, repr(product))
+        return os.path.join(self.directory, key[:2], f"{key}.pkl")
+
+    def get(self, scope: str, product):
+        try:
+            with open(self._path(scope, product), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, pickle.UnpicklingError, EOFError) as e:
+            logger.error(f"Ignoring unreadable model state for product {product}: {str(e)}")
+            return None
+
+    def put(self, scope: str, product, state: dict):
+        path = self._path(scope, product)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so readers never see partial state
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Failed to store model state for product {product}: {str(e)}")
+
+    def plan(self, scope: str, product, df_product: pd.DataFrame, config_hash: str, fit_mode: str, periods: int = None) -> dict:
+        """Decide how to forecast a product: "reuse", "warm" or "cold".
+
+        A stored forecast is only reused for the horizon it was made for;
+        another horizon warm starts from the stored parameters instead.
+        """
+        rows_hash = history_hash(df_product)
+        state = self.get(scope, product)
+        plan = {"action": "cold", "reason": None, "rows_hash": rows_hash, "state": state, "init": None, "periods": periods}
+        if state is None:
+            plan["reason"] = "new_product"
+        elif state["config_hash"] != config_hash:
+            plan["reason"] = "config_changed"
+        elif fit_mode == "full":
+            plan["reason"] = "full_refit"
+        elif state["rows_hash"] == rows_hash and state.get("periods") == periods:
+            plan["action"] = "reuse"
+        elif state["rows_hash"] == rows_hash:
+            # Same history, other horizon: the stored fit only needs to be re-predicted
+            plan["action"] = "warm"
+            plan["init"] = init_params(state["params"])
+        elif history_hash(df_product[df_product["ds"] <= state["history_end"]]) != state["rows_hash"]:
+            # Rows the stored fit was based on were edited or removed
+            plan["reason"] = "history_rewritten"
+        elif state["warm_starts"] >= MAX_WARM_STARTS:
+            plan["reason"] = "max_warm_starts"
+        elif len(df_product) > state["cold_rows"] * (1 + MAX_HISTORY_GROWTH):
+            # Changepoints have moved too far for the stored trend to be a useful start
+            plan["reason"] = "history_growth"
+        else:
+            plan["action"] = "warm"
+            plan["init"] = init_params(state["params"])
+        with self._lock:
+            self._stats[plan["action"]] += 1
+            if plan["reason"]:
+                reasons = self._stats["cold_reasons"]
+                reasons[plan["reason"]] = reasons.get(plan["reason"], 0) + 1
+        return plan
+
+    def record(self, scope: str, product, df_product: pd.DataFrame, config_hash: str, plan: dict, result: dict):
+        """Persist the state of a product that was just fitted according to plan."""
+        warm = plan["action"] == "warm"
+        previous = plan["state"]
+        self.put(scope, product, {
+            "product_id": product,
+            "config_hash": config_hash,
+            "params": result["params"],
+            "forecast": result["forecast"],
+            "periods": plan["periods"],
+            "rows_hash": plan["rows_hash"],
+            "history_end": df_product["ds"].max(),
+            "rows": len(df_product),
+            "cold_rows": previous["cold_rows"] if warm else len(df_product),
+            "warm_starts": previous["warm_starts"] + 1 if warm else 0,
+            "fitted_at": datetime.now(timezone.utc).isoformat()
+        })
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, cold_reasons=dict(self._stats["cold_reasons"]), directory=self.directory)
+
+
+model_store = ModelStore(MODEL_STORE_DIR) if MODEL_STORE_DIR else None
@@ -1,7 +1,47 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+from datetime import date
 
 class SalesData(BaseModel):
     date: str
     product_id: str
-    quantity: int
\ No newline at end of file
+    quantity: int
+
+class ForecastJobRequest(BaseModel):
+    filename: Optional[str] = None  # None forecasts the merged sales history
+    execution: Optional[str] = None
+    workers: Optional[int] = None
+    chunk_size: Optional[int] = None
+    use_cache: bool = True
+    product_ids: Optional[List[str]] = None
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    export_csv: bool = False
+    engine: Optional[str] = None
+    top_n: Optional[int] = None
+    fast_method: str = "auto"
+    fit_mode: Optional[str] = None
+    out_of_core: Optional[bool] = None  # None decides by input size
+    horizon: Optional[int] = None  # Days forecast; None uses the default horizon
+
+class InventoryPolicy(BaseModel):
+    product_id: str
+    lead_time_days: Optional[float] = None
+    lead_time_std_days: Optional[float] = None
+    service_level: Optional[float] = None
+    review_period_days: Optional[float] = None
+    order_cost: Optional[float] = None
+    holding_cost: Optional[float] = None
+
+class InventoryRequest(BaseModel):
+    forecast_path: str  # A stored forecast, e.g. forecast_s3_path of a forecast response
+    history_end: Optional[date] = None  # Last history day; None takes the last horizon days of each product
+    horizon: Optional[int] = None  # Days the stored forecast runs past the history; None uses the default horizon
+    product_ids: Optional[List[str]] = None
+    lead_time_days: Optional[float] = None  # Defaults for products without a policy
+    lead_time_std_days: Optional[float] = None
+    service_level: Optional[float] = None
+    review_period_days: Optional[float] = None
+    policies: Optional[List[InventoryPolicy]] = None
+    simulations: int = 0  # Monte Carlo samples per product; 0 uses the closed form
+    seed: int = 0
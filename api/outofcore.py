@@ -0,0 +1,231 @@
+import os
+import shutil
+import logging
+import tempfile
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from api.columnar import PARQUET_COMPRESSION, frame_from_table
+from api.forecasting import DEFAULT_ENGINE, HYBRID_TOP_N, run_forecasts
+from api.ingest import UPLOAD_CHUNK_SIZE
+from api.metrics import rows_processed, span
+from utils.preprocess import prepare_sales_frame
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Out-of-core settings
+OUT_OF_CORE_BYTES = int(os.getenv("STOCKIQ_OUT_OF_CORE_BYTES", str(512 * 1024 * 1024)))  # Inputs larger than this are forecast out of core
+SPILL_DIR = os.getenv("STOCKIQ_SPILL_DIR", tempfile.gettempdir())
+SPILL_PARTITIONS = int(os.getenv("STOCKIQ_SPILL_PARTITIONS", "64"))
+SPILL_SCHEMA = pa.schema([
+    ("date", pa.date32()),
+    ("product_id", pa.string()),
+    ("quantity", pa.float64())
+])
+
+
+def _normalize_table(table: pa.Table) -> pa.Table:
+    # Bring Parquet and CSV batches to one schema so they can share a spill file
+    date = table["date"]
+    if not pa.types.is_date32(date.type):
+        date = pa.array(pd.to_datetime(date.to_pandas()).dt.date, pa.date32())
+    if date.null_count or table["quantity"].null_count:
+        raise ValueError("Data contains NaN values in date or quantity columns")
+    return pa.table({
+        "date": date,
+        "product_id": pc.cast(table["product_id"], pa.string()),
+        "quantity": pc.cast(table["quantity"], pa.float64())
+    }, schema=SPILL_SCHEMA)
+
+
+def _partition_of(products: pa.ChunkedArray, partitions: int) -> np.ndarray:
+    values = products.to_numpy(zero_copy_only=False).astype(object)
+    return (pd.util.hash_array(values, categorize=True) % partitions).astype(np.int64)
+
+
+class PartitionSpiller:
+    """Spill streamed sales rows into hash partitions by product on local disk.
+
+    Every product lands in exactly one partition file (Arrow IPC streams),
+    so partitions can be forecast one at a time with memory bounded by
+    the largest partition rather than the whole input. Also tracks the
+    total quantity of every product (in first-appearance order) and the
+    last sale date of the whole input.
+    """
+
+    def __init__(self, partitions: int = SPILL_PARTITIONS, directory: str = SPILL_DIR):
+        self.partitions = partitions
+        self.directory = tempfile.mkdtemp(prefix="stockiq-spill-", dir=directory)
+        self.rows = 0
+        self.volumes = {}
+        self.last_date = None
+        self._writers = {}
+        self._sinks = {}
+
+    @property
+    def partition_count(self) -> int:
+        return len(self._sinks)
+
+    def _path(self, partition: int) -> str:
+        return os.path.join(self.directory, f"part-{partition:05d}.arrow")
+
+    def add(self, table: pa.Table):
+        if not table.num_rows:
+            return
+        table = _normalize_table(table)
+        self.rows += table.num_rows
+        sums = table.group_by("product_id", use_threads=False).aggregate([("quantity", "sum")])
+        for product, quantity in zip(sums["product_id"].to_pylist(), sums["quantity_sum"].to_pylist()):
+            self.volumes[product] = self.volumes.get(product, 0.0) + quantity
+        batch_last = pc.max(table["date"]).as_py()
+        if batch_last is not None and (self.last_date is None or batch_last > self.last_date):
+            self.last_date = batch_last
+        partition_ids = _partition_of(table["product_id"], self.partitions)
+        for partition in np.unique(partition_ids):
+            if partition not in self._writers:
+                self._sinks[partition] = pa.OSFile(self._path(partition), "wb")
+                self._writers[partition] = pa.ipc.new_stream(self._sinks[partition], SPILL_SCHEMA)
+            self._writers[partition].write_table(table.filter(pa.array(partition_ids == partition)))
+
+    def finish(self):
+        for partition, writer in self._writers.items():
+            writer.close()
+            self._sinks[partition].close()
+        self._writers = {}
+
+    def __iter__(self):
+        """Yield each non-empty partition as a sales frame prepared like in-memory input.
+
+        Partitions go through utils.preprocess.prepare_sales_frame, so duplicate
+        (date, product_id) rows are summed exactly as run_forecast_job does for
+        inputs that fit in memory; a product's rows all land in one partition.
+        """
+        for partition in sorted(self._sinks):
+            with pa.memory_map(self._path(partition)) as source:
+                df = frame_from_table(pa.ipc.open_stream(source).read_all())
+            df, errors = prepare_sales_frame(df)
+            if errors:
+                raise ValueError(errors[0]["message"])
+            yield df
+
+    def close(self):
+        self.finish()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class SpooledOutput:
+    """Build an output Parquet file (and optionally CSV) on local disk, frame by frame."""
+
+    def __init__(self, export_csv: bool = False, directory: str = SPILL_DIR):
+        self.rows = 0
+        self._parquet = tempfile.TemporaryFile(dir=directory)
+        self._csv = tempfile.TemporaryFile(dir=directory) if export_csv else None
+        self._writer = None
+
+    def write(self, df: pd.DataFrame):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self._parquet, table.schema, compression=PARQUET_COMPRESSION)
+        self._writer.write_table(table.cast(self._writer.schema))
+        if self._csv is not None:
+            self._csv.write(df.to_csv(index=False, header=self.rows == 0).encode())
+        self.rows += len(df)
+
+    def _upload(self, storage, key: str, source):
+        source.seek(0)
+        writer = storage.writer(key)
+        try:
+            while True:
+                data = source.read(UPLOAD_CHUNK_SIZE)
+                if not data:
+                    break
+                writer.write(data)
+            writer.complete()
+        except Exception:
+            writer.abort()
+            raise
+
+    def store(self, storage, key: str) -> str:
+        """Stream the Parquet file to key (and the CSV next to it); returns the CSV key or None."""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._upload(storage, key, self._parquet)
+        if self._csv is None:
+            return None
+        csv_key = key[:-len(".parquet")] + ".csv"
+        self._upload(storage, csv_key, self._csv)
+        return csv_key
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._parquet.close()
+        if self._csv is not None:
+            self._csv.close()
+
+
+def run_forecasts_out_of_core(batches, forecast_output: SpooledOutput, progress_callback=None, cancel_check=None, **forecast_options) -> dict:
+    """Forecast a stream of sales batches without holding the whole input.
+
+    Batches are spilled to per-product hash partitions first; each
+    partition is then forecast with run_forecasts (same engines, cache and
+    model store options) and its forecast rows appended to forecast_output.
+    Inventory, which has one row per product, is returned in memory. The
+    forecast is grouped by partition rather than in first-appearance order.
+    The hybrid engine's top products are chosen by volume across the whole
+    input, not per partition.
+    """
+    spiller = PartitionSpiller()
+    try:
+        with span("spill"):
+            for table, _ in batches:
+                if cancel_check:
+                    cancel_check()
+                spiller.add(table)
+            spiller.finish()
+        rows_processed.inc(spiller.rows, operation="forecast")
+        total = len(spiller.volumes)
+        logger.info(f"Spilled {spiller.rows} rows of {total} products into {spiller.partition_count} partitions")
+        if (forecast_options.get("engine") or DEFAULT_ENGINE) == "hybrid":
+            volumes = pd.Series(spiller.volumes, dtype="float64")
+            forecast_options["prophet_products"] = set(volumes.nlargest(forecast_options.get("top_n") or HYBRID_TOP_N).index)
+
+        inventories = []
+        skipped_products = []
+        failed_products = []
+        completed = 0
+        for df in spiller:
+            done_before = completed
+
+            def partition_progress(partition_completed, partition_total):
+                if progress_callback:
+                    progress_callback(done_before + partition_completed, total)
+
+            results = run_forecasts(
+                df,
+                progress_callback=partition_progress,
+                cancel_check=cancel_check,
+                last_date=spiller.last_date,
+                **forecast_options
+            )
+            completed += df["product_id"].nunique()
+            skipped_products.extend(results["skipped_products"])
+            failed_products.extend(results["failed_products"])
+            if results["forecast"] is not None:
+                forecast_output.write(results["forecast"])
+                inventories.append(results["inventory"])
+            del df, results
+    finally:
+        spiller.close()
+
+    return {
+        "inventory": pd.concat(inventories, ignore_index=True) if inventories else None,
+        "forecast_rows": forecast_output.rows,
+        "skipped_products": skipped_products,
+        "failed_products": failed_products
+    }
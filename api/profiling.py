@@ -0,0 +1,96 @@
+import os
+import sys
+import uuid
+import logging
+import threading
+from collections import Counter, OrderedDict
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Profiler settings
+PROFILING_ENABLED = os.getenv("STOCKIQ_PROFILING", "0") == "1"  # Allow requests to ask for a profile
+PROFILE_HEADER = "x-stockiq-profile"
+PROFILE_INTERVAL_SECONDS = float(os.getenv("STOCKIQ_PROFILE_INTERVAL", "0.005"))
+PROFILE_MAX_DEPTH = 64
+PROFILE_RETENTION = int(os.getenv("STOCKIQ_PROFILE_RETENTION", "20"))  # Finished profiles kept for download
+
+
+class SamplingProfiler:
+    """Sample the Python stacks of every thread on an interval.
+
+    A request's work is spread over the event loop, the threadpool and the
+    job workers, so all threads are sampled; concurrent requests show up
+    in the same profile. Stacks are kept in the folded format
+    (frame;frame;frame count) that flame graph tools read. Prophet fits in
+    process-pool workers are not visible to the sampler.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.samples = 0
+        self._stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self._stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="stockiq-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        self._thread.join()
+        return "".join(f"{stack} {count}\n" for stack, count in self._stacks.most_common())
+
+
+class ProfileStore:
+    """Runs at most one profile at a time and keeps the latest results."""
+
+    def __init__(self, retention: int = PROFILE_RETENTION):
+        self.retention = retention
+        self._profiles = OrderedDict()
+        self._active = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """A started profiler, or None when another request is being profiled."""
+        with self._lock:
+            if self._active:
+                return None
+            self._active = True
+        profiler = SamplingProfiler()
+        profiler.start()
+        return profiler
+
+    def finish(self, profiler: SamplingProfiler, description: str) -> str:
+        folded = profiler.stop()
+        profile_id = uuid.uuid4().hex
+        with self._lock:
+            self._active = False
+            self._profiles[profile_id] = {"description": description, "samples": profiler.samples, "folded": folded}
+            while len(self._profiles) > self.retention:
+                self._profiles.popitem(last=False)
+        logger.info(f"Stored profile {profile_id} of {description} ({profiler.samples} samples)")
+        return profile_id
+
+    def get(self, profile_id: str):
+        with self._lock:
+            return self._profiles.get(profile_id)
+
+
+profile_store = ProfileStore()
@@ -1,11 +1,41 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
 import io
-import boto3
-from botocore.exceptions import ClientError
+import base64
+import asyncio
+import json
 import logging
-from datetime import datetime, timedelta
-from prophet import Prophet
+from datetime import date, datetime, timedelta
+from typing import List
+from api.forecasting import ENGINES, EXECUTION_MODES, FORECAST_PERIODS, LEAD_TIME_DAYS, MAX_FORECAST_PERIODS, model_config_hash, run_forecasts
+from api.fast_forecast import FAST_METHODS
+from api.cache import forecast_cache, hash_key
+from api.catalog import dataset_catalog
+from api.history import sales_history
+from api.metrics import products_forecast, rows_processed, span
+from api.model_store import FIT_MODES, model_store
+from api.columnar import (
+    SALES_COLUMNS,
+    CsvToParquetConverter,
+    iter_sales_batches,
+    limit_batches,
+    parquet_key,
+    read_sales_frame,
+    table_to_parquet_bytes
+)
+from api.ingest import REQUIRED_COLUMNS, UPLOAD_CHUNK_SIZE, CsvValidationError, StreamingCsvValidator
+from api.jobs import Job, JobCancelled, QueueFullError, SUCCEEDED, CANCELLED, job_manager
+from api.inventory import optimize_inventory
+from api.models.schemas import ForecastJobRequest, InventoryRequest
+from api.outofcore import OUT_OF_CORE_BYTES, SpooledOutput, run_forecasts_out_of_core
+from api.storage import ObjectNotFound, StorageError, storage
+from utils.preprocess import prepare_sales_frame
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -13,9 +43,36 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/data", tags=["data"])
 
-# Replace with your actual S3 bucket name
-BUCKET_NAME = "stockiq-data-pavan"  # Correct bucket name
-s3_client = boto3.client("s3")
+
+def _sales_key(filename: str) -> str:
+    # Validate filename
+    if not filename.endswith(".csv"):
+        logger.error(f"Invalid file format: {filename}")
+        raise HTTPException(status_code=400, detail="Only CSV files are supported")
+    
+    # Ensure filename includes sales_data/ prefix
+    return filename if filename.startswith("sales_data/") else f"sales_data/{filename}"
+
+def _store_parquet_copy(parquet_file, s3_filename: str):
+    # Stream the converted Parquet file to storage next to the CSV
+    key = parquet_key(s3_filename)
+    writer = storage.writer(key)
+    try:
+        while True:
+            data = parquet_file.read(UPLOAD_CHUNK_SIZE)
+            if not data:
+                break
+            writer.write(data)
+        writer.complete()
+        logger.info(f"Stored Parquet copy at {key} ({writer.bytes_written} bytes)")
+        return True
+    except StorageError as e:
+        # The CSV is already stored; reads fall back to it
+        logger.error(f"Failed to store Parquet copy {key}: {str(e)}")
+        writer.abort()
+        return False
+    finally:
+        parquet_file.close()
 
 @router.post("/upload")
 async def upload_sales_data(file: UploadFile = File(...)):
@@ -25,226 +82,678 @@ async def upload_sales_data(file: UploadFile = File(...)):
             logger.error(f"Invalid file format: {file.filename}")
             raise HTTPException(status_code=400, detail="Only CSV files are supported")
         
-        # Read file content
+        # Read the first chunk; the rest is streamed below
         logger.info(f"Processing file: {file.filename}")
-        content = await file.read()
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
         
         # Debug: Check file content
-        if not content:
+        if not chunk:
             logger.error("Received empty file")
             raise HTTPException(status_code=400, detail="Empty file uploaded")
         
-        logger.info(f"File size: {len(content)} bytes")
-        
-        # Parse CSV
-        try:
-            df = pd.read_csv(io.BytesIO(content))
-        except pd.errors.EmptyDataError:
-            logger.error("CSV file is empty or has no columns")
-            raise HTTPException(status_code=400, detail="No columns to parse from file")
-        except pd.errors.ParserError as e:
-            logger.error(f"CSV parsing error: {str(e)}")
-            raise HTTPException(status_code=400, detail=f"Invalid CSV format: {str(e)}")
-        
-        # Validate columns
-        required_columns = ["date", "product_id", "quantity"]
-        if not all(col in df.columns for col in required_columns):
-            missing_cols = [col for col in required_columns if col not in df.columns]
-            logger.error(f"Missing columns: {missing_cols}")
-            raise HTTPException(status_code=400, detail=f"CSV must contain columns: {', '.join(required_columns)}")
-        
-        # Generate unique S3 filename with format (e.g., sales_data/2025/07/03_1.csv)
+        # Reserve a unique object key in the catalog (e.g., sales_data/2025/07/03_1.csv)
         today = datetime.now()
         date_path = today.strftime("%Y/%m/%d")
+        s3_filename = await run_in_threadpool(dataset_catalog.allocate_key, date_path)
+        
+        # Validate and stream chunks to storage as they arrive, converting to Parquet on the way
+        logger.info(f"Streaming {s3_filename} to {storage.name} storage")
+        validator = StreamingCsvValidator(REQUIRED_COLUMNS)
+        converter = CsvToParquetConverter()
+        writer = storage.writer(s3_filename)
+        
+        def ingest_chunk(data: bytes):
+            converter.feed(validator.feed(data))
+            writer.write(data)
+        
         try:
-            response = s3_client.list_objects_v2(Bucket=BUCKET_NAME, Prefix=f"sales_data/{date_path}_")
-            file_count = len(response.get("Contents", [])) + 1 if response.get("Contents") else 1
-        except ClientError as e:
-            logger.error(f"Error listing S3 objects: {str(e)}")
-            file_count = 1
-        s3_filename = f"sales_data/{date_path}_{file_count}.csv"
-        
-        # Upload to S3
-        logger.info(f"Uploading {s3_filename} to S3 bucket: {BUCKET_NAME}")
-        try:
-            s3_client.upload_fileobj(
-                io.BytesIO(content),
-                BUCKET_NAME,
-                s3_filename
-            )
-        except ClientError as e:
-            logger.error(f"S3 upload error: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to upload to S3: {str(e)}")
+            while chunk:
+                await run_in_threadpool(ingest_chunk, chunk)
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+            converter.feed(validator.finish())
+            await run_in_threadpool(writer.complete)
+        except CsvValidationError as e:
+            logger.error(f"CSV validation error: {str(e)}")
+            converter.close()
+            await run_in_threadpool(writer.abort)
+            await run_in_threadpool(dataset_catalog.release, s3_filename)
+            raise HTTPException(status_code=400, detail=str(e))
+        except StorageError as e:
+            logger.error(f"Storage upload error: {str(e)}")
+            converter.close()
+            await run_in_threadpool(writer.abort)
+            await run_in_threadpool(dataset_catalog.release, s3_filename)
+            raise HTTPException(status_code=500, detail=f"Failed to upload to storage: {str(e)}")
+        
+        parquet_file = await run_in_threadpool(converter.finish)
+        parquet_stored = False
+        if parquet_file is not None:
+            parquet_stored = await run_in_threadpool(_store_parquet_copy, parquet_file, s3_filename)
         
-        logger.info(f"Successfully uploaded {s3_filename} with {len(df)} rows")
-        return {"message": f"Uploaded {file.filename} with {len(df)} rows to S3", "s3_filename": s3_filename}
+        # Record the dataset so it can be listed and planned without scanning storage
+        await run_in_threadpool(
+            dataset_catalog.record,
+            s3_filename,
+            validator.rows,
+            validator.products,
+            validator.dates,
+            writer.bytes_written,
+            validator.content_hash,
+            parquet_stored
+        )
+        
+        rows_processed.inc(validator.rows, operation="upload")
+        logger.info(f"File size: {writer.bytes_written} bytes")
+        logger.info(f"Successfully uploaded {s3_filename} with {validator.rows} rows")
+        return {"message": f"Uploaded {file.filename} with {validator.rows} rows to {storage.name} storage", "s3_filename": s3_filename}
     
-    except pd.errors.EmptyDataError as e:
-        logger.error(f"CSV parsing error: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"No columns to parse from file")
-    except pd.errors.ParserError as e:
-        logger.error(f"CSV parsing error: {str(e)}")
-        raise HTTPException(status_code=400, detail=f"Invalid CSV format: {str(e)}")
-    except ClientError as e:
-        logger.error(f"S3 upload error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Failed to upload to S3: {str(e)}")
+    except HTTPException:
+        raise
+    except StorageError as e:
+        logger.error(f"Storage upload error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to upload to storage: {str(e)}")
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@router.get("/storage")
+async def get_storage_info():
+    return storage.describe()
+
+@router.get("/datasets")
+async def list_datasets(
+    product_id: List[str] = Query(None, description="Only datasets containing any of these products"),
+    start_date: date = Query(None, description="Only datasets with rows on or after this date"),
+    end_date: date = Query(None, description="Only datasets with rows on or before this date"),
+    include_products: bool = Query(False, description="Include each dataset's full product list")
+):
+    try:
+        entries = await run_in_threadpool(dataset_catalog.list, product_id, start_date, end_date)
+    except StorageError as e:
+        logger.error(f"Catalog error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to read the dataset catalog: {str(e)}")
+    datasets = []
+    for entry in entries:
+        dataset = dict(entry, product_count=len(entry["products"]))
+        if not include_products:
+            del dataset["products"]
+        datasets.append(dataset)
+    return {"datasets": datasets, "count": len(datasets)}
+
+@router.get("/datasets/{filename:path}")
+async def get_dataset(filename: str):
+    try:
+        entry = await run_in_threadpool(dataset_catalog.get, _sales_key(filename))
+    except StorageError as e:
+        logger.error(f"Catalog error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to read the dataset catalog: {str(e)}")
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Dataset not found in catalog")
+    return entry
+
+GET_FORMATS = ("json", "ndjson", "arrow")
+MAX_PAGE_SIZE = 100000
+
+def _encode_cursor(row: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"row": int(row)}).encode()).decode()
+
+def _decode_cursor(cursor: str) -> int:
+    try:
+        return int(json.loads(base64.urlsafe_b64decode(cursor.encode()))["row"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def _table_for_output(table: pa.Table) -> pa.Table:
+    # Render dates as YYYY-MM-DD strings for JSON outputs
+    if "date" in table.column_names and pa.types.is_date(table.schema.field("date").type):
+        table = table.set_column(table.column_names.index("date"), "date", pc.cast(table["date"], pa.string()))
+    return table
+
+def _stream_ndjson(batches):
+    for table, _ in batches:
+        rows_processed.inc(table.num_rows, operation="get")
+        lines = _table_for_output(table).to_pandas().to_json(orient="records", lines=True)
+        yield (lines if lines.endswith("\n") else lines + "\n").encode()
+
+def _stream_arrow(batches):
+    sink = io.BytesIO()
+    writer = None
+    for table, _ in batches:
+        rows_processed.inc(table.num_rows, operation="get")
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, table.schema)
+        writer.write_table(table)
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    if writer is not None:
+        writer.close()
+        yield sink.getvalue()
+
 @router.get("/get/{filename:path}")
-async def get_sales_data(filename: str):
+async def get_sales_data(
+    filename: str,
+    columns: List[str] = Query(None, description=f"Columns to return (default: every column of the file, including {', '.join(SALES_COLUMNS)})"),
+    product_id: List[str] = Query(None, description="Only return rows for these products"),
+    start_date: date = Query(None, description="Only return rows on or after this date"),
+    end_date: date = Query(None, description="Only return rows on or before this date"),
+    limit: int = Query(None, ge=1, le=MAX_PAGE_SIZE, description="Page size; enables paginated responses"),
+    offset: int = Query(None, ge=0, description="Number of matching rows to skip"),
+    cursor: str = Query(None, description="Opaque cursor from a previous page's next_cursor"),
+    format: str = Query("json", description=f"Response format: {', '.join(GET_FORMATS)}")
+):
     try:
-        # Validate filename
-        if not filename.endswith(".csv"):
-            logger.error(f"Invalid file format: {filename}")
-            raise HTTPException(status_code=400, detail="Only CSV files are supported")
+        s3_key = _sales_key(filename)
+        if format not in GET_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(GET_FORMATS)}")
+        logger.info(f"Retrieving {s3_key} from {storage.name} storage")
+        
+        # Whole-file JSON list, as before pagination existed
+        if format == "json" and limit is None and offset is None and cursor is None:
+            df = await run_in_threadpool(read_sales_frame, storage, s3_key, columns, product_id, start_date, end_date)
+            rows_processed.inc(len(df), operation="get")
+            with span("serialize", output="records"):
+                if "date" in df.columns and pd.api.types.is_datetime64_any_dtype(df["date"]):
+                    df["date"] = df["date"].dt.strftime("%Y-%m-%d")
+                
+                # Convert DataFrame to JSON; empty values become null
+                return df.astype(object).where(df.notna(), None).to_dict(orient="records")
+        
+        start_row = _decode_cursor(cursor) if cursor else 0
+        batches = iter_sales_batches(storage, s3_key, columns, product_id, start_date, end_date, start_row=start_row)
+        
+        # Stream record batches as they are read
+        if format == "ndjson":
+            return StreamingResponse(_stream_ndjson(limit_batches(batches, offset or 0, limit)), media_type="application/x-ndjson")
+        if format == "arrow":
+            return StreamingResponse(_stream_arrow(limit_batches(batches, offset or 0, limit)), media_type="application/vnd.apache.arrow.stream")
         
-        # Ensure filename includes sales_data/ prefix
-        s3_key = filename if filename.startswith("sales_data/") else f"sales_data/{filename}"
-        logger.info(f"Retrieving {s3_key} from S3 bucket: {BUCKET_NAME}")
-        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=s3_key)
-        content = response["Body"].read()
-        df = pd.read_csv(io.BytesIO(content))
+        # One page of JSON; read one extra row to know whether another page exists
+        def read_page():
+            return list(limit_batches(batches, offset or 0, limit + 1))
         
-        # Convert DataFrame to JSON
-        return df.to_dict(orient="records")
+        page = await run_in_threadpool(read_page)
+        tables = [table for table, _ in page]
+        row_numbers = np.concatenate([rows for _, rows in page]) if page else np.array([], dtype=np.int64)
+        has_more = len(row_numbers) > limit
+        rows_processed.inc(min(len(row_numbers), limit), operation="get")
+        records = _table_for_output(pa.concat_tables(tables)).slice(0, limit).to_pylist() if tables else []
+        return {
+            "data": records,
+            "count": len(records),
+            "next_cursor": _encode_cursor(row_numbers[limit - 1] + 1) if has_more else None
+        }
     
-    except ClientError as e:
-        logger.error(f"S3 retrieval error: {str(e)}")
-        if e.response["Error"]["Code"] == "NoSuchKey":
-            raise HTTPException(status_code=404, detail="File not found in S3")
-        raise HTTPException(status_code=500, detail=f"Failed to retrieve from S3: {str(e)}")
+    except HTTPException:
+        raise
+    except ObjectNotFound:
+        logger.error(f"File not found: {filename}")
+        raise HTTPException(status_code=404, detail="File not found in storage")
+    except StorageError as e:
+        logger.error(f"Storage retrieval error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve from storage: {str(e)}")
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
-@router.get("/forecast/{filename:path}")
-async def forecast_sales_data(filename: str):
+# Output keys of history forecasts are derived from this pseudo upload key
+HISTORY_SOURCE_KEY = "sales_data/history.csv"
+
+def _validate_forecast_request(request: ForecastJobRequest) -> str:
+    # No filename means a forecast over the merged history of all uploads
+    s3_key = _sales_key(request.filename) if request.filename else None
+    
+    # Validate execution mode
+    if request.execution is not None and request.execution not in EXECUTION_MODES:
+        logger.error(f"Invalid execution mode: {request.execution}")
+        raise HTTPException(status_code=400, detail=f"Execution mode must be one of: {', '.join(EXECUTION_MODES)}")
+    
+    # Validate engine selection
+    if request.engine is not None and request.engine not in ENGINES:
+        logger.error(f"Invalid engine: {request.engine}")
+        raise HTTPException(status_code=400, detail=f"Engine must be one of: {', '.join(ENGINES)}")
+    if request.fast_method not in FAST_METHODS:
+        logger.error(f"Invalid fast method: {request.fast_method}")
+        raise HTTPException(status_code=400, detail=f"Fast method must be one of: {', '.join(FAST_METHODS)}")
+    if request.top_n is not None and request.top_n < 1:
+        raise HTTPException(status_code=400, detail="top_n must be at least 1")
+    if request.horizon is not None and not LEAD_TIME_DAYS <= request.horizon <= MAX_FORECAST_PERIODS:
+        raise HTTPException(status_code=400, detail=f"horizon must be between {LEAD_TIME_DAYS} and {MAX_FORECAST_PERIODS} days")
+    
+    # Validate fit mode
+    if request.fit_mode is not None and request.fit_mode not in FIT_MODES:
+        logger.error(f"Invalid fit mode: {request.fit_mode}")
+        raise HTTPException(status_code=400, detail=f"Fit mode must be one of: {', '.join(FIT_MODES)}")
+    
+    return s3_key
+
+def _output_key(s3_key: str, prefix: str, suffix: str, variant_hash: str = None) -> str:
+    # e.g. sales_data/2025/07/03_1.csv -> forecasts/2025/07/03_1_forecast.parquet
+    name = s3_key.replace("sales_data/", f"{prefix}/", 1)[:-len(".csv")] + f"_{suffix}"
+    if variant_hash:
+        name += f"_{variant_hash[:8]}"
+    return f"{name}.parquet"
+
+def _put_output(key: str, df: pd.DataFrame, export_csv: bool) -> str:
+    # Store an output frame as Parquet, and optionally as CSV next to it
+    with span("serialize", output="parquet"):
+        data = table_to_parquet_bytes(df)
+    storage.put(key, data)
+    if not export_csv:
+        return None
+    csv_key = key[:-len(".parquet")] + ".csv"
+    with span("serialize", output="csv"):
+        csv_buffer = io.StringIO()
+        df.to_csv(csv_buffer, index=False)
+        data = csv_buffer.getvalue().encode()
+    storage.put(csv_key, data)
+    return csv_key
+
+def _without_forecast(result: dict) -> dict:
+    # Pollers never see the forecast frame; the stored Parquet file is the result
+    return {key: value for key, value in result.items() if key != "forecast"}
+
+def run_forecast_job(job: Job, request: ForecastJobRequest, s3_key: str, keep_forecast: bool = False):
+    """Forecast pipeline run by the job workers; raises HTTPException on bad input.
+
+    With s3_key None the merged sales history is forecast instead of one
+    upload, after appending any uploads it does not include yet. The
+    forecast frame is only part of the result with keep_forecast, for
+    callers that return it inline.
+    """
+    filename = request.filename or "sales history"
+    use_cache = request.use_cache
+    periods = request.horizon or FORECAST_PERIODS
     try:
-        # Validate filename
-        if not filename.endswith(".csv"):
-            logger.error(f"Invalid file format: {filename}")
-            raise HTTPException(status_code=400, detail="Only CSV files are supported")
+        # Reuse the whole-file result if neither the object, the filters nor the model settings changed
+        config_hash = model_config_hash()
+        # Filters and non-default engine choices get their own cache entries and output keys
+        variant = {
+            "product_ids": request.product_ids,
+            "start_date": request.start_date,
+            "end_date": request.end_date,
+            "engine": request.engine if request.engine not in (None, "prophet") else None,
+            "top_n": request.top_n if request.engine == "hybrid" else None,
+            "fast_method": request.fast_method if request.engine in ("fast", "hybrid") else None,
+            "horizon": periods if periods != FORECAST_PERIODS else None
+        }
+        variant_hash = hash_key(json.dumps(variant, sort_keys=True, default=str)) if any(variant.values()) else None
+        if s3_key is None:
+            # The history version changes whenever uploads are appended to it
+            history = sales_history.refresh()
+            source_key, etag, source_size = HISTORY_SOURCE_KEY, history["version"], history["size"]
+        else:
+            head = storage.head(s3_key)
+            source_key, etag, source_size = s3_key, head["etag"], head["size"]
+        # Inputs too large to hold in memory are streamed and forecast partition by partition
+        out_of_core = request.out_of_core if request.out_of_core is not None else source_size > OUT_OF_CORE_BYTES
+        file_cache_key = hash_key(source_key, etag, config_hash, variant_hash, periods, request.export_csv, out_of_core)
+        if use_cache and request.fit_mode != "full":
+            cached = forecast_cache.get("file", file_cache_key)
+            if cached is not None:
+                logger.info(f"Serving cached forecast for {source_key}")
+                result = dict(cached, cached=True)
+                return result if keep_forecast else _without_forecast(result)
+        
+        forecast_options = {
+            "execution_mode": request.execution,
+            "max_workers": request.workers,
+            "chunk_size": request.chunk_size,
+            "cache": forecast_cache if use_cache else None,
+            "engine": request.engine,
+            "top_n": request.top_n,
+            "fast_method": request.fast_method,
+            "model_store": model_store,
+            "fit_mode": request.fit_mode,
+            "periods": periods,
+            # The source and date filters change each product's history, so they keep their own model state
+            "store_scope": json.dumps(["history" if s3_key is None else "file", request.start_date, request.end_date], default=str)
+        }
+        forecast_filename = _output_key(source_key, "forecasts", "forecast", variant_hash)
+        inventory_filename = _output_key(source_key, "inventory", "inventory", variant_hash)
         
-        # Retrieve data from S3
-        s3_key = filename if filename.startswith("sales_data/") else f"sales_data/{filename}"
-        logger.info(f"Retrieving {s3_key} from S3 bucket: {BUCKET_NAME}")
-        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=s3_key)
-        content = response["Body"].read()
-        df = pd.read_csv(io.BytesIO(content))
-        
-        # Validate columns
-        required_columns = ["date", "product_id", "quantity"]
-        if not all(col in df.columns for col in required_columns):
-            missing_cols = [col for col in required_columns if col not in df.columns]
-            logger.error(f"Missing columns: {missing_cols}")
-            raise HTTPException(status_code=400, detail=f"CSV must contain columns: {', '.join(required_columns)}")
-        
-        # Check for NaN values
-        if df[["date", "quantity"]].isna().any().any():
-            logger.error("Data contains NaN values in date or quantity columns")
-            raise HTTPException(status_code=400, detail="Data contains NaN values in date or quantity columns")
-        
-        # Prepare data for Prophet (per product)
-        df["date"] = pd.to_datetime(df["date"])
-        products = df["product_id"].unique()
-        forecasts = []
-        inventory_recommendations = []
-        lead_time_days = 7  # Assumed lead time
-        safety_stock_factor = 1.5  # 50% buffer for variability
-        skipped_products = []
-        
-        for product in products:
-            # Filter data for the product
-            df_product = df[df["product_id"] == product][["date", "quantity"]].rename(columns={"date": "ds", "quantity": "y"})
+        if out_of_core:
+            logger.info(f"Forecasting {source_key} out of core ({source_size} bytes)")
+            if s3_key is None:
+                batches = sales_history.iter_batches(request.product_ids, request.start_date, request.end_date)
+            else:
+                batches = iter_sales_batches(storage, s3_key, REQUIRED_COLUMNS, request.product_ids, request.start_date, request.end_date)
+            forecast_output = SpooledOutput(request.export_csv)
+            try:
+                try:
+                    results = run_forecasts_out_of_core(
+                        batches,
+                        forecast_output,
+                        progress_callback=job.update_progress,
+                        cancel_check=job.check_cancelled,
+                        **forecast_options
+                    )
+                except ValueError as e:
+                    logger.error(f"Invalid data: {str(e)}")
+                    raise HTTPException(status_code=400, detail=str(e))
+                if results["inventory"] is None:
+                    logger.error("No products have sufficient data for forecasting")
+                    raise HTTPException(status_code=400, detail="No products have at least 2 data points for forecasting")
+                forecast_csv = forecast_output.store(storage, forecast_filename)
+            finally:
+                forecast_output.close()
+            forecast_df = None
+        else:
+            # Retrieve data from storage, reading only the needed columns and rows
+            if s3_key is None:
+                logger.info("Reading the materialized sales history")
+                df = sales_history.read(request.product_ids, request.start_date, request.end_date)
+            else:
+                logger.info(f"Retrieving {s3_key} from {storage.name} storage")
+                df = read_sales_frame(
+                    storage,
+                    s3_key,
+                    columns=REQUIRED_COLUMNS,
+                    product_ids=request.product_ids,
+                    start_date=request.start_date,
+                    end_date=request.end_date
+                )
+            if df.empty:
+                logger.error(f"No sales rows to forecast in {filename}")
+                raise HTTPException(status_code=400, detail="No sales data matches the requested products and dates")
             
-            # Check if enough data points (at least 2 non-NaN rows)
-            if len(df_product) < 2:
-                logger.warning(f"Skipping product {product}: insufficient data points ({len(df_product)} rows)")
-                skipped_products.append(product)
-                continue
+            # Validate through the shared ingestion rules; duplicate product-days are summed
+            df, errors = prepare_sales_frame(df)
+            if df is None:
+                logger.error(f"Missing columns: {[error['column'] for error in errors]}")
+                raise HTTPException(status_code=400, detail=errors[0]["message"])
+            if errors:
+                first = errors[0]
+                logger.error(f"Invalid sales rows: {errors[:5]}")
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Data contains missing or invalid values in date, product_id or quantity columns (first in row {first['row']}, column {first['column']})"
+                )
             
-            # Initialize and fit Prophet model with fine-tuned parameters
-            model = Prophet(
-                yearly_seasonality=True,
-                weekly_seasonality=True,
-                daily_seasonality=True,
-                seasonality_mode="multiplicative",  # Better for varying trends
-                changepoint_prior_scale=0.05  # Adjust for flexibility in trend changes
+            # Forecast every product with the selected engine
+            results = run_forecasts(
+                df,
+                progress_callback=job.update_progress,
+                cancel_check=job.check_cancelled,
+                **forecast_options
             )
-            model.add_country_holidays(country_name="US")  # Add US holidays
-            model.fit(df_product)
-            
-            # Create future dataframe for next 30 days
-            future = model.make_future_dataframe(periods=30)
-            forecast = model.predict(future)
-            
-            # Select relevant columns
-            forecast = forecast[["ds", "yhat", "yhat_lower", "yhat_upper"]]
-            forecast["product_id"] = product
-            forecasts.append(forecast)
+            rows_processed.inc(len(df), operation="forecast")
+            forecast_df = results["forecast"]
+            if forecast_df is None:
+                logger.error("No products have sufficient data for forecasting")
+                raise HTTPException(status_code=400, detail="No products have at least 2 data points for forecasting")
             
-            # Calculate inventory recommendations (reorder point)
-            lead_time_demand = forecast[forecast["ds"] > df["date"].max()].head(lead_time_days)["yhat"].sum()
-            safety_stock = lead_time_demand * safety_stock_factor
-            reorder_point = lead_time_demand + safety_stock
-            inventory_recommendations.append({
-                "product_id": product,
-                "lead_time_demand": round(lead_time_demand, 2),
-                "safety_stock": round(safety_stock, 2),
-                "reorder_point": round(reorder_point, 2)
-            })
-        
-        if not forecasts:
-            logger.error("No products have sufficient data for forecasting")
-            raise HTTPException(status_code=400, detail="No products have at least 2 data points for forecasting")
-        
-        # Combine forecasts
-        forecast_df = pd.concat(forecasts, ignore_index=True)
-        forecast_df["ds"] = forecast_df["ds"].dt.strftime("%Y-%m-%d")
-        
-        # Save forecast to S3
-        forecast_filename = s3_key.replace("sales_data/", "forecasts/").replace(".csv", "_forecast.csv")
-        csv_buffer = io.StringIO()
-        forecast_df.to_csv(csv_buffer, index=False)
-        s3_client.put_object(
-            Bucket=BUCKET_NAME,
-            Key=forecast_filename,
-            Body=csv_buffer.getvalue()
-        )
+            # Save forecast to storage
+            forecast_csv = _put_output(forecast_filename, forecast_df, request.export_csv)
         logger.info(f"Stored forecast at {forecast_filename}")
+        inventory_df = results["inventory"]
+        skipped_products = results["skipped_products"]
+        failed_products = results["failed_products"]
+        products_forecast.inc(len(inventory_df), outcome="forecast")
+        products_forecast.inc(len(skipped_products), outcome="skipped")
+        products_forecast.inc(len(failed_products), outcome="failed")
         
-        # Save inventory recommendations to S3
-        inventory_filename = s3_key.replace("sales_data/", "inventory/").replace(".csv", "_inventory.csv")
-        inventory_df = pd.DataFrame(inventory_recommendations)
-        csv_buffer = io.StringIO()
-        inventory_df.to_csv(csv_buffer, index=False)
-        s3_client.put_object(
-            Bucket=BUCKET_NAME,
-            Key=inventory_filename,
-            Body=csv_buffer.getvalue()
-        )
+        # Save inventory recommendations to storage
+        inventory_csv = _put_output(inventory_filename, inventory_df, request.export_csv)
         logger.info(f"Stored inventory recommendations at {inventory_filename}")
         
-        # Return forecast and inventory recommendations
+        # Return forecast and inventory recommendations; the forecast frame is
+        # encoded per request by _forecast_response
+        with span("serialize", output="records"):
+            inventory_records = inventory_df.to_dict(orient="records")
         response = {
             "message": f"Forecast and inventory recommendations generated for {filename}",
-            "forecast": forecast_df.to_dict(orient="records"),
-            "inventory": inventory_df.to_dict(orient="records"),
+            "inventory": inventory_records,
             "forecast_s3_path": forecast_filename,
-            "inventory_s3_path": inventory_filename
+            "inventory_s3_path": inventory_filename,
+            "horizon": periods
         }
+        if forecast_df is not None:
+            response["forecast"] = forecast_df
+        else:
+            # Out-of-core forecasts are only as large as the input; read them from storage
+            response["forecast_rows"] = results["forecast_rows"]
+            response["out_of_core"] = True
+        if request.export_csv:
+            response["forecast_csv_path"] = forecast_csv
+            response["inventory_csv_path"] = inventory_csv
+        warnings = []
         if skipped_products:
-            response["warning"] = f"Skipped products due to insufficient data: {', '.join(skipped_products)}"
+            warnings.append(f"Skipped products due to insufficient data: {', '.join(map(str, skipped_products))}")
+        if failed_products:
+            response["failed_products"] = failed_products
+            warnings.append(f"Forecast failed for products: {', '.join(str(p['product_id']) for p in failed_products)}")
+        if warnings:
+            response["warning"] = "; ".join(warnings)
         
-        return response
+        if use_cache:
+            forecast_cache.put("file", file_cache_key, response)
+        return response if keep_forecast else _without_forecast(response)
     
-    except ClientError as e:
-        logger.error(f"S3 retrieval error: {str(e)}")
-        if e.response["Error"]["Code"] == "NoSuchKey":
-            raise HTTPException(status_code=404, detail="File not found in S3")
-        raise HTTPException(status_code=500, detail=f"Failed to retrieve from S3: {str(e)}")
+    except (HTTPException, JobCancelled):
+        raise
+    except ObjectNotFound:
+        logger.error(f"File not found: {filename}")
+        raise HTTPException(status_code=404, detail="File not found in storage")
+    except StorageError as e:
+        logger.error(f"Storage retrieval error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve from storage: {str(e)}")
     except Exception as e:
         logger.error(f"Forecasting error: {str(e)}")
-        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.post("/forecast/jobs", status_code=202)
+async def create_forecast_job(request: ForecastJobRequest):
+    s3_key = _validate_forecast_request(request)
+    try:
+        job = job_manager.submit("forecast", request.model_dump(mode="json"), run_forecast_job, request, s3_key)
+    except QueueFullError as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=429, detail=str(e))
+    return job.to_dict()
+
+MAX_SIMULATIONS = 100000
+FORECAST_COLUMNS = ["ds", "yhat", "yhat_lower", "yhat_upper", "product_id"]
+
+def _read_forecast(key: str, product_ids=None) -> pd.DataFrame:
+    head = storage.head(key)
+    with span("parquet_read", key=key):
+        source = storage.open_random(key, head["size"])
+        table = pq.read_table(source, columns=FORECAST_COLUMNS, filters=[("product_id", "in", product_ids)] if product_ids else None)
+    return table.to_pandas()
+
+def run_inventory_optimization(request: InventoryRequest) -> dict:
+    """Inventory recommendations from a stored forecast, without refitting any model."""
+    df = _read_forecast(request.forecast_path, request.product_ids)
+    if df.empty:
+        raise HTTPException(status_code=400, detail="The forecast has no rows for the requested products")
+    df["ds"] = pd.to_datetime(df["ds"])
+    defaults = {
+        name: getattr(request, name)
+        for name in ("lead_time_days", "lead_time_std_days", "service_level", "review_period_days")
+        if getattr(request, name) is not None
+    }
+    policy = None
+    if request.policies or defaults:
+        # Request-wide settings apply to every product; per-product policies take precedence
+        products = pd.unique(df["product_id"].astype(str))
+        policy = pd.DataFrame({"product_id": products, **{name: np.full(len(products), value, dtype="float64") for name, value in defaults.items()}})
+        if request.policies:
+            overrides = pd.DataFrame([item.model_dump() for item in request.policies]).set_index("product_id")
+            policy = policy.set_index("product_id")
+            policy = overrides.combine_first(policy).reset_index(names="product_id")
+    with span("inventory", simulations=request.simulations):
+        inventory_df = optimize_inventory(
+            df,
+            last_date=request.history_end,
+            horizon=request.horizon or FORECAST_PERIODS,
+            policy=policy,
+            simulations=request.simulations,
+            seed=request.seed
+        )
+    rows_processed.inc(len(df), operation="inventory")
+    return {
+        "forecast_path": request.forecast_path,
+        "method": "monte_carlo" if request.simulations else "closed_form",
+        "products": len(inventory_df),
+        "inventory": inventory_df.to_dict(orient="records")
+    }
+
+@router.post("/inventory/optimize")
+async def optimize_inventory_from_forecast(request: InventoryRequest):
+    if not (request.forecast_path.startswith("forecasts/") and request.forecast_path.endswith(".parquet")):
+        raise HTTPException(status_code=400, detail="forecast_path must be a stored forecast (forecasts/....parquet)")
+    if not 0 <= request.simulations <= MAX_SIMULATIONS:
+        raise HTTPException(status_code=400, detail=f"simulations must be between 0 and {MAX_SIMULATIONS}")
+    if request.horizon is not None and request.horizon < 1:
+        raise HTTPException(status_code=400, detail="horizon must be at least 1")
+    try:
+        return await run_in_threadpool(run_inventory_optimization, request)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        logger.error(f"Invalid inventory policy: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except ObjectNotFound:
+        logger.error(f"Forecast not found: {request.forecast_path}")
+        raise HTTPException(status_code=404, detail="Forecast not found in storage")
+    except StorageError as e:
+        logger.error(f"Storage retrieval error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve from storage: {str(e)}")
+    except Exception as e:
+        logger.error(f"Inventory optimization error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@router.get("/history")
+async def get_sales_history():
+    try:
+        manifest = await run_in_threadpool(sales_history.manifest)
+    except StorageError as e:
+        logger.error(f"History manifest error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to read the sales history: {str(e)}")
+    datasets = manifest.pop("datasets")
+    return dict(manifest, dataset_count=len(datasets))
+
+@router.get("/forecast/cache/stats")
+async def get_forecast_cache_stats():
+    return forecast_cache.stats()
+
+@router.get("/forecast/models/stats")
+async def get_model_store_stats():
+    if model_store is None:
+        raise HTTPException(status_code=404, detail="Model store is disabled")
+    return model_store.stats()
+
+@router.get("/forecast/jobs/{job_id}")
+async def get_forecast_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@router.delete("/forecast/jobs/{job_id}")
+async def cancel_forecast_job(job_id: str):
+    job = job_manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+FORECAST_FORMATS = ("records", "columns", "arrow")
+
+def _forecast_json(forecast_df: pd.DataFrame, format: str) -> str:
+    # pandas writes the JSON directly, skipping per-value encoding in Python
+    frame = forecast_df.assign(ds=forecast_df["ds"].dt.strftime("%Y-%m-%d"))
+    if format == "records":
+        return frame.to_json(orient="records", double_precision=15)
+    return "{" + ",".join(f"{json.dumps(col)}:{frame[col].to_json(orient='values', double_precision=15)}" for col in frame.columns) + "}"
+
+def _forecast_response(result: dict, horizon_only: bool, format: str) -> Response:
+    """Encode a forecast job result in the requested shape.
+
+    horizon_only keeps only the future days of each product. "records" is
+    the original list of row objects, "columns" one array per column and
+    "arrow" an Arrow IPC stream of the forecast with the rest of the
+    result as JSON in the schema metadata under "stockiq".
+    """
+    result = dict(result)
+    forecast_df = result.pop("forecast", None)
+    if forecast_df is not None and horizon_only:
+        forecast_df = forecast_df.groupby("product_id", sort=False, observed=True).tail(result["horizon"]).reset_index(drop=True)
+    if forecast_df is not None:
+        result["forecast_format"] = format
+    with span("serialize", output=format):
+        if format == "arrow" and forecast_df is not None:
+            table = pa.Table.from_pandas(forecast_df, preserve_index=False)
+            table = table.replace_schema_metadata({"stockiq": json.dumps(result, default=str)})
+            sink = io.BytesIO()
+            with pa.ipc.new_stream(sink, table.schema) as writer:
+                writer.write_table(table)
+            return Response(sink.getvalue(), media_type="application/vnd.apache.arrow.stream")
+        # Out-of-core results carry no inline forecast and are always JSON
+        body = json.dumps(result, default=str)
+        if forecast_df is not None:
+            body = body[:-1] + ', "forecast": ' + _forecast_json(forecast_df, format) + "}"
+    return Response(body, media_type="application/json")
+
+@router.get("/forecast/{filename:path}")
+async def forecast_sales_data(
+    filename: str,
+    execution: str = Query(None, description=f"Execution mode: {', '.join(EXECUTION_MODES)}"),
+    workers: int = Query(None, ge=1, description="Number of worker processes for process execution"),
+    chunk_size: int = Query(None, ge=1, description="Products sent to a worker per task"),
+    use_cache: bool = Query(True, description="Reuse cached results for unchanged data and settings"),
+    product_id: List[str] = Query(None, description="Only forecast these products"),
+    start_date: date = Query(None, description="Only use history on or after this date"),
+    end_date: date = Query(None, description="Only use history on or before this date"),
+    export_csv: bool = Query(False, description="Also store forecast and inventory outputs as CSV"),
+    engine: str = Query(None, description=f"Forecasting engine: {', '.join(ENGINES)}"),
+    top_n: int = Query(None, ge=1, description="Products by volume forecast with Prophet in hybrid mode"),
+    fast_method: str = Query("auto", description=f"Fast engine method: {', '.join(FAST_METHODS)}"),
+    fit_mode: str = Query(None, description=f"Prophet fit mode: {', '.join(FIT_MODES)}"),
+    out_of_core: bool = Query(None, description="Stream the input through disk partitions (default: by input size)"),
+    horizon: int = Query(None, ge=LEAD_TIME_DAYS, le=MAX_FORECAST_PERIODS, description=f"Days to forecast (default: {FORECAST_PERIODS})"),
+    horizon_only: bool = Query(False, description="Only return forecast days after each product's history"),
+    format: str = Query("records", description=f"Forecast encoding: {', '.join(FORECAST_FORMATS)}")
+):
+    # Run as a job and wait for it without blocking the event loop;
+    # /forecast/history forecasts the merged history of all uploads
+    request = ForecastJobRequest(
+        filename=None if filename == "history" else filename,
+        execution=execution,
+        workers=workers,
+        chunk_size=chunk_size,
+        use_cache=use_cache,
+        product_ids=product_id,
+        start_date=start_date,
+        end_date=end_date,
+        export_csv=export_csv,
+        engine=engine,
+        top_n=top_n,
+        fast_method=fast_method,
+        fit_mode=fit_mode,
+        out_of_core=out_of_core,
+        horizon=horizon
+    )
+    s3_key = _validate_forecast_request(request)
+    if format not in FORECAST_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(FORECAST_FORMATS)}")
+    try:
+        job = job_manager.submit("forecast", request.model_dump(mode="json"), run_forecast_job, request, s3_key, keep_forecast=True)
+    except QueueFullError as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=429, detail=str(e))
+    try:
+        await asyncio.wrap_future(job.future)
+    except asyncio.CancelledError:
+        if not job.future.cancelled():
+            # The client went away; stop the job as well
+            job_manager.cancel(job.id)
+            raise
+    if job.state == SUCCEEDED:
+        result = job.result
+        # The job stays retained for polling; only this response needs the frame
+        job.result = _without_forecast(result)
+        return await run_in_threadpool(_forecast_response, result, horizon_only, format)
+    if job.state == CANCELLED:
+        raise HTTPException(status_code=409, detail="Forecast job was cancelled")
+    raise HTTPException(status_code=job.status_code or 500, detail=job.error)
\ No newline at end of file
@@ -0,0 +1,90 @@
+import os
+import time
+import logging
+import threading
+from api.auth import secrets_client
+from api.forecasting import warm_up as warm_up_forecasting
+from api.storage import storage
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Startup settings
+WARMUP_ENABLED = os.getenv("STOCKIQ_WARMUP", "1") == "1"  # Pre-load the forecasting backend and cloud clients at startup
+
+
+def process_age():
+    """Seconds since this process started, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/stat") as f:
+            # starttime is the 22nd field, counted in clock ticks since boot
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return round(uptime - start_ticks / os.sysconf("SC_CLK_TCK"), 3)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class StartupTracker:
+    """Startup timings and readiness of this API process.
+
+    begin() runs when the server starts accepting connections. With
+    warm-up enabled the cloud clients are created and Prophet is loaded
+    with one small fit in a background thread; the process reports ready
+    once that finishes, so the first real forecast does not pay for it.
+    A failed warm-up is logged and the process still becomes ready.
+    """
+
+    def __init__(self):
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._stats = {"serving_after_seconds": None, "ready_after_seconds": None, "warmup": {}, "warmup_error": None}
+
+    def begin(self, warmup: bool = WARMUP_ENABLED):
+        with self._lock:
+            self._stats["serving_after_seconds"] = process_age()
+        logger.info(f"Serving after {self._stats['serving_after_seconds']}s since process start")
+        if not warmup:
+            self._finish()
+            return
+        threading.Thread(target=self._warm_up, name="stockiq-warmup", daemon=True).start()
+
+    def _step(self, name: str, fn):
+        start = time.perf_counter()
+        fn()
+        with self._lock:
+            self._stats["warmup"][f"{name}_seconds"] = round(time.perf_counter() - start, 3)
+
+    def _warm_up(self):
+        try:
+            self._step("storage_client", storage.warm_up)
+            self._step("secrets_client", secrets_client)
+            start = time.perf_counter()
+            timings = warm_up_forecasting()
+            with self._lock:
+                self._stats["warmup"].update({f"forecasting_{name}": round(value, 3) for name, value in timings.items()})
+                self._stats["warmup"]["forecasting_seconds"] = round(time.perf_counter() - start, 3)
+        except Exception as e:
+            logger.error(f"Warm-up failed: {str(e)}")
+            with self._lock:
+                self._stats["warmup_error"] = str(e)
+        self._finish()
+
+    def _finish(self):
+        with self._lock:
+            self._stats["ready_after_seconds"] = process_age()
+        self._ready.set()
+        logger.info(f"Ready after {self._stats['ready_after_seconds']}s since process start (warm-up: {self._stats['warmup']})")
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, warmup=dict(self._stats["warmup"]), ready=int(self.ready))
+
+
+startup = StartupTracker()
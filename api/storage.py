@@ -0,0 +1,423 @@
+import io
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow as pa
+from botocore.exceptions import BotoCoreError, ClientError
+from api.metrics import span
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Storage settings
+STORAGE_BACKENDS = ("s3", "local")
+STORAGE_BACKEND = os.getenv("STOCKIQ_STORAGE_BACKEND", "s3")
+LOCAL_STORAGE_ROOT = os.getenv("STOCKIQ_STORAGE_ROOT", os.path.join(os.getcwd(), "data"))
+S3_BUCKET = os.getenv("STOCKIQ_S3_BUCKET", "stockiq-data-pavan")
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("STOCKIQ_S3_MAX_POOL_CONNECTIONS", "32"))  # boto3 defaults to 10, which blocks ranged reads under load
+S3_MAX_ATTEMPTS = int(os.getenv("STOCKIQ_S3_MAX_ATTEMPTS", "5"))
+S3_RETRY_MODE = os.getenv("STOCKIQ_S3_RETRY_MODE", "adaptive")  # Client-side rate limiting on throttling errors
+S3_CONNECT_TIMEOUT = float(os.getenv("STOCKIQ_S3_CONNECT_TIMEOUT", "5"))
+S3_READ_TIMEOUT = float(os.getenv("STOCKIQ_S3_READ_TIMEOUT", "60"))
+RANGE_PART_SIZE = int(os.getenv("STOCKIQ_S3_RANGE_PART_BYTES", str(8 * 1024 * 1024)))  # Objects larger than this are fetched in parallel ranges
+RANGE_CONCURRENCY = int(os.getenv("STOCKIQ_S3_RANGE_CONCURRENCY", "8"))
+MULTIPART_PART_SIZE = int(os.getenv("STOCKIQ_MULTIPART_PART_BYTES", str(8 * 1024 * 1024)))  # S3 requires at least 5 MB per part
+
+
+class StorageError(Exception):
+    """Raised when the storage backend fails to read or write an object."""
+
+
+class ObjectNotFound(StorageError):
+    """Raised when an object does not exist."""
+
+
+@contextmanager
+def _s3_errors(key: str):
+    # Translate botocore errors into backend-independent storage errors
+    try:
+        yield
+    except ClientError as e:
+        if e.response["Error"]["Code"] in ("NoSuchKey", "404", "NotFound"):
+            raise ObjectNotFound(key) from e
+        raise StorageError(str(e)) from e
+    except BotoCoreError as e:
+        raise StorageError(str(e)) from e
+
+
+class S3RangeFile(io.RawIOBase):
+    """Read-only, seekable file over an S3 object using ranged GETs.
+
+    Lets pyarrow fetch only the footer and the column chunks it needs
+    instead of downloading the whole object.
+    """
+
+    def __init__(self, s3_client, bucket: str, key: str, size: int):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        else:
+            self._position = self.size + offset
+        return self._position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self._position
+        end = min(self._position + size, self.size)
+        if self._position >= end:
+            return b""
+        with _s3_errors(self.key):
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key, Range=f"bytes={self._position}-{end - 1}")
+            data = response["Body"].read()
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+class S3MultipartWriter:
+    """Stream bytes to S3, sending a part whenever part_size bytes are buffered.
+
+    Objects smaller than one part are written with a single put_object call.
+    """
+
+    def __init__(self, s3_client, bucket: str, key: str, part_size: int = MULTIPART_PART_SIZE):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.bytes_written = 0
+        self._buffer = bytearray()
+        self._upload_id = None
+        self._parts = []
+
+    def write(self, data: bytes):
+        self._buffer.extend(data)
+        self.bytes_written += len(data)
+        while len(self._buffer) >= self.part_size:
+            part = bytes(self._buffer[:self.part_size])
+            del self._buffer[:self.part_size]
+            self._upload_part(part)
+
+    def _upload_part(self, part: bytes):
+        with _s3_errors(self.key):
+            if self._upload_id is None:
+                response = self.s3_client.create_multipart_upload(Bucket=self.bucket, Key=self.key)
+                self._upload_id = response["UploadId"]
+            part_number = len(self._parts) + 1
+            response = self.s3_client.upload_part(
+                Bucket=self.bucket,
+                Key=self.key,
+                UploadId=self._upload_id,
+                PartNumber=part_number,
+                Body=part
+            )
+        self._parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+
+    def complete(self):
+        if self._upload_id is None:
+            with _s3_errors(self.key):
+                self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buffer))
+        else:
+            if self._buffer:
+                self._upload_part(bytes(self._buffer))
+            with _s3_errors(self.key):
+                self.s3_client.complete_multipart_upload(
+                    Bucket=self.bucket,
+                    Key=self.key,
+                    UploadId=self._upload_id,
+                    MultipartUpload={"Parts": self._parts}
+                )
+        self._buffer = bytearray()
+
+    def abort(self):
+        # Drop any uploaded parts so S3 does not keep billing for them
+        if self._upload_id is not None:
+            with _s3_errors(self.key):
+                self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+            self._upload_id = None
+        self._buffer = bytearray()
+
+
+class S3Storage:
+    """Objects in an S3 bucket, through one pooled client shared by all requests.
+
+    Large objects are downloaded as concurrent ranged GETs, Parquet files
+    are opened as seekable range readers and writes are streamed as
+    multipart uploads. The client is created on first use (or by
+    warm_up), so importing the API does not wait for boto3.
+    """
+
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        max_pool_connections: int = S3_MAX_POOL_CONNECTIONS,
+        max_attempts: int = S3_MAX_ATTEMPTS,
+        range_part_size: int = RANGE_PART_SIZE,
+        range_concurrency: int = RANGE_CONCURRENCY
+    ):
+        self.bucket = bucket
+        self.max_pool_connections = max_pool_connections
+        self.max_attempts = max_attempts
+        self.range_part_size = range_part_size
+        self.range_concurrency = range_concurrency
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._range_executor = ThreadPoolExecutor(max_workers=range_concurrency, thread_name_prefix="s3-range")
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import boto3
+                    from botocore.config import Config
+
+                    config = Config(
+                        max_pool_connections=self.max_pool_connections,
+                        retries={"max_attempts": self.max_attempts, "mode": S3_RETRY_MODE},
+                        connect_timeout=S3_CONNECT_TIMEOUT,
+                        read_timeout=S3_READ_TIMEOUT,
+                        tcp_keepalive=True
+                    )
+                    self._client = boto3.client("s3", config=config)
+        return self._client
+
+    def warm_up(self):
+        """Create the S3 client ahead of the first request."""
+        self.client
+
+    def head(self, key: str) -> dict:
+        with _s3_errors(key):
+            response = self.client.head_object(Bucket=self.bucket, Key=key)
+        return {"size": response["ContentLength"], "etag": response["ETag"]}
+
+    def _get_range(self, key: str, start: int, end: int) -> bytes:
+        with _s3_errors(key):
+            response = self.client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes={start}-{end - 1}")
+            return response["Body"].read()
+
+    def read(self, key: str) -> bytes:
+        with span("storage_read", key=key):
+            size = self.head(key)["size"]
+            if size <= self.range_part_size:
+                return self._get_range(key, 0, size) if size else b""
+            # Fetch the parts concurrently; the pool keeps one connection per part in flight
+            starts = range(0, size, self.range_part_size)
+            futures = [self._range_executor.submit(self._get_range, key, start, min(start + self.range_part_size, size)) for start in starts]
+            return b"".join(future.result() for future in futures)
+
+    def open_stream(self, key: str):
+        with _s3_errors(key):
+            return self.client.get_object(Bucket=self.bucket, Key=key)["Body"]
+
+    def open_random(self, key: str, size: int = None):
+        if size is None:
+            size = self.head(key)["size"]
+        return S3RangeFile(self.client, self.bucket, key, size)
+
+    def put(self, key: str, data: bytes):
+        with span("storage_write", key=key), _s3_errors(key):
+            self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+    def put_if_absent(self, key: str, data: bytes) -> bool:
+        """Create key only if it does not exist yet; False if another writer got there first."""
+        try:
+            with _s3_errors(key):
+                self.client.put_object(Bucket=self.bucket, Key=key, Body=data, IfNoneMatch="*")
+        except StorageError as e:
+            code = e.__cause__.response["Error"]["Code"] if isinstance(e.__cause__, ClientError) else None
+            if code in ("PreconditionFailed", "ConditionalRequestConflict"):
+                return False
+            raise
+        return True
+
+    def delete(self, key: str):
+        with _s3_errors(key):
+            self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def writer(self, key: str) -> S3MultipartWriter:
+        return S3MultipartWriter(self.client, self.bucket, key)
+
+    def list(self, prefix: str) -> list:
+        keys = []
+        with _s3_errors(prefix):
+            for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=prefix):
+                keys.extend(item["Key"] for item in page.get("Contents", []))
+        return keys
+
+    def describe(self) -> dict:
+        return {
+            "backend": self.name,
+            "bucket": self.bucket,
+            "max_pool_connections": self.max_pool_connections,
+            "max_attempts": self.max_attempts,
+            "retry_mode": S3_RETRY_MODE,
+            "range_part_size": self.range_part_size,
+            "range_concurrency": self.range_concurrency
+        }
+
+
+class LocalFileWriter:
+    """Write a file under a temporary name and move it into place on complete()."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.bytes_written = 0
+        self._tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._file = open(self._tmp_path, "wb")
+
+    def write(self, data: bytes):
+        self._file.write(data)
+        self.bytes_written += len(data)
+
+    def complete(self):
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class LocalStorage:
+    """Objects as files under a root directory, for on-prem and offline use.
+
+    Keys map to relative paths. Parquet files are memory-mapped so pyarrow
+    reads only the pages it needs straight from the page cache.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, *key.split("/")))
+        if not path.startswith(self.root + os.sep):
+            raise ObjectNotFound(key)
+        return path
+
+    def head(self, key: str) -> dict:
+        try:
+            stat = os.stat(self._path(key))
+        except FileNotFoundError:
+            raise ObjectNotFound(key)
+        return {"size": stat.st_size, "etag": f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'}
+
+    def read(self, key: str) -> bytes:
+        with span("storage_read", key=key), self.open_stream(key) as f:
+            return f.read()
+
+    def open_stream(self, key: str):
+        try:
+            return open(self._path(key), "rb")
+        except FileNotFoundError:
+            raise ObjectNotFound(key)
+        except OSError as e:
+            raise StorageError(str(e))
+
+    def open_random(self, key: str, size: int = None):
+        try:
+            return pa.memory_map(self._path(key), "r")
+        except FileNotFoundError:
+            raise ObjectNotFound(key)
+
+    def put(self, key: str, data: bytes):
+        writer = self.writer(key)
+        try:
+            with span("storage_write", key=key):
+                writer.write(data)
+                writer.complete()
+        except OSError as e:
+            writer.abort()
+            raise StorageError(str(e))
+
+    def put_if_absent(self, key: str, data: bytes) -> bool:
+        """Create key only if it does not exist yet; False if another writer got there first."""
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        except OSError as e:
+            raise StorageError(str(e))
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return True
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            raise StorageError(str(e))
+
+    def writer(self, key: str) -> LocalFileWriter:
+        try:
+            return LocalFileWriter(self._path(key))
+        except OSError as e:
+            raise StorageError(str(e))
+
+    def list(self, prefix: str) -> list:
+        # Walk only the directory the prefix points into
+        directory = os.path.dirname(self._path(prefix + "_")) if prefix else self.root
+        keys = []
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                key = os.path.relpath(os.path.join(root, name), self.root).replace(os.sep, "/")
+                if key.startswith(prefix):
+                    keys.append(key)
+        return sorted(keys)
+
+    def describe(self) -> dict:
+        return {"backend": self.name, "root": self.root}
+
+    def warm_up(self):
+        """Nothing to prepare for local files."""
+
+
+def create_storage(backend: str = STORAGE_BACKEND):
+    """Build the configured storage backend."""
+    if backend == "s3":
+        return S3Storage(S3_BUCKET)
+    if backend == "local":
+        return LocalStorage(LOCAL_STORAGE_ROOT)
+    raise ValueError(f"Storage backend must be one of: {', '.join(STORAGE_BACKENDS)}")
+
+
+storage = create_storage()
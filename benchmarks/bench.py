@@ -0,0 +1,181 @@
+"""Benchmark the upload, get and forecast endpoints on synthetic data.
+
+Runs the FastAPI app in process against a throwaway local storage root
+(no S3 or Secrets Manager needed) and writes throughput, p50/p95/p99
+latency and peak RSS per endpoint and dataset size as JSON:
+
+    python -m benchmarks.bench --sizes 100x365,1000x365 --repeat 5 --output bench.json
+
+The default (Prophet) forecast fits one model per product, so it is only
+measured for sizes up to --prophet-max-skus products.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+
+# Point the app at temporary local storage before any api module is imported
+WORK_DIR = tempfile.mkdtemp(prefix="stockiq-bench-")
+os.environ["STOCKIQ_STORAGE_BACKEND"] = "local"
+os.environ["STOCKIQ_STORAGE_ROOT"] = os.path.join(WORK_DIR, "storage")
+os.environ["STOCKIQ_CACHE_DIR"] = ""
+os.environ["STOCKIQ_MODEL_STORE_DIR"] = ""
+os.environ["STOCKIQ_WARMUP"] = "0"  # A background warm-up would compete with the measured requests
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from fastapi.testclient import TestClient
+from api.main import app
+from api.auth import get_current_user
+from utils.synthetic import generate_sales_data
+
+BENCH_USER = {"username": "bench"}
+
+
+def _reset_peak_rss():
+    # Linux lets the peak (VmHWM) be reset so each case gets its own peak
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_mb() -> float:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is KB on Linux and bytes on macOS, and never resets
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _summary(latencies, rows: int) -> dict:
+    latencies = np.array(latencies)
+    total = latencies.sum()
+    return {
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / total, 3),
+        "rows_per_second": round(rows * len(latencies) / total, 1),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 2),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 2),
+        "mean_ms": round(float(latencies.mean()) * 1000, 2)
+    }
+
+
+def _run_case(name: str, request, repeat: int, rows: int) -> dict:
+    request()  # Warm-up, not timed
+    _reset_peak_rss()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = request()
+        latencies.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{name} failed with {response.status_code}: {response.text[:200]}")
+    result = _summary(latencies, rows)
+    result.update({"endpoint": name, "peak_rss_mb": round(_peak_rss_mb(), 1)})
+    return result
+
+
+def bench_size(client: TestClient, skus: int, days: int, repeat: int, seed: int, prophet_max_skus: int) -> list:
+    df = generate_sales_data(skus=skus, days=days, missing_rows=0.05, seed=seed)
+    payload = df.to_csv(index=False).encode()
+    rows = len(df)
+    uploaded = {}
+
+    def upload():
+        response = client.post("/data/upload", files={"file": ("bench.csv", payload, "text/csv")})
+        if response.status_code < 400:
+            uploaded["key"] = response.json()["s3_filename"]
+        return response
+
+    cases = [("upload", upload)]
+    cases.append(("get", lambda: client.get(f"/data/get/{uploaded['key']}")))
+    cases.append(("get_ndjson", lambda: client.get(f"/data/get/{uploaded['key']}", params={"format": "ndjson"})))
+    cases.append(("forecast_fast", lambda: client.get(
+        f"/data/forecast/{uploaded['key']}", params={"engine": "fast", "use_cache": False}
+    )))
+    if skus <= prophet_max_skus:
+        cases.append(("forecast_prophet", lambda: client.get(
+            f"/data/forecast/{uploaded['key']}", params={"engine": "prophet", "use_cache": False}
+        )))
+
+    results = []
+    for name, request in cases:
+        result = _run_case(name, request, repeat, rows)
+        result.update({"skus": skus, "days": days, "rows": rows, "csv_bytes": len(payload)})
+        print(
+            f"{name:>14} {skus}x{days}: {result['requests_per_second']} req/s, "
+            f"p50 {result['p50_ms']} ms, p95 {result['p95_ms']} ms, p99 {result['p99_ms']} ms, "
+            f"peak RSS {result['peak_rss_mb']} MB",
+            file=sys.stderr
+        )
+        results.append(result)
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _parse_sizes(value: str) -> list:
+    sizes = []
+    for size in value.split(","):
+        skus, days = size.lower().split("x")
+        sizes.append((int(skus), int(days)))
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark StockIQ API endpoints on synthetic data")
+    parser.add_argument("--sizes", default="100x365,1000x365", help="Comma-separated SKUSxDAYS dataset sizes")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed requests per endpoint and size")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--prophet-max-skus", type=int, default=100, help="Largest SKU count the Prophet forecast is measured for (0 to skip it)")
+    parser.add_argument("--output", default="bench_output.json", help="Where to write the JSON results")
+    args = parser.parse_args()
+
+    app.dependency_overrides[get_current_user] = lambda: BENCH_USER
+    results = []
+    try:
+        with TestClient(app) as client:
+            for skus, days in _parse_sizes(args.sizes):
+                results.extend(bench_size(client, skus, days, args.repeat, args.seed, args.prophet_max_skus))
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "prophet_max_skus": args.prophet_max_skus,
+        "results": results
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {len(results)} results to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
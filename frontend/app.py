@@ -1,14 +1,108 @@
+import os
+import sys
 import streamlit as st
 import requests
 import pandas as pd
+import pyarrow as pa
 import plotly.express as px
-import io
-import boto3
-from botocore.exceptions import ClientError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from downsample import MAX_POINTS_PER_SERIES, downsample_series
+
+# The shared ingestion rules live in utils/ at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.preprocess import REQUIRED_COLUMNS, read_sales_data
+
+# API settings
+API_URL = os.getenv("STOCKIQ_API_URL", "http://localhost:8000")
+DATASET_CACHE_SECONDS = 60  # How long the dataset list is reused before asking the API again
+DEFAULT_PLOTTED_PRODUCTS = 5  # Products plotted until the user picks others
+DEFAULT_HORIZON_DAYS = 30  # Forecast horizon offered by default
+MIN_HORIZON_DAYS, MAX_HORIZON_DAYS = 7, 365  # Bounds the API accepts
 
 # Streamlit page configuration
 st.set_page_config(page_title="StockIQ", layout="wide", page_icon="📦")
 
+@st.cache_resource
+def get_session() -> requests.Session:
+    # One pooled session for the whole server, so reruns reuse open connections
+    session = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def _auth_headers(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+def _error_detail(response: requests.Response) -> str:
+    try:
+        return response.json().get("detail", "Unknown error")
+    except ValueError:
+        return response.text or "Unknown error"
+
+class ApiError(Exception):
+    """Raised when the API answers with an error status."""
+
+# API responses and parsed frames are cached per token and arguments, so
+# widget interactions rerun the script without calling the API again
+@st.cache_data(ttl=DATASET_CACHE_SECONDS, show_spinner=False)
+def fetch_datasets(token: str) -> list:
+    response = get_session().get(f"{API_URL}/data/datasets", headers=_auth_headers(token))
+    if response.status_code != 200:
+        raise ApiError(_error_detail(response))
+    return [dataset["key"] for dataset in response.json()["datasets"]]
+
+@st.cache_data(ttl=DATASET_CACHE_SECONDS, show_spinner=False)
+def fetch_dataset_products(token: str, filename: str) -> list:
+    response = get_session().get(f"{API_URL}/data/datasets/{filename}", headers=_auth_headers(token))
+    if response.status_code != 200:
+        return []
+    return response.json().get("products", [])
+
+@st.cache_data(max_entries=16, show_spinner="Loading sales data...")
+def fetch_sales(token: str, filename: str, product_ids: tuple = None) -> pd.DataFrame:
+    # Arrow IPC keeps large files compact on the wire and cheap to parse
+    params = {"format": "arrow"}
+    if product_ids:
+        params["product_id"] = list(product_ids)
+    response = get_session().get(f"{API_URL}/data/get/{filename}", params=params, headers=_auth_headers(token))
+    if response.status_code != 200:
+        raise ApiError(_error_detail(response))
+    if not response.content:
+        return pd.DataFrame(columns=["date", "product_id", "quantity"])
+    df = pa.ipc.open_stream(response.content).read_pandas()
+    df["date"] = pd.to_datetime(df["date"])
+    df["product_id"] = df["product_id"].astype(str)
+    return df
+
+@st.cache_data(max_entries=4, show_spinner="Reading file...")
+def parse_upload(file_id: str, _uploaded_file) -> tuple:
+    # Keyed on the upload's id; the file object itself is not hashed
+    _uploaded_file.seek(0)
+    result = read_sales_data(_uploaded_file)
+    df = result["data"]
+    ranking = []
+    if df is not None:
+        ranking = df.groupby("product_id", observed=True)["quantity"].sum().sort_values(ascending=False).index.astype(str).tolist()
+    return result, ranking
+
+def pick_products(label: str, products: list, key: str) -> list:
+    """Product picker defaulting to the first few products."""
+    return st.multiselect(label, products, default=products[:DEFAULT_PLOTTED_PRODUCTS], key=key)
+
+def plot_sales(df: pd.DataFrame, title: str):
+    # Series longer than MAX_POINTS_PER_SERIES are reduced with LTTB, keeping peaks and dips
+    if df.empty:
+        st.info("No products selected to plot.")
+        return
+    plotted = downsample_series(df, "date", "quantity", "product_id")
+    if len(plotted) < len(df):
+        st.caption(f"Showing {len(plotted):,} of {len(df):,} points (at most {MAX_POINTS_PER_SERIES:,} per product).")
+    fig = px.line(plotted, x="date", y="quantity", color="product_id", title=title, render_mode="webgl")
+    st.plotly_chart(fig, use_container_width=True)
+
 # Initialize session state
 if "access_token" not in st.session_state:
     st.session_state.access_token = None
@@ -20,13 +114,13 @@ if not st.session_state.access_token:
     password = st.text_input("Password", type="password")
     if st.button("Login"):
         try:
-            response = requests.post("http://localhost:8000/auth/token", data={"username": username, "password": password})
+            response = get_session().post(f"{API_URL}/auth/token", data={"username": username, "password": password})
             if response.status_code == 200:
                 st.session_state.access_token = response.json()["access_token"]
                 st.success("Logged in successfully!")
-                st.experimental_rerun()
+                st.rerun()
             else:
-                st.error(f"Login failed: {response.json().get('detail', 'Unknown error')}")
+                st.error(f"Login failed: {_error_detail(response)}")
         except Exception as e:
             st.error(f"Error logging in: {str(e)}")
 else:
@@ -35,34 +129,41 @@ else:
     st.markdown("Upload sales data to predict demand and optimize inventory.")
     if st.button("Logout"):
         st.session_state.access_token = None
-        st.experimental_rerun()
+        st.session_state.pop("retrieved", None)
+        st.session_state.pop("forecasts", None)
+        st.rerun()
 
     # Headers for authenticated requests
-    headers = {"Authorization": f"Bearer {st.session_state.access_token}"}
+    token = st.session_state.access_token
+    headers = _auth_headers(token)
 
     # File upload section
     st.header("Upload Sales Data")
     uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
 
     if uploaded_file is not None:
-        # Read the uploaded file
-        df = pd.read_csv(uploaded_file)
-        
-        # Validate columns
-        required_columns = ["date", "product_id", "quantity"]
-        if all(col in df.columns for col in required_columns):
-            st.success("File validated successfully!")
-            
+        # Read the uploaded file once per upload, not on every rerun
+        file_id = getattr(uploaded_file, "file_id", None) or f"{uploaded_file.name}:{uploaded_file.size}"
+        parsed, ranking = parse_upload(file_id, uploaded_file)
+        df = parsed["data"]
+
+        # Validate columns and values with the shared ingestion rules
+        if df is not None:
+            if parsed["errors"]:
+                st.warning(f"Skipped invalid rows; first problems: {parsed['errors'][:5]}")
+            else:
+                st.success("File validated successfully!")
+
             # Display uploaded data
             st.subheader("Uploaded Sales Data")
             st.dataframe(df.head(), use_container_width=True)
-            
-            # Plot sales data
+            st.caption(f"{parsed['rows']:,} rows ({parsed['duplicates']:,} duplicate product-days summed), {len(ranking):,} products")
+
+            # Plot sales data for the picked products (highest volume first)
             st.subheader("Sales Trend")
-            df["date"] = pd.to_datetime(df["date"])
-            fig = px.line(df, x="date", y="quantity", color="product_id", title="Sales Quantity Over Time")
-            st.plotly_chart(fig, use_container_width=True)
-            
+            selected = pick_products("Products to plot", ranking, key="upload_products")
+            plot_sales(df[df["product_id"].isin(selected)], "Sales Quantity Over Time")
+
             # Upload to FastAPI backend
             if st.button("Upload to Server"):
                 try:
@@ -70,8 +171,8 @@ else:
                     uploaded_file.seek(0)
                     # Send file to FastAPI endpoint
                     files = {"file": (uploaded_file.name, uploaded_file, "text/csv")}
-                    response = requests.post("http://localhost:8000/data/upload", files=files, headers=headers)
-                    
+                    response = get_session().post(f"{API_URL}/data/upload", files=files, headers=headers)
+
                     if response.status_code == 200:
                         message = response.json().get("message", "File uploaded successfully")
                         s3_filename = response.json().get("s3_filename", "Unknown")
@@ -81,94 +182,152 @@ else:
                             st.session_state.uploaded_files = []
                         if s3_filename not in st.session_state.uploaded_files:
                             st.session_state.uploaded_files.append(s3_filename)
+                        # The dataset list changed
+                        fetch_datasets.clear()
                     else:
-                        st.error(f"Upload failed: {response.json().get('detail', 'Unknown error')}")
+                        st.error(f"Upload failed: {_error_detail(response)}")
                 except Exception as e:
                     st.error(f"Error connecting to server: {str(e)}")
         else:
-            st.error(f"CSV must contain columns: {', '.join(required_columns)}")
+            st.error(parsed["errors"][0]["message"] if parsed["errors"] else f"CSV must contain columns: {', '.join(REQUIRED_COLUMNS)}")
+
+    # List datasets from the catalog, plus anything uploaded in this session
+    dataset_files = []
+    try:
+        dataset_files = list(fetch_datasets(token))
+    except Exception as e:
+        st.warning(f"Could not load the dataset catalog: {str(e)}")
+    for filename in st.session_state.get("uploaded_files", []):
+        if filename not in dataset_files:
+            dataset_files.append(filename)
 
     # Retrieve data from S3
     st.header("Retrieve Sales Data from S3")
-    if "uploaded_files" in st.session_state and st.session_state.uploaded_files:
-        selected_filename = st.selectbox("Select a CSV file from S3", st.session_state.uploaded_files)
+    if dataset_files:
+        selected_filename = st.selectbox("Select a CSV file from S3", dataset_files)
     else:
         selected_filename = st.text_input("Enter CSV filename (e.g., sales_data/2025/07/03_1.csv)")
+    load_all = st.checkbox("Load all products", help="Fetch the full dataset instead of only the picked products")
+    if selected_filename and not load_all:
+        # Only the picked products are fetched; the API filters them server side
+        catalog_products = fetch_dataset_products(token, selected_filename)
+        retrieve_products = pick_products("Products to retrieve", catalog_products, key="retrieve_products")
+    else:
+        retrieve_products = []
     if st.button("Retrieve Data"):
+        if load_all or retrieve_products:
+            st.session_state.retrieved = (selected_filename, None if load_all else tuple(sorted(retrieve_products)))
+        else:
+            st.warning("Pick at least one product, or load all products.")
+
+    # Retrieved data stays on screen across reruns; the frame comes from the cache
+    if st.session_state.get("retrieved"):
+        retrieved_filename, retrieved_products = st.session_state.retrieved
         try:
-            response = requests.get(f"http://localhost:8000/data/get/{selected_filename}", headers=headers)
-            if response.status_code == 200:
-                df = pd.DataFrame(response.json())
-                st.subheader("Retrieved Sales Data")
-                st.dataframe(df.head(), use_container_width=True)
-                
-                # Plot retrieved data
-                st.subheader("Retrieved Sales Trend")
-                df["date"] = pd.to_datetime(df["date"])
-                fig = px.line(df, x="date", y="quantity", color="product_id", title="Retrieved Sales Quantity Over Time")
-                st.plotly_chart(fig, use_container_width=True)
+            df = fetch_sales(token, retrieved_filename, retrieved_products)
+            st.subheader("Retrieved Sales Data")
+            if st.checkbox("Show all rows", key="retrieved_all_rows"):
+                st.dataframe(df, use_container_width=True)
             else:
-                st.error(f"Retrieval failed: {response.json().get('detail', 'Unknown error')}")
+                st.dataframe(df.head(), use_container_width=True)
+            st.caption(f"{len(df):,} rows from {retrieved_filename}")
+
+            # Plot retrieved data
+            st.subheader("Retrieved Sales Trend")
+            products = sorted(df["product_id"].unique())
+            selected = pick_products("Products to plot", products, key="retrieved_plot_products")
+            plot_sales(df[df["product_id"].isin(selected)], "Retrieved Sales Quantity Over Time")
+        except ApiError as e:
+            st.error(f"Retrieval failed: {str(e)}")
         except Exception as e:
             st.error(f"Error retrieving data: {str(e)}")
 
     # Forecast sales data
     st.header("Forecast Sales Data and Inventory Optimization")
-    if "uploaded_files" in st.session_state and st.session_state.uploaded_files:
-        forecast_filename = st.selectbox("Select a CSV file to forecast", st.session_state.uploaded_files, key="forecast_select")
+    if dataset_files:
+        # "history" forecasts the merged history of every upload
+        forecast_filename = st.selectbox("Select a CSV file to forecast", ["history"] + dataset_files, key="forecast_select")
     else:
         forecast_filename = st.text_input("Enter CSV filename to forecast (e.g., sales_data/2025/07/03_1.csv)")
+    horizon = int(st.number_input("Forecast horizon (days)", min_value=MIN_HORIZON_DAYS, max_value=MAX_HORIZON_DAYS, value=DEFAULT_HORIZON_DAYS))
+    if "forecasts" not in st.session_state:
+        st.session_state.forecasts = {}
     if st.button("Generate Forecast and Inventory Recommendations"):
         try:
-            response = requests.get(f"http://localhost:8000/data/forecast/{forecast_filename}", headers=headers)
+            # Only the future days, one array per column; the session accepts gzip/br
+            params = {"horizon": horizon, "horizon_only": True, "format": "columns"}
+            response = get_session().get(f"{API_URL}/data/forecast/{forecast_filename}", params=params, headers=headers)
             if response.status_code == 200:
-                forecast_df = pd.DataFrame(response.json().get("forecast"))
-                inventory_df = pd.DataFrame(response.json().get("inventory"))
-                forecast_s3_path = response.json().get("forecast_s3_path")
-                inventory_s3_path = response.json().get("inventory_s3_path")
-                
-                # Display warning if any products were skipped
-                if "warning" in response.json():
-                    st.warning(response.json().get("warning"))
-                
-                # Display forecast
-                st.subheader("Sales Forecast (Next 30 Days)")
-                st.dataframe(forecast_df.head(), use_container_width=True)
-                
-                # Plot forecast
-                st.subheader("Forecast Trend by Product")
+                result = response.json()
+                forecast_df = pd.DataFrame(result.get("forecast") or {}, columns=["ds", "yhat", "yhat_lower", "yhat_upper", "product_id"])
                 forecast_df["ds"] = pd.to_datetime(forecast_df["ds"])
-                fig = px.line(
-                    forecast_df,
-                    x="ds",
-                    y="yhat",
-                    color="product_id",
-                    title="Sales Forecast by Product (Next 30 Days)",
-                    labels={"ds": "Date", "yhat": "Predicted Quantity"}
-                )
-                fig.add_scatter(
-                    x=forecast_df["ds"],
-                    y=forecast_df["yhat_lower"],
-                    mode="lines",
-                    name="Lower Bound",
-                    line=dict(dash="dash")
-                )
-                fig.add_scatter(
-                    x=forecast_df["ds"],
-                    y=forecast_df["yhat_upper"],
-                    mode="lines",
-                    name="Upper Bound",
-                    line=dict(dash="dash")
-                )
-                st.plotly_chart(fig, use_container_width=True)
-                
-                # Display inventory recommendations
-                st.subheader("Inventory Recommendations")
-                st.dataframe(inventory_df, use_container_width=True)
-                
-                st.success(f"Forecast stored at S3: {forecast_s3_path}")
-                st.success(f"Inventory recommendations stored at S3: {inventory_s3_path}")
+                forecast_df["product_id"] = forecast_df["product_id"].astype(str)
+                # Keep the result so it survives reruns triggered by other widgets
+                st.session_state.forecasts[forecast_filename] = {
+                    "forecast": forecast_df,
+                    "inventory": pd.DataFrame(result.get("inventory")),
+                    "forecast_s3_path": result.get("forecast_s3_path"),
+                    "inventory_s3_path": result.get("inventory_s3_path"),
+                    "warning": result.get("warning"),
+                    "forecast_rows": result.get("forecast_rows"),
+                    "horizon": result.get("horizon", horizon)
+                }
             else:
-                st.error(f"Forecast failed: {response.json().get('detail', 'Unknown error')}")
+                st.error(f"Forecast failed: {_error_detail(response)}")
         except Exception as e:
-            st.error(f"Error generating forecast: {str(e)}")
\ No newline at end of file
+            st.error(f"Error generating forecast: {str(e)}")
+
+    forecast_result = st.session_state.forecasts.get(forecast_filename)
+    if forecast_result is not None:
+        forecast_df = forecast_result["forecast"]
+        inventory_df = forecast_result["inventory"]
+
+        # Display warning if any products were skipped
+        if forecast_result["warning"]:
+            st.warning(forecast_result["warning"])
+
+        if forecast_df.empty and forecast_result["forecast_rows"]:
+            # Large forecasts are not returned inline, only stored
+            st.info(f"{forecast_result['forecast_rows']:,} forecast rows were stored at {forecast_result['forecast_s3_path']}")
+        else:
+            # Display forecast
+            st.subheader(f"Sales Forecast (Next {forecast_result['horizon']} Days)")
+            st.dataframe(forecast_df.head(), use_container_width=True)
+
+            # Plot forecast for the picked products
+            st.subheader("Forecast Trend by Product")
+            products = list(pd.unique(forecast_df["product_id"]))
+            selected = pick_products("Products to plot", products, key="forecast_products")
+            plotted = forecast_df[forecast_df["product_id"].isin(selected)]
+            plotted = downsample_series(plotted, "ds", "yhat", "product_id")
+            fig = px.line(
+                plotted,
+                x="ds",
+                y="yhat",
+                color="product_id",
+                title=f"Sales Forecast by Product (Next {forecast_result['horizon']} Days)",
+                labels={"ds": "Date", "yhat": "Predicted Quantity"},
+                render_mode="webgl"
+            )
+            fig.add_scatter(
+                x=plotted["ds"],
+                y=plotted["yhat_lower"],
+                mode="lines",
+                name="Lower Bound",
+                line=dict(dash="dash")
+            )
+            fig.add_scatter(
+                x=plotted["ds"],
+                y=plotted["yhat_upper"],
+                mode="lines",
+                name="Upper Bound",
+                line=dict(dash="dash")
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+        # Display inventory recommendations
+        st.subheader("Inventory Recommendations")
+        st.dataframe(inventory_df, use_container_width=True)
+
+        st.success(f"Forecast stored at S3: {forecast_result['forecast_s3_path']}")
+        st.success(f"Inventory recommendations stored at S3: {forecast_result['inventory_s3_path']}")
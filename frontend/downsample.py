@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+
+# Points kept per plotted series
+MAX_POINTS_PER_SERIES = 1500
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the points kept by Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points and, from each of threshold - 2 equal
+    buckets in between, the point forming the largest triangle with the
+    point kept from the previous bucket and the mean of the next bucket.
+    Peaks and dips survive, unlike with plain striding. x must be sorted.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = x.astype("float64")
+    y = y.astype("float64")
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    kept = np.empty(threshold, dtype=np.int64)
+    kept[0] = 0
+    kept[-1] = n - 1
+    previous = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # Mean of the next bucket (the last point for the final bucket)
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        mean_x = x[next_start:next_end].mean()
+        mean_y = y[next_start:next_end].mean()
+        area = np.abs(
+            (x[previous] - mean_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (mean_y - y[previous])
+        )
+        previous = start + int(area.argmax())
+        kept[i + 1] = previous
+    return kept
+
+
+def downsample_series(df: pd.DataFrame, x: str, y: str, by: str, threshold: int = MAX_POINTS_PER_SERIES) -> pd.DataFrame:
+    """LTTB-downsample each group's (x, y) series to at most threshold points."""
+    parts = []
+    for _, group in df.sort_values([by, x], kind="stable").groupby(by, sort=False, observed=True):
+        if len(group) <= threshold:
+            parts.append(group)
+            continue
+        x_values = group[x].to_numpy()
+        if np.issubdtype(x_values.dtype, np.datetime64):
+            x_values = x_values.astype("datetime64[ns]").astype(np.int64)
+        parts.append(group.iloc[lttb(x_values, group[y].to_numpy(), threshold)])
+    return pd.concat(parts, ignore_index=True) if parts else df
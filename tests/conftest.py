@@ -0,0 +1,81 @@
+import os
+import tempfile
+
+# Point the API at throwaway local storage before any api module is imported
+_ROOT = tempfile.mkdtemp(prefix="stockiq-tests-")
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ["STOCKIQ_STORAGE_BACKEND"] = "local"
+os.environ["STOCKIQ_STORAGE_ROOT"] = os.path.join(_ROOT, "storage")
+os.environ["STOCKIQ_CACHE_DIR"] = os.path.join(_ROOT, "cache")
+os.environ["STOCKIQ_MODEL_STORE_DIR"] = os.path.join(_ROOT, "models")
+os.environ["STOCKIQ_SPILL_DIR"] = _ROOT
+os.environ["STOCKIQ_WARMUP"] = "0"
+
+import itertools
+import pytest
+from utils.synthetic import generate_sales_data
+
+_uploads = itertools.count()
+
+
+@pytest.fixture
+def sales_df():
+    return generate_sales_data(skus=6, days=120, seed=7)
+
+
+@pytest.fixture
+def store_csv():
+    """Store CSV bytes as a new upload key and return the key."""
+    from api.storage import storage
+
+    def store(data: bytes) -> str:
+        key = f"sales_data/tests/{next(_uploads)}.csv"
+        storage.put(key, data)
+        return key
+    return store
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    from api.auth import get_current_user
+    from api.main import app
+
+    app.dependency_overrides[get_current_user] = lambda: {"username": "tester"}
+    yield TestClient(app)
+    app.dependency_overrides.clear()
+
+
+@pytest.fixture
+def upload(client):
+    """Upload CSV bytes through /data/upload and return the stored key."""
+    def upload_csv(data: bytes, filename: str = "sales.csv") -> str:
+        response = client.post("/data/upload", files={"file": (filename, data, "text/csv")})
+        assert response.status_code == 200, response.text
+        return response.json()["s3_filename"]
+    return upload_csv
+
+
+@pytest.fixture
+def fits(monkeypatch):
+    """Record the (product, warm started) pairs Prophet fits in this process."""
+    import api.forecasting
+
+    calls = []
+    original = api.forecasting.forecast_product
+
+    def forecast_product(product, df_product, init=None, periods=api.forecasting.FORECAST_PERIODS):
+        calls.append((product, init is not None))
+        return original(product, df_product, init, periods)
+    monkeypatch.setattr(api.forecasting, "forecast_product", forecast_product)
+    return calls
+
+
+@pytest.fixture
+def sales_frame(sales_df):
+    """Three products prepared for run_forecasts."""
+    from utils.preprocess import prepare_sales_frame
+
+    df, errors = prepare_sales_frame(sales_df[sales_df["product_id"].isin(["SKU0", "SKU1", "SKU2"])])
+    assert not errors
+    return df
@@ -0,0 +1,60 @@
+import time
+import pytest
+from fastapi.testclient import TestClient
+from api.auth import UserDirectoryCache, create_access_token, pwd_context, token_cache, user_directory
+from api.main import app
+
+USERS = {
+    "admin": {"hashed_password": pwd_context.hash("secret"), "admin": True},
+    "alice": {"hashed_password": pwd_context.hash("secret")}
+}
+
+
+@pytest.fixture
+def users(monkeypatch):
+    directory = dict(USERS)
+    monkeypatch.setattr(user_directory, "loader", lambda: dict(directory))
+    user_directory.invalidate()
+    yield directory
+    user_directory.invalidate()
+
+
+def _headers(username: str) -> dict:
+    return {"Authorization": f"Bearer {create_access_token({'sub': username})}"}
+
+
+def test_revoke_requires_an_admin(users):
+    client = TestClient(app)
+    response = client.post("/auth/users/admin/revoke", headers=_headers("alice"))
+    assert response.status_code == 403
+
+
+def test_revoked_user_is_rejected_right_away(users):
+    client = TestClient(app)
+    alice = _headers("alice")
+    assert client.get("/auth/cache/stats", headers=alice).status_code == 200
+
+    # Removed from the secret: the cached directory still knows alice until revoked
+    del users["alice"]
+    assert client.get("/auth/cache/stats", headers=alice).status_code == 200
+    assert client.post("/auth/users/alice/revoke", headers=_headers("admin")).status_code == 200
+
+    assert client.get("/auth/cache/stats", headers=alice).status_code == 401
+    assert token_cache.get(alice["Authorization"].split()[1]) is None
+
+
+def test_background_refresh_survives_any_error():
+    calls = []
+
+    def loader():
+        calls.append(time.monotonic())
+        if len(calls) > 1:
+            raise ValueError("secret is not JSON")
+        return {"alice": {}}
+
+    directory = UserDirectoryCache(loader, ttl=60)
+    assert directory.get_users() == {"alice": {}}
+    directory._refresh_in_background()
+
+    assert directory.get_users() == {"alice": {}}
+    assert directory.stats()["refresh_errors"] == 1
@@ -0,0 +1,34 @@
+import pandas as pd
+from api.cache import ResultCache
+from api.forecasting import run_forecasts
+
+
+def test_unchanged_products_are_served_from_the_cache(sales_frame, fits, tmp_path):
+    cache = ResultCache(memory_max_bytes=64 * 1024 * 1024, disk_dir=str(tmp_path), disk_max_bytes=64 * 1024 * 1024)
+    first = run_forecasts(sales_frame, cache=cache, model_store=None)
+    assert sorted(product for product, _ in fits) == ["SKU0", "SKU1", "SKU2"]
+
+    # Only the edited product is fitted again
+    fits.clear()
+    edited = sales_frame.copy()
+    edited.loc[edited["product_id"] == "SKU1", "quantity"] += 1
+    second = run_forecasts(edited, cache=cache, model_store=None)
+    assert [product for product, _ in fits] == ["SKU1"]
+    unchanged = first["forecast"]["product_id"] != "SKU1"
+    pd.testing.assert_frame_equal(
+        second["forecast"][unchanged].reset_index(drop=True),
+        first["forecast"][unchanged].reset_index(drop=True)
+    )
+    assert cache.stats()["namespaces"]["product"]["memory_hits"] == 2
+
+
+def test_disk_tier_outlives_the_process_cache(sales_frame, fits, tmp_path):
+    run_forecasts(sales_frame, cache=ResultCache(64 * 1024 * 1024, str(tmp_path), 64 * 1024 * 1024), model_store=None)
+    fits.clear()
+
+    restarted = ResultCache(64 * 1024 * 1024, str(tmp_path), 64 * 1024 * 1024)
+    results = run_forecasts(sales_frame, cache=restarted, model_store=None)
+
+    assert fits == []
+    assert len(results["inventory"]) == 3
+    assert restarted.stats()["namespaces"]["product"]["disk_hits"] == 3
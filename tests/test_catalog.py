@@ -0,0 +1,90 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+import pytest
+from api.catalog import READY, UPLOADING, DatasetCatalog
+from api.storage import LocalStorage, ObjectNotFound
+
+
+@pytest.fixture
+def local_storage(tmp_path):
+    return LocalStorage(str(tmp_path))
+
+
+def _record(catalog, key, products=("A",)):
+    return catalog.record(key, 2, products, ["2024-01-01", "2024-01-02"], 10, f"hash-{key}", False)
+
+
+def test_concurrent_catalogs_never_share_a_key(local_storage):
+    # Two API instances with their own view of the catalog reserve keys at the same time
+    catalogs = [DatasetCatalog(local_storage, refresh_seconds=3600) for _ in range(2)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        keys = list(executor.map(lambda i: catalogs[i % 2].allocate_key("2024/01/01"), range(40)))
+
+    assert len(set(keys)) == 40
+    for key in keys:
+        assert json.loads(local_storage.read(f"catalog/datasets/{key}.json"))["status"] == UPLOADING
+
+
+def test_reservation_is_taken_with_put_if_absent(local_storage):
+    first, second = DatasetCatalog(local_storage), DatasetCatalog(local_storage)
+    key = first.allocate_key("2024/01/01")
+
+    # second has not seen the reservation, so its first choice collides and moves on
+    assert not local_storage.put_if_absent(f"catalog/datasets/{key}.json", b"{}")
+    assert second.allocate_key("2024/01/01") == "sales_data/2024/01/01_2.csv"
+
+
+def test_refresh_reads_the_log_without_listing(local_storage, monkeypatch):
+    writer = DatasetCatalog(local_storage, refresh_seconds=0)
+    reader = DatasetCatalog(local_storage, refresh_seconds=0)
+    assert reader.list() == []
+
+    def no_listing(prefix):
+        raise AssertionError(f"listed {prefix}")
+    monkeypatch.setattr(local_storage, "list", no_listing)
+    keys = [writer.allocate_key("2024/01/01") for _ in range(3)]
+    _record(writer, keys[0])
+    _record(writer, keys[2], products=("B",))
+
+    assert [entry["key"] for entry in reader.list()] == [keys[0], keys[2]]
+    assert [entry["key"] for entry in reader.list(product_ids=["B"])] == [keys[2]]
+    assert reader.get(keys[1]) is None
+
+
+def test_fresh_process_loads_index_and_log(local_storage, monkeypatch):
+    monkeypatch.setattr("api.catalog.INDEX_COMPACT_RECORDS", 2)
+    writer = DatasetCatalog(local_storage, refresh_seconds=0)
+    keys = [writer.allocate_key("2024/01/01") for _ in range(3)]
+    for key in keys:
+        _record(writer, key)
+        writer.list()
+
+    index = json.loads(local_storage.read("catalog/index.json"))
+    assert index["position"] >= 2
+    assert [entry["key"] for entry in DatasetCatalog(local_storage).list()] == keys
+
+
+def test_stale_reservations_of_other_instances_expire(local_storage):
+    crashed = DatasetCatalog(local_storage, refresh_seconds=0)
+    stale, fresh = crashed.allocate_key("2024/01/01"), crashed.allocate_key("2024/01/01")
+    entry_key = f"catalog/datasets/{stale}.json"
+    reservation = json.loads(local_storage.read(entry_key))
+    reservation["created_at"] = (datetime.now(timezone.utc) - timedelta(minutes=5)).isoformat()
+    local_storage.put(entry_key, json.dumps(reservation).encode())
+
+    catalog = DatasetCatalog(local_storage, refresh_seconds=0, reservation_timeout=60)
+    own = catalog.allocate_key("2024/01/01")
+    catalog._entries[own]["created_at"] = reservation["created_at"]
+    catalog.list()
+    # No sweep before a full timeout period has passed
+    assert local_storage.head(entry_key)
+
+    catalog._swept_at -= 120
+    catalog.list()
+
+    with pytest.raises(ObjectNotFound):
+        local_storage.head(entry_key)
+    assert local_storage.head(f"catalog/datasets/{fresh}.json")
+    # This instance's own upload is still in progress, however old
+    assert _record(catalog, own)["status"] == READY
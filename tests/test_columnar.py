@@ -0,0 +1,62 @@
+import pandas as pd
+import pyarrow as pa
+import pytest
+from api.columnar import parquet_key, table_to_parquet_bytes
+from api.storage import ObjectNotFound, storage
+
+
+def _get_both_ways(client, key: str, **params) -> tuple:
+    # /data/get with the Parquet copy, then again from the CSV alone
+    with_copy = client.get(f"/data/get/{key}", params=params)
+    assert with_copy.status_code == 200, with_copy.text
+    storage.delete(parquet_key(key))
+    csv_only = client.get(f"/data/get/{key}", params=params)
+    assert csv_only.status_code == 200, csv_only.text
+    return with_copy.json(), csv_only.json()
+
+
+@pytest.mark.parametrize("params", [{}, {"limit": 50}, {"product_id": "SKU1", "start_date": "2024-02-01"}])
+def test_get_returns_same_rows_with_and_without_parquet_copy(client, upload, sales_df, params):
+    sales_df = sales_df.assign(store=["north", "", "007"] * (len(sales_df) // 3) + ["north"] * (len(sales_df) % 3))
+    key = upload(sales_df.to_csv(index=False).encode())
+    assert storage.head(parquet_key(key))["size"]
+
+    with_copy, csv_only = _get_both_ways(client, key, **params)
+
+    assert with_copy == csv_only
+    rows = with_copy["data"] if "limit" in params else with_copy
+    assert list(rows[0]) == ["date", "product_id", "quantity", "store"]
+    assert {row["store"] for row in rows} <= {"north", None, "007"}
+
+
+def test_dates_with_times_are_not_truncated(client, upload):
+    data = b"date,product_id,quantity\n2024-01-02 13:00,A,3\n2024-01-03 09:30,A,4\n"
+    key = upload(data)
+
+    with pytest.raises(ObjectNotFound):
+        storage.head(parquet_key(key))
+    rows = client.get(f"/data/get/{key}").json()
+    assert [row["date"] for row in rows] == ["2024-01-02 13:00", "2024-01-03 09:30"]
+
+
+def test_older_copies_without_extra_columns_fall_back_to_csv(client, store_csv):
+    key = store_csv(b"date,product_id,quantity,store\n2024-01-02,A,3,north\n")
+    storage.put(parquet_key(key), table_to_parquet_bytes(pd.DataFrame({"date": [pd.Timestamp("2024-01-02").date()], "product_id": ["A"], "quantity": [3]})))
+
+    assert client.get(f"/data/get/{key}").json() == [{"date": "2024-01-02", "product_id": "A", "quantity": 3, "store": "north"}]
+    assert client.get(f"/data/get/{key}", params={"columns": ["date", "quantity"]}).json() == [{"date": "2024-01-02", "quantity": 3}]
+
+
+def test_csv_batches_share_one_schema(client, store_csv):
+    # Two batches: the first has only whole quantities, the second one fractional
+    days = pd.date_range("2024-01-01", periods=70000, freq="min").strftime("%Y-%m-%d")
+    quantity = pd.Series([1] * 69999 + [0.5], dtype=object)
+    key = store_csv(pd.DataFrame({"date": days, "product_id": "A", "quantity": quantity}).to_csv(index=False).encode())
+
+    response = client.get(f"/data/get/{key}", params={"format": "arrow"})
+    assert response.status_code == 200
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.num_rows == 70000 and table.schema.field("quantity").type == pa.float64()
+    paged = client.get(f"/data/get/{key}", params={"limit": 100000})
+    assert paged.status_code == 200, paged.text
+    assert paged.json()["data"][-1]["quantity"] == 0.5
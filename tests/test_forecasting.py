@@ -0,0 +1,30 @@
+import pandas as pd
+import api.forecasting
+from api.forecasting import forecast_product, run_forecasts
+
+
+def test_process_pool_matches_sequential(sales_frame):
+    sequential = run_forecasts(sales_frame, execution_mode="sequential", cache=None, model_store=None)
+    pooled = run_forecasts(sales_frame, execution_mode="process", max_workers=2, cache=None, model_store=None)
+
+    pd.testing.assert_frame_equal(pooled["forecast"], sequential["forecast"])
+    pd.testing.assert_frame_equal(pooled["inventory"], sequential["inventory"])
+    assert pooled["skipped_products"] == sequential["skipped_products"] == []
+
+
+def test_process_pool_is_kept_between_runs(sales_frame):
+    run_forecasts(sales_frame, execution_mode="process", max_workers=2, cache=None, model_store=None)
+    pool = api.forecasting._pool
+    run_forecasts(sales_frame, execution_mode="process", max_workers=2, cache=None, model_store=None)
+
+    assert pool is not None and api.forecasting._pool is pool
+
+
+def test_shared_holiday_calendar_matches_country_holidays(sales_frame, monkeypatch):
+    history = sales_frame[sales_frame["product_id"] == "SKU0"].rename(columns={"date": "ds", "quantity": "y"})[["ds", "y"]]
+    shared = forecast_product("SKU0", history)
+    build_model = api.forecasting.build_model
+    monkeypatch.setattr(api.forecasting, "build_model", lambda holidays=None: build_model())
+    per_fit = forecast_product("SKU0", history)
+
+    pd.testing.assert_frame_equal(shared["forecast"], per_fit["forecast"])
@@ -0,0 +1,122 @@
+import hashlib
+import pandas as pd
+import pytest
+from api.catalog import DatasetCatalog
+from api.history import HISTORY_MANIFEST_KEY, SalesHistory
+from api.storage import LocalStorage
+
+
+@pytest.fixture
+def history_env(tmp_path, monkeypatch):
+    monkeypatch.setattr("api.history.HISTORY_COMPACT_FRAGMENTS", 3)
+    monkeypatch.setattr("api.history.HISTORY_COMPACT_RATIO", 100.0)
+    local_storage = LocalStorage(str(tmp_path))
+    catalog = DatasetCatalog(local_storage, refresh_seconds=0)
+
+    def add(rows) -> str:
+        data = pd.DataFrame(rows, columns=["date", "product_id", "quantity"]).to_csv(index=False).encode()
+        key = catalog.allocate_key("2024/01/01")
+        local_storage.put(key, data)
+        catalog.record(key, len(rows), {row[1] for row in rows}, {row[0] for row in rows}, len(data), hashlib.sha256(data).hexdigest(), False)
+        return key
+    return local_storage, catalog, add
+
+
+def _rows(df: pd.DataFrame) -> list:
+    df = df.assign(product_id=df["product_id"].astype(str), date=pd.to_datetime(df["date"]).dt.strftime("%Y-%m-%d"))
+    return sorted(df[["date", "product_id", "quantity"]].itertuples(index=False, name=None))
+
+
+def test_appends_write_fragments_until_compaction(history_env):
+    local_storage, catalog, add = history_env
+    history = SalesHistory(local_storage, catalog)
+    add([("2024-01-01", "A", 1), ("2024-01-01", "A", 2)])
+    first = history.refresh()
+    base = first["base"]
+    assert first["fragments"] == [] and first["rows"] == 1
+
+    add([("2024-01-02", "A", 5)])
+    add([("2024-01-01", "A", 7), ("2024-01-01", "B", 1)])  # Replaces A on 2024-01-01
+    state = history.refresh()
+
+    assert state["base"] == base and len(state["fragments"]) == 2
+    assert local_storage.head(base)["size"] == first["size"]
+    assert _rows(history.read()) == [("2024-01-01", "A", 7.0), ("2024-01-01", "B", 1.0), ("2024-01-02", "A", 5.0)]
+
+    add([("2024-01-03", "B", 4)])
+    compacted = history.refresh()
+    assert compacted["fragments"] == [] and compacted["base"] != base
+    assert compacted["version"] != state["version"]
+    assert _rows(history.read()) == [("2024-01-01", "A", 7.0), ("2024-01-01", "B", 1.0), ("2024-01-02", "A", 5.0), ("2024-01-03", "B", 4.0)]
+
+
+def test_streamed_history_matches_read_with_fragments(history_env):
+    local_storage, catalog, add = history_env
+    history = SalesHistory(local_storage, catalog)
+    add([("2024-01-01", "A", 1), ("2024-01-02", "A", 2), ("2024-01-01", "B", 3)])
+    history.refresh()
+    add([("2024-01-02", "A", 9), ("2024-01-03", "B", 1)])
+    assert history.refresh()["fragments"]
+
+    streamed = pd.concat([table.to_pandas() for table, _ in history.iter_batches()], ignore_index=True)
+    assert _rows(streamed) == _rows(history.read())
+    filtered = pd.concat([table.to_pandas() for table, _ in history.iter_batches(product_ids=["A"])], ignore_index=True)
+    assert _rows(filtered) == _rows(history.read(product_ids=["A"])) == [("2024-01-01", "A", 1.0), ("2024-01-02", "A", 9.0)]
+
+
+def test_instances_share_fragments_and_versions(history_env):
+    local_storage, catalog, add = history_env
+    first, second = SalesHistory(local_storage, catalog), SalesHistory(local_storage, catalog)
+    add([("2024-01-01", "A", 1)])
+    first.refresh()
+    add([("2024-01-02", "A", 2)])
+
+    a, b = first.refresh(), second.refresh()
+
+    assert a["version"] == b["version"] and a["fragments"] == b["fragments"]
+    assert _rows(first.read()) == _rows(second.read())
+
+
+def test_identical_uploads_are_read_once(history_env):
+    local_storage, catalog, add = history_env
+    history = SalesHistory(local_storage, catalog)
+    add([("2024-01-01", "A", 1)])
+    history.refresh()
+    add([("2024-01-01", "A", 1)])
+
+    state = history.refresh()
+    assert len(state["datasets"]) == 2 and state["fragments"] == []
+    assert local_storage.head(HISTORY_MANIFEST_KEY)
+
+
+def test_invalid_rows_are_dropped_from_the_history(history_env):
+    local_storage, catalog, add = history_env
+    history = SalesHistory(local_storage, catalog)
+    add([("2024-01-01", "A", 1)])
+    history.refresh()
+    add([("yesterday", "A", 2), ("2024-01-02", "B", 3)])
+
+    assert history.refresh()["fragments"]
+    assert _rows(history.read()) == [("2024-01-01", "A", 1.0), ("2024-01-02", "B", 3.0)]
+
+
+def test_unreadable_dataset_is_retried_without_failing_the_refresh(history_env, monkeypatch):
+    local_storage, catalog, add = history_env
+    history = SalesHistory(local_storage, catalog)
+    add([("2024-01-01", "A", 1)])
+    history.refresh()
+    broken = add([("2024-01-02", "A", 2)])
+    read_dataset = history._read_dataset
+
+    def flaky(key):
+        if key == broken:
+            raise OSError("connection reset")
+        return read_dataset(key)
+    monkeypatch.setattr(history, "_read_dataset", flaky)
+    state = history.refresh()
+    assert broken not in state["datasets"]
+    assert _rows(history.read()) == [("2024-01-01", "A", 1.0)]
+
+    monkeypatch.setattr(history, "_read_dataset", read_dataset)
+    assert broken in history.refresh()["datasets"]
+    assert _rows(history.read()) == [("2024-01-01", "A", 1.0), ("2024-01-02", "A", 2.0)]
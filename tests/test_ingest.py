@@ -0,0 +1,67 @@
+import pytest
+from api.catalog import dataset_catalog
+from api.columnar import parquet_key
+from api.ingest import CsvValidationError, StreamingCsvValidator
+from api.storage import storage
+
+QUOTED = (
+    b'date,product_id,quantity,note\n'
+    b'2024-01-01,A,1,"two\nlines, one field"\n'
+    b'2024-01-02, B ,2,plain\n'
+    b'2024-01-03,A,3,"escaped ""quotes""\nand a break"\n'
+)
+
+
+def _validate(data: bytes, chunk_size: int) -> tuple:
+    validator = StreamingCsvValidator()
+    lines = b"".join(validator.feed(data[i:i + chunk_size]) for i in range(0, len(data), chunk_size))
+    return validator, lines + validator.finish()
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 16, 33, len(QUOTED)])
+def test_quoted_line_breaks_survive_any_chunk_boundary(chunk_size):
+    validator, lines = _validate(QUOTED, chunk_size)
+
+    assert validator.rows == 3
+    assert validator.products == {"A", "B"}
+    assert lines == QUOTED
+
+
+def test_errors_report_the_line_a_record_ends_on():
+    data = b'date,product_id,quantity\n2024-01-01,"A\nB",1\n2024-01-02,A,x\n'
+    with pytest.raises(CsvValidationError, match="line 4"):
+        _validate(data, 8)
+
+
+def test_product_ids_are_stripped_in_catalog_and_copy(client, upload):
+    key = upload(b"date,product_id,quantity\n2024-01-01, A ,1\n2024-01-02,A,2\n")
+
+    assert dataset_catalog.get(key)["products"] == ["A"]
+    with_copy = client.get(f"/data/get/{key}", params={"product_id": "A"}).json()
+    storage.delete(parquet_key(key))
+    csv_only = client.get(f"/data/get/{key}", params={"product_id": "A"}).json()
+    assert with_copy == csv_only == [
+        {"date": "2024-01-01", "product_id": "A", "quantity": 1},
+        {"date": "2024-01-02", "product_id": "A", "quantity": 2}
+    ]
+
+
+def test_quoted_line_breaks_keep_the_parquet_copy(client, upload):
+    key = upload(QUOTED)
+
+    assert storage.head(parquet_key(key))["size"]
+    rows = client.get(f"/data/get/{key}").json()
+    assert [row["note"] for row in rows] == ["two\nlines, one field", "plain", 'escaped "quotes"\nand a break']
+    assert [row["product_id"] for row in rows] == ["A", "B", "A"]
+
+
+def test_padded_header_names_match_the_parquet_copy(client, upload):
+    key = upload(b"date, product_id ,quantity\n2024-01-01,A,1\n2024-01-02,A,2\n")
+    with_copy = client.get(f"/data/get/{key}").json()
+    storage.delete(parquet_key(key))
+    csv_only = client.get(f"/data/get/{key}").json()
+
+    assert with_copy == csv_only == [
+        {"date": "2024-01-01", "product_id": "A", "quantity": 1},
+        {"date": "2024-01-02", "product_id": "A", "quantity": 2}
+    ]
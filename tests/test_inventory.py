@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+from api.fast_forecast import INTERVAL_Z
+from api.inventory import optimize_inventory
+
+LAST_DATE = pd.Timestamp("2024-01-31")
+
+
+@pytest.fixture
+def forecast_df():
+    """Thirty future days for three products with growing demand and spread."""
+    rng = np.random.default_rng(3)
+    days = pd.date_range(LAST_DATE + pd.Timedelta(days=1), periods=30)
+    frames = []
+    for product, level, spread in [("A", 20.0, 4.0), ("B", 50.0, 12.0), ("C", 8.0, 1.5)]:
+        yhat = level + rng.uniform(-2, 2, len(days)) + np.arange(len(days)) * 0.1
+        sigma = np.full(len(days), spread)
+        frames.append(pd.DataFrame({
+            "ds": days,
+            "yhat": yhat,
+            "yhat_lower": yhat - INTERVAL_Z * sigma,
+            "yhat_upper": yhat + INTERVAL_Z * sigma,
+            "product_id": product
+        }))
+    return pd.concat(frames, ignore_index=True)
+
+
+@pytest.mark.parametrize("lead_time_std_days", [0.0, 2.0])
+def test_monte_carlo_agrees_with_closed_form(forecast_df, lead_time_std_days):
+    policy = pd.DataFrame({"product_id": ["A", "B", "C"], "lead_time_std_days": lead_time_std_days})
+    closed = optimize_inventory(forecast_df, last_date=LAST_DATE, policy=policy)
+    simulated = optimize_inventory(forecast_df, last_date=LAST_DATE, policy=policy, simulations=20000, seed=1)
+
+    pd.testing.assert_series_equal(simulated["product_id"], closed["product_id"])
+    for column in ["lead_time_demand", "reorder_point", "demand_std"]:
+        np.testing.assert_allclose(simulated[column], closed[column], rtol=0.05, err_msg=column)
+    np.testing.assert_allclose(simulated["safety_stock"], closed["safety_stock"], rtol=0.1, atol=1.0)
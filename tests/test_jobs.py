@@ -0,0 +1,22 @@
+from api.jobs import FINISHED_STATES, job_manager
+
+
+def _wait(job_id: str):
+    job = job_manager.get(job_id)
+    job.future.result(timeout=60)
+    assert job.state in FINISHED_STATES
+    return job
+
+
+def test_finished_jobs_do_not_keep_the_forecast_frame(client, upload, sales_df):
+    key = upload(sales_df.to_csv(index=False).encode())
+
+    response = client.post("/data/forecast/jobs", json={"filename": key, "engine": "fast", "use_cache": False})
+    assert response.status_code == 202, response.text
+    job = _wait(response.json()["job_id"])
+    assert job.result["forecast_s3_path"] and "forecast" not in job.result
+
+    inline = client.get(f"/data/forecast/{key}", params={"engine": "fast", "use_cache": False})
+    assert inline.status_code == 200 and len(inline.json()["forecast"])
+    sync_job = list(job_manager._jobs.values())[-1]
+    assert "forecast" not in sync_job.result
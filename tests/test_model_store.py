@@ -0,0 +1,35 @@
+import pandas as pd
+from api.forecasting import run_forecasts
+from api.model_store import ModelStore
+
+
+def test_unchanged_history_reuses_the_stored_forecast(sales_frame, fits, tmp_path):
+    store = ModelStore(str(tmp_path))
+    first = run_forecasts(sales_frame, cache=None, model_store=store)
+    assert store.stats()["cold"] == 3
+
+    fits.clear()
+    second = run_forecasts(sales_frame, cache=None, model_store=store)
+    assert fits == []
+    assert store.stats()["reuse"] == 3
+    pd.testing.assert_frame_equal(second["forecast"], first["forecast"])
+
+
+def test_appended_rows_warm_start_only_that_product(sales_frame, fits, tmp_path):
+    store = ModelStore(str(tmp_path))
+    run_forecasts(sales_frame, cache=None, model_store=store)
+
+    fits.clear()
+    last = sales_frame["date"].max()
+    appended = pd.DataFrame({
+        "date": pd.date_range(last + pd.Timedelta(days=1), periods=3),
+        "product_id": "SKU0",
+        "quantity": 5
+    })
+    grown = pd.concat([sales_frame.astype({"product_id": str}), appended], ignore_index=True)
+    results = run_forecasts(grown, cache=None, model_store=store)
+
+    assert fits == [("SKU0", True)]
+    assert store.stats()["warm"] == 1
+    assert store.stats()["reuse"] == 2
+    assert len(results["inventory"]) == 3
@@ -0,0 +1,52 @@
+import pandas as pd
+import pytest
+from api.columnar import iter_sales_batches, read_sales_frame
+from api.forecasting import run_forecasts
+from api.outofcore import SpooledOutput, run_forecasts_out_of_core
+from api.storage import storage
+from utils.preprocess import REQUIRED_COLUMNS, prepare_sales_frame
+
+
+def _forecast_both_ways(key: str, **options):
+    df, errors = prepare_sales_frame(read_sales_frame(storage, key, columns=REQUIRED_COLUMNS))
+    assert not errors
+    in_memory = run_forecasts(df, **options)
+    output = SpooledOutput()
+    try:
+        out_of_core = run_forecasts_out_of_core(iter_sales_batches(storage, key, REQUIRED_COLUMNS), output, **options)
+    finally:
+        output.close()
+    return in_memory, out_of_core
+
+
+def _by_product(inventory: pd.DataFrame) -> pd.DataFrame:
+    inventory = inventory.assign(product_id=inventory["product_id"].astype(str))
+    return inventory.sort_values("product_id").reset_index(drop=True)
+
+
+@pytest.mark.parametrize("engine,stored_as", [("fast", "store_csv"), ("fast", "upload"), ("prophet", "upload")])
+def test_out_of_core_matches_in_memory_with_duplicate_rows(engine, stored_as, sales_df, request):
+    if engine == "prophet":
+        sales_df = sales_df[sales_df["product_id"].isin(["SKU0", "SKU1"])]
+    # Every sale of the first 20 days is recorded twice; both paths must sum them
+    duplicates = sales_df[pd.to_datetime(sales_df["date"]) < pd.Timestamp("2024-01-21")]
+    data = pd.concat([sales_df, duplicates], ignore_index=True)
+    # upload also writes the Parquet copy; store_csv leaves only the CSV
+    key = request.getfixturevalue(stored_as)(data.to_csv(index=False).encode())
+
+    in_memory, out_of_core = _forecast_both_ways(key, engine=engine, cache=None, model_store=None)
+
+    assert out_of_core["forecast_rows"] == len(in_memory["forecast"])
+    pd.testing.assert_frame_equal(_by_product(out_of_core["inventory"]), _by_product(in_memory["inventory"]))
+
+
+def test_hybrid_picks_the_top_products_of_the_whole_input(sales_df, upload, fits):
+    key = upload(sales_df.to_csv(index=False).encode())
+
+    top = sales_df.groupby("product_id")["quantity"].sum().nlargest(2).index.tolist()
+
+    in_memory, out_of_core = _forecast_both_ways(key, engine="hybrid", top_n=2, cache=None, model_store=None)
+
+    # Each run fits only the overall top two with Prophet
+    assert sorted(product for product, _ in fits) == sorted(top * 2)
+    pd.testing.assert_frame_equal(_by_product(out_of_core["inventory"]), _by_product(in_memory["inventory"]))
@@ -1,13 +1,207 @@
+import csv
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+
+# Sales schema
+REQUIRED_COLUMNS = ["date", "product_id", "quantity"]
+DATE_FORMAT = "%Y-%m-%d"
+MAX_REPORTED_ERRORS = 100  # Errors listed individually; the rest are only counted
+
+def _error(message: str, row: int = None, column: str = None, value=None) -> dict:
+    return {"row": row, "column": column, "value": value, "message": message}
+
+def _convert_options(column_names, date_format: str, parse_dates: bool) -> pa_csv.ConvertOptions:
+    column_types = {
+        "date": pa.timestamp("s") if parse_dates else pa.string(),
+        "product_id": pa.dictionary(pa.int32(), pa.string()),
+        "quantity": pa.float64()
+    }
+    return pa_csv.ConvertOptions(
+        column_types=column_types,
+        timestamp_parsers=[date_format],
+        include_columns=[col for col in column_names if col in REQUIRED_COLUMNS] if column_names else REQUIRED_COLUMNS,
+        strings_can_be_null=False
+    )
+
+def _read_options(column_names, has_header: bool) -> pa_csv.ReadOptions:
+    # The header line is replaced by its stripped names, as upload validation reads them
+    return pa_csv.ReadOptions(column_names=list(column_names), skip_rows=1 if has_header else 0)
+
+def _parse_dates(values: pd.Series, date_format: str = DATE_FORMAT) -> pd.Series:
+    # The known format parses fast; only values that do not match it go through the flexible parser
+    dates = pd.to_datetime(values, format=date_format, errors="coerce")
+    retry = dates.isna() & values.notna()
+    if retry.any():
+        dates[retry] = pd.to_datetime(values[retry], format="mixed", errors="coerce")
+    return dates
+
+def _header(data: bytes) -> list:
+    line = data.split(b"\n", 1)[0].decode("utf-8-sig").strip()
+    return [col.strip() for col in next(csv.reader([line]))] if line else []
+
+def _checked_table(data: bytes, read_options: pa_csv.ReadOptions, date_format: str, parse_dates: bool) -> tuple:
+    # Slow path: read the required columns as text and report every bad value by row
+    text_types = {col: pa.string() for col in REQUIRED_COLUMNS}
+    table = pa_csv.read_csv(
+        pa.py_buffer(data),
+        read_options=read_options,
+        convert_options=pa_csv.ConvertOptions(column_types=text_types, include_columns=REQUIRED_COLUMNS, strings_can_be_null=True)
+    )
+    errors = []
+    bad = np.zeros(table.num_rows, dtype=bool)
+
+    def report(mask: np.ndarray, column: str, message: str):
+        values = table[column].to_numpy(zero_copy_only=False)
+        for row in np.flatnonzero(mask & ~bad):
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append(_error(message, row=int(row) + 1, column=column, value=values[row]))
+        bad[mask] = True
+
+    for column in REQUIRED_COLUMNS:
+        report(table[column].is_null().to_numpy(zero_copy_only=False), column, f"missing {column}")
+    quantity = pd.to_numeric(pd.Series(table["quantity"].to_numpy(zero_copy_only=False)), errors="coerce")
+    report(quantity.isna().to_numpy() & ~bad, "quantity", "quantity is not a number")
+    columns = {"product_id": pc.dictionary_encode(table["product_id"])}
+    if parse_dates:
+        dates = _parse_dates(pd.Series(table["date"].to_numpy(zero_copy_only=False)), date_format)
+        report(dates.isna().to_numpy() & ~bad, "date", "date is not a valid date")
+        columns["date"] = pa.array(dates.to_numpy(), pa.timestamp("ns"))
+    else:
+        columns["date"] = table["date"]
+    columns["quantity"] = pa.array(quantity.to_numpy(), pa.float64())
+    keep = pa.array(~bad)
+    checked = pa.table({col: columns[col] for col in REQUIRED_COLUMNS}).filter(keep)
+    errors.sort(key=lambda error: error["row"])
+    if bad.sum() > len(errors):
+        errors.append(_error(f"{int(bad.sum()) - len(errors)} more invalid rows"))
+    return checked, errors
+
+def parse_sales_csv(data: bytes, column_names=None, date_format: str = DATE_FORMAT, parse_dates: bool = True) -> tuple:
+    """Parse CSV bytes into a typed Arrow table of the required columns.
+
+    Uses the multithreaded pyarrow CSV reader with explicit types: dates in
+    date_format, product_id dictionary encoded and quantity as float64.
+    column_names is given when data has no header line (e.g. a chunk of a
+    streamed file); names in a header line are stripped of surrounding
+    whitespace. Rows with a missing or malformed value are dropped and
+    reported in the returned error list as {row, column, value, message},
+    with row counting data rows from 1. Returns (table, errors); table is
+    None when required columns are missing.
+    """
+    header = list(column_names) if column_names else _header(data)
+    missing_cols = [col for col in REQUIRED_COLUMNS if col not in header]
+    if missing_cols:
+        return None, [_error(f"CSV must contain columns: {', '.join(REQUIRED_COLUMNS)}", column=col) for col in missing_cols]
+    read_options = _read_options(header, has_header=not column_names)
+    try:
+        table = pa_csv.read_csv(
+            pa.py_buffer(data),
+            read_options=read_options,
+            convert_options=_convert_options(header, date_format, parse_dates)
+        )
+        if not any(table[col].null_count for col in REQUIRED_COLUMNS):
+            return table.select(REQUIRED_COLUMNS), []
+    except pa.ArrowInvalid as e:
+        if "conversion error" not in str(e):
+            return None, [_error(f"Invalid CSV format: {str(e)}")]
+    return _checked_table(data, read_options, date_format, parse_dates)
+
+def _needs_strip(values: pa.Array) -> bool:
+    return bool(pc.any(pc.not_equal(pc.utf8_trim_whitespace(values), values)).as_py())
+
+def strip_product_ids(products):
+    """Arrow product IDs without surrounding whitespace, as the upload catalog records them.
+
+    Takes a string or dictionary (chunked) array and returns the same type;
+    IDs that need no stripping are returned as they are.
+    """
+    if pa.types.is_dictionary(products.type):
+        chunks = products.chunks if isinstance(products, pa.ChunkedArray) else [products]
+        if not any(_needs_strip(chunk.dictionary) for chunk in chunks):
+            return products
+        return pc.dictionary_encode(pc.utf8_trim_whitespace(pc.cast(products, pa.string())))
+    return pc.utf8_trim_whitespace(products)
+
+def aggregate_sales(df: pd.DataFrame) -> pd.DataFrame:
+    """Sum duplicate (date, product_id) rows, keeping products in first-appearance order."""
+    return df.groupby(["date", "product_id"], sort=False, observed=True, as_index=False)["quantity"].sum()
+
+def _downcast_quantity(quantity: pd.Series) -> pd.Series:
+    values = quantity.to_numpy()
+    if len(values) and np.isfinite(values).all() and (values == np.round(values)).all():
+        int32 = np.iinfo(np.int32)
+        return quantity.astype("int32" if int32.min <= values.min() and values.max() <= int32.max else "int64")
+    return quantity.astype("float64")
+
+def to_sales_frame(table: pa.Table, aggregate: bool = True) -> pd.DataFrame:
+    """Compact pandas frame: datetime64 dates, categorical (stripped) product_id, downcast quantities."""
+    df = pd.DataFrame({
+        "date": pd.Series(table["date"].to_numpy(zero_copy_only=False)).astype("datetime64[ns]"),
+        "product_id": strip_product_ids(table["product_id"]).to_pandas().astype("category"),
+        "quantity": table["quantity"].to_numpy(zero_copy_only=False)
+    })
+    if aggregate:
+        df = aggregate_sales(df)
+        df["product_id"] = df["product_id"].cat.remove_unused_categories()
+    df["quantity"] = _downcast_quantity(df["quantity"])
+    return df
+
+def prepare_sales_frame(df: pd.DataFrame, aggregate: bool = True) -> tuple:
+    """Validate an already-loaded sales frame and bring it to the compact types.
+
+    Returns (frame, errors) like read_sales_data; rows with missing or
+    malformed values are dropped and reported.
+    """
+    missing_cols = [col for col in REQUIRED_COLUMNS if col not in df.columns]
+    if missing_cols:
+        return None, [_error(f"CSV must contain columns: {', '.join(REQUIRED_COLUMNS)}", column=col) for col in missing_cols]
+    dates = df["date"] if pd.api.types.is_datetime64_any_dtype(df["date"]) else _parse_dates(df["date"])
+    quantity = pd.to_numeric(df["quantity"], errors="coerce")
+    invalid = {"date": dates.isna().to_numpy(), "quantity": quantity.isna().to_numpy(), "product_id": df["product_id"].isna().to_numpy()}
+    errors = []
+    for column, mask in invalid.items():
+        for row in np.flatnonzero(mask)[:MAX_REPORTED_ERRORS - len(errors)]:
+            value = df[column].iloc[row]
+            errors.append(_error(f"{column} is missing or invalid", row=int(row) + 1, column=column, value=None if pd.isna(value) else str(value)))
+    bad = invalid["date"] | invalid["quantity"] | invalid["product_id"]
+    errors.sort(key=lambda error: error["row"])
+    if bad.sum() > len(errors):
+        errors.append(_error(f"{int(bad.sum()) - len(errors)} more invalid rows"))
+    products = df["product_id"][~bad]
+    if not isinstance(products.dtype, pd.CategoricalDtype):
+        products = products.astype(str)
+    table = pa.table({
+        "date": pa.array(dates[~bad].to_numpy().astype("datetime64[ns]")),
+        "product_id": pa.array(products.astype("category")).cast(pa.dictionary(pa.int32(), pa.string())),
+        "quantity": pa.array(quantity[~bad].to_numpy(dtype="float64"))
+    })
+    return to_sales_frame(table, aggregate), errors
+
+def read_sales_data(source, aggregate: bool = True, date_format: str = DATE_FORMAT) -> dict:
+    """Read a sales CSV (bytes, path or file object) into a validated, compact frame.
+
+    Returns {"data", "errors", "rows", "duplicates"}: the frame (None when
+    required columns are missing), the structured errors, the number of
+    valid rows read and how many duplicate (date, product_id) rows were
+    summed into others.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        data = bytes(source)
+    elif isinstance(source, str):
+        with open(source, "rb") as f:
+            data = f.read()
+    else:
+        data = source.read()
+    table, errors = parse_sales_csv(data, date_format=date_format)
+    if table is None:
+        return {"data": None, "errors": errors, "rows": 0, "duplicates": 0}
+    df = to_sales_frame(table, aggregate)
+    return {"data": df, "errors": errors, "rows": table.num_rows, "duplicates": table.num_rows - len(df)}
 
 def validate_sales_data(df: pd.DataFrame) -> bool:
     """Validate sales DataFrame for required columns and data types."""
-    required_columns = ["date", "product_id", "quantity"]
-    if not all(col in df.columns for col in required_columns):
-        return False
-    try:
-        df["date"] = pd.to_datetime(df["date"])
-        df["quantity"] = pd.to_numeric(df["quantity"])
-        return True
-    except Exception:
-        return False
\ No newline at end of file
+    frame, errors = prepare_sales_frame(df, aggregate=False)
+    return frame is not None and not errors
@@ -0,0 +1,85 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+def generate_sales_data(
+    skus: int = 100,
+    days: int = 365,
+    start_date: str = "2024-01-01",
+    weekly_amplitude: float = 0.3,
+    yearly_amplitude: float = 0.2,
+    trend: float = 0.0,
+    intermittent_share: float = 0.2,
+    demand_probability: float = 0.25,
+    missing_rows: float = 0.0,
+    seed: int = 0
+) -> pd.DataFrame:
+    """Generate synthetic daily sales with the date, product_id, quantity columns.
+
+    Each SKU gets a base demand level with weekly and yearly seasonality and
+    an optional linear trend (relative change per year), sampled as Poisson
+    counts. intermittent_share of the SKUs only sell on a demand_probability
+    fraction of days, and missing_rows drops that fraction of rows at random
+    (days with no record at all). The same seed always gives the same data.
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start_date, periods=days, freq="D")
+    t = np.arange(days)
+
+    level = rng.lognormal(mean=2.5, sigma=1.0, size=skus)[:, None]
+    weekly_phase = rng.uniform(0, 2 * np.pi, size=skus)[:, None]
+    yearly_phase = rng.uniform(0, 2 * np.pi, size=skus)[:, None]
+    season = (
+        1
+        + weekly_amplitude * np.sin(2 * np.pi * t / 7 + weekly_phase)
+        + yearly_amplitude * np.sin(2 * np.pi * t / 365.25 + yearly_phase)
+    )
+    rate = np.clip(level * season * (1 + trend * t / 365.25), 0, None)
+
+    # Intermittent SKUs sell on few days, with a larger order when they do
+    intermittent = rng.random(skus) < intermittent_share
+    sells = rng.random((skus, days)) < demand_probability
+    rate = np.where(intermittent[:, None], np.where(sells, rate / demand_probability, 0.0), rate)
+    quantity = rng.poisson(rate)
+
+    keep = rng.random((skus, days)) >= missing_rows
+    sku_index, day_index = np.nonzero(keep)
+    width = len(str(skus))
+    product_ids = np.array([f"SKU{i:0{width}d}" for i in range(skus)])
+    return pd.DataFrame({
+        "date": dates[day_index].strftime("%Y-%m-%d"),
+        "product_id": product_ids[sku_index],
+        "quantity": quantity[sku_index, day_index]
+    }).sort_values(["date", "product_id"], kind="stable").reset_index(drop=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic StockIQ sales CSV")
+    parser.add_argument("--skus", type=int, default=100)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--start-date", default="2024-01-01")
+    parser.add_argument("--weekly-amplitude", type=float, default=0.3)
+    parser.add_argument("--yearly-amplitude", type=float, default=0.2)
+    parser.add_argument("--trend", type=float, default=0.0)
+    parser.add_argument("--intermittent-share", type=float, default=0.2)
+    parser.add_argument("--demand-probability", type=float, default=0.25)
+    parser.add_argument("--missing-rows", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="sales.csv")
+    args = parser.parse_args()
+    df = generate_sales_data(
+        skus=args.skus,
+        days=args.days,
+        start_date=args.start_date,
+        weekly_amplitude=args.weekly_amplitude,
+        yearly_amplitude=args.yearly_amplitude,
+        trend=args.trend,
+        intermittent_share=args.intermittent_share,
+        demand_probability=args.demand_probability,
+        missing_rows=args.missing_rows,
+        seed=args.seed
+    )
+    df.to_csv(args.output, index=False)
+    print(f"Wrote {len(df)} rows to {args.output}")
+
+if __name__ == "__main__":
+    main()